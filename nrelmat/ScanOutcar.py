@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
-import datetime, os, re, sys
+import array, datetime, mmap, os, re, sys
 import numpy as np
+import phaseProfile
+import resRecord
 
 
 #====================================================================
@@ -11,6 +13,7 @@ def badparms( msg):
   print 'Parms:'
   print '  -bugLev    <int>      debug level'
   print '  -inDir     <string>   input dir containing OUTCAR, INCAR, POSCAR'
+  print '  -readMode  <string>   mmap (default) / stream'
   print ''
   sys.exit(1)
 
@@ -27,11 +30,15 @@ def main():
   ================  =========    ==============================================
   **-bugLev**       integer      Debug level.  Normally 0.
   **-inDir**       s tring       Input dir containing OUTCAR, INCAR, POSCAR
+  **-readMode**     string       'mmap' (the default): map the whole OUTCAR.
+                                 'stream': keep only the header and the
+                                 last ionic step.  See readStreamLines.
   ================  =========    ==============================================
   '''
 
   bugLev = 0
   inDir = None
+  readMode = 'mmap'
 
   if len(sys.argv) % 2 != 1:
     badparms('Parms must be key/value pairs')
@@ -40,38 +47,94 @@ def main():
     val = sys.argv[iarg+1]
     if key == '-bugLev': bugLev = int( val)
     elif key == '-inDir': inDir = val
+    elif key == '-readMode': readMode = val
     else: badparms('unknown key: "%s"' % (key,))
 
   if bugLev == None: badparms('parm not specified: -bugLev')
   if inDir == None: badparms('parm not specified: -inDir')
 
   resObj = ResClass()
-  scanner = ScanOutcar( bugLev, inDir, resObj)
+  scanner = ScanOutcar( bugLev, inDir, resObj, readMode=readMode)
 
 
 #====================================================================
 #====================================================================
 
-class ResClass:
-  '''
-  An empty class used as a data container for parseDir results.
+# The data container for results.  See resRecord.ResClass.
+# The INCAR tags, like ALGO, are kept in its incarTags map.
 
-  The parseDir function will call either parsePylada or parseXml,
-  and they will save the VASP results as attributes of
-  an instance of ResClass.
-  '''
+ResClass = resRecord.ResClass
 
-  def __str__(self):
-    keys = self.__dict__.keys()
-    keys.sort()
-    msg = ''
-    for key in keys:
-      val = self.__dict__[key]
-      stg = str( val)
-      if stg.find('\n') >= 0: sep = '\n'
-      else: sep = ' '
-      msg += '  %s:  type: %s  val:%s%s\n' % (key, type(val), sep, val,)
-    return msg
+#====================================================================
+#====================================================================
+
+# Literal line prefixes recorded by ScanOutcar.buildIndex.
+# The index holds, for each prefix, the numbers of the stripped
+# lines starting with it, so findLines only needs to examine
+# those lines instead of rescanning the whole OUTCAR.
+# A pattern whose literal prefix is not covered here
+# falls back to a full scan.
+
+anchorPrefixes = [
+  'ALGO',
+  'E-fermi',
+  'EDIFF',
+  'ENCUT',
+  'Elapsed time',
+  'FORCE on cell',
+  'Following',
+  'Found',
+  'IALGO',
+  'IBRION',
+  'ICHARG',
+  'ISIF',
+  'ISPIN',
+  'LOOP+',
+  'NELECT',
+  'POMASS',
+  'POSITION',
+  'SYSTEM',
+  'System time',
+  'TITEL',
+  'Total CPU time',
+  'User time',
+  'VRHFIN',
+  'band No',
+  'direct lattice vectors',
+  'energy',
+  'executed on',
+  'ions per type',
+  'k-point',
+  'k-points',
+  'position of ions',
+  'spin component',
+  'volume of cell',
+]
+
+#====================================================================
+
+# Returns the literal text that every line matching the
+# regex pattern pat must start with, or '' if there is none.
+#   literalPrefix( r'^FORCE on cell *= *-STRESS')  ==  'FORCE on cell'
+#   literalPrefix( r'^LOOP\+ *: +')               ==  'LOOP+'
+
+def literalPrefix( pat):
+  if not pat.startswith('^') or pat.find('|') >= 0: return ''
+  res = ''
+  ii = 1
+  while ii < len( pat):
+    cc = pat[ii]
+    if cc == '\\':
+      if ii + 1 >= len( pat) or pat[ii+1].isalnum(): break  # \d, \s, ...
+      cc = pat[ii+1]
+      ii += 2
+    elif cc in '.^$*+?{}[]()':
+      break
+    else: ii += 1
+    if ii < len( pat) and pat[ii] in '*+?{':
+      break              # the quantifier applies to cc: omit it
+    res += cc
+  return res
 
 #====================================================================
 #====================================================================
@@ -106,47 +169,383 @@ class Sspec:
 #====================================================================
 #====================================================================
 
+# Read-only sequence of the stripped lines of a file.
+# The file is memory mapped, and a line is sliced out of the
+# map and stripped only when it is requested, so we don't
+# hold a copy of the file.
+#
+# The table of line start offsets is built on first use,
+# a chunk of the map at a time, so the peak memory is about
+# 8 bytes per line plus one chunk.
+# Like readlines, a final newline does not start a new line.
+
+class MmapLines:
+
+  chunkLen = 1 << 20           # bytes scanned per chunk for newlines
+  iterLen = 1 << 14            # lines sliced per block by __iter__
+
+  def __init__( self, fname):
+    self.fname = fname
+    self.fin = open( fname, 'rb')
+    self.fileLen = os.fstat( self.fin.fileno()).st_size
+    if self.fileLen == 0: self.mmap = None     # cannot map an empty file
+    else: self.mmap = mmap.mmap(
+      self.fin.fileno(), 0, access=mmap.ACCESS_READ)
+    self.offsets = None        # line start offsets, then fileLen
+
+  def buildOffsets( self):
+    parts = []
+    if self.fileLen > 0: parts.append( np.zeros( [1], dtype=np.int64))
+    for beg in range( 0, self.fileLen, self.chunkLen):
+      end = min( beg + self.chunkLen, self.fileLen)
+      buf = np.frombuffer( self.mmap, dtype=np.uint8,
+        count=end-beg, offset=beg)
+      parts.append( beg + 1 + np.flatnonzero( buf == ord('\n')))
+      del buf
+    if len( parts) == 0: starts = np.zeros( [0], dtype=np.int64)
+    else: starts = np.concatenate( parts)
+    if len( starts) > 0 and starts[-1] == self.fileLen:
+      starts = starts[:-1]     # the final newline does not start a line
+
+    # An array.array indexes to plain ints, much faster than numpy.
+    self.offsets = array.array('l')
+    self.offsets.fromstring( starts.astype( np.int64).tostring())
+    self.offsets.append( self.fileLen)
+
+  def __len__( self):
+    if self.offsets == None: self.buildOffsets()
+    return len( self.offsets) - 1
+
+  def __getitem__( self, ix):
+    if self.offsets == None: self.buildOffsets()
+    numLine = len( self.offsets) - 1
+    if ix < 0: ix += numLine
+    if ix < 0 or ix >= numLine:
+      raise IndexError('MmapLines index out of range: %d' % (ix,))
+    return self.mmap[ self.offsets[ix] : self.offsets[ix+1]].strip()
+
+  # Iterating slices a block of lines at a time, which
+  # avoids a __getitem__ call per line.
+
+  def __iter__( self):
+    numLine = len( self)
+    for beg in range( 0, numLine, self.iterLen):
+      end = min( beg + self.iterLen, numLine)
+      block = self.mmap[ self.offsets[beg] : self.offsets[end]].split('\n')
+      for ii in range( end - beg):
+        yield block[ii].strip()
+
+  # Returns the raw text of lines beg through end-1,
+  # newlines included.
+
+  def getText( self, beg, end):
+    len( self)                 # insure offsets
+    return self.mmap[ self.offsets[beg] : self.offsets[end]]
+
+  def close( self):
+    if self.mmap != None: self.mmap.close()
+    self.fin.close()
+    self.mmap = None
+
+#====================================================================
+
+# Start of an ionic step: the first electronic iteration.
+#   --------------------------------------- Iteration      2(   1)  ----...
+stepStartRegex = re.compile( r'^-+ *Iteration +\d+\( *1\) *-+$')
+
+# Returns a list of the stripped lines of an OUTCAR, reading it
+# once from the front but keeping only:
+#   the header: all lines before the first ionic step,
+#   the LOOP+ lines of all ionic steps, for getTimes,
+#   the last ionic step, through the end of the file.
+# If the last ionic step is incomplete (has no LOOP+ line),
+# as in a killed run, we also keep the step before it,
+# so the "last" sections come from the last complete step,
+# just as when scanning all lines.
+#
+# So memory is bounded by two ionic steps rather than the
+# whole trajectory.  The line numbers in error messages
+# are numbers in the returned list, not in the file.
+
+def readStreamLines( fname):
+  header = None            # lines before the first ionic step
+  kept = []                # LOOP+ lines of dropped steps
+  prevStep = None          # previous ionic step
+  curStep = []             # current ionic step, or header
+  curComplete = False      # curStep has a LOOP+ line
+
+  with open( fname) as fin:
+    for line in fin:
+      line = line.strip()
+      if line.startswith('-') and stepStartRegex.match( line):
+        if header == None: header = curStep
+        else:
+          if prevStep != None:
+            kept += [tline for tline in prevStep if tline.startswith('LOOP+')]
+          if curComplete: prevStep = curStep
+          else:                    # keep the last complete step
+            kept += [tline for tline in curStep if tline.startswith('LOOP+')]
+        curStep = []
+        curComplete = False
+      elif line.startswith('LOOP+'): curComplete = True
+      curStep.append( line)
+
+  if header == None: return curStep      # no ionic steps
+  if prevStep != None and curComplete:
+    kept += [tline for tline in prevStep if tline.startswith('LOOP+')]
+    prevStep = None
+  if prevStep == None: prevStep = []
+  return header + kept + prevStep + curStep
+
+#====================================================================
+
+# The scalars found by ScanOutcar.getScalars.
+
+#   k-points           NKPTS =    260   k-points in BZ     NKDIM =    260   number of bands    NBANDS=     11
+nkpointPat = r'^k-points +NKPTS *= *(\d+) +k-points in BZ' \
+  + r' +NKDIM *= *\d+ +number of bands +NBANDS *= *\d+$'
+nbandPat   = r'^k-points +NKPTS *= *\d+ +k-points in BZ' \
+  + r' +NKDIM *= *\d+ +number of bands +NBANDS *= *(\d+)$'
+scalarSpecs = [
+  # EDIFF  = 0.6E-04   stopping-criterion for ELM
+  Sspec( 'ediff', r'^EDIFF *= *([-.E0-9]+) *stopping-criterion.*$',
+    'first', 1, 1, float),
+  # ENCUT  =  340.0 eV  24.99 Ry    5.00 a.u. 4.51 4.51  4.51*2*pi/ulx,y,z
+  Sspec( 'encut_ev', r'^ENCUT *= *([-.E0-9]+) eV .*$',
+    'first', 1, 1, float),
+  # IALGO  =     68    algorithm
+  Sspec( 'ialgo', r'^IALGO *= *(\d+) +algorithm$',
+    'first', 1, 1, int),
+  # ALGO = Fast
+  # ALGO    =GW        execute GW part
+  Sspec( 'algo', r'^ALGO *= *([a-zA-Z0-9]+).*$',
+    'first', 0, 1, str),
+  # IBRION =      2    ionic relax: 0-MD 1-quasi-New 2-CG
+  Sspec( 'ibrion', r'^IBRION *= *([-0-9]+) +ionic relax *: .*$',
+    'first', 1, 1, int),
+  # ICHARG =      0    charge: 1-file 2-atom 10-const
+  Sspec( 'icharg', r'^ICHARG *= *(\d+) +charge *: .*$',
+    'first', 1, 1, int),
+  # ISPIN  =      2    # 1: non spin polarized,  2: spin polarized
+  Sspec( 'numSpin', r'^ISPIN *= *(\d+) +spin polarized .*$',
+    'first', 1, 1, int),
+  # ISIF   =      3    stress and relaxation
+  Sspec( 'isif', r'^ISIF *= *(\d+) +stress and relaxation$',
+    'first', 1, 1, int),
+  # NELECT =      14.0000    total number of electrons
+  Sspec( 'numElectron',
+    r'^NELECT *= *([-.E0-9]+) +total number of electrons$',
+    'first', 1, 1, float),
+  # k-points    NKPTS =    260   k-points in BZ     NKDIM =    260 \
+  #   number of bands    NBANDS=     13
+  Sspec( 'numKpoint', nkpointPat, 'first', 1, 1, int),
+  Sspec( 'numBand',   nbandPat, 'first', 1, 1, int),
+
+  # Volume
+  #   volume of cell :       20.0121
+  Sspec( 'finalVolume_ang3', r'^volume of cell *: +([-.E0-9]+)$',
+    'last', 1, 0, float),
+] # scalarSpecs
+
+# Alternation of all the scalarSpecs patterns, used to skip
+# the lines that match no spec with a single regex test.
+scalarRegex = re.compile(
+  '|'.join( ['(?:%s)' % (spec.pat,) for spec in scalarSpecs]))
+
+#====================================================================
+#====================================================================
+
+
+# The ScanOutcar getters, in the order they are run,
+# each with the resObj attributes it sets.
+# If a tag appears twice, the later getter has the final value.
+
+getterTags = [
+  ('getScalars', [spec.tag for spec in scalarSpecs]),
+  ('getDate', ['runDate']),
+  ('getTimes', ['iterCpuTimes', 'iterRealTimes', 'totalCpuTimeSec',
+    'userTimeSec', 'systemTimeSec', 'elapsedTimeSec']),
+  ('getSystem', ['systemName']),
+  ('getCategEnergy', ['energyNoEntrp', 'efermi']),
+  ('getTypeNames', ['typeNames']),
+  ('getTypeNums', ['numAtom']),
+  ('getBasisMats', ['initialBasisMat', 'initialRecipBasisMat',
+    'finalBasisMat', 'finalRecipBasisMat']),
+  ('getInitialPositions', ['initialFracPosMat', 'initialCartPosMat']),
+  ('getFinalPositionsForce', ['finalFracPosMat', 'finalCartPosMat',
+    'finalForceMat_ev_ang']),
+  ('getStressMat', ['finalStressMat_ev', 'finalStressMat_kbar',
+    'finalPressure_kbar']),
+  ('getTypeMassValence', ['typeMasses_amu', 'typeValences']),
+  ('getTypePseudos', ['typePseudos']),
+  ('getKpointMat', ['kpointFracMat', 'kpointCartMat',
+    'kpointMults', 'kpointWeights']),
+  ('getEigenMat', ['eigenMat', 'occupMat']),
+  ('calcMisc', ['iterTotalTime', 'algo', 'atomMasses_amu', 'atomNames',
+    'atomPseudos', 'atomValences', 'totalValence', 'finalVolumeCalc_ang3',
+    'finalDensity_g_cm3', 'recipVolume']),
+  ('calcEfermi', ['efermiCalc']),
+  ('calcBandgaps', ['cbMinVals', 'cbMinIxs', 'vbMaxVals', 'vbMaxIxs',
+    'bandgapDirects', 'bandgapIndirects', 'cbMin', 'vbMax', 'bandgap']),
+] # getterTags
+
+# In lazy mode, getters that are run immediately.
+# They check the POSCAR typeNames and typeNums, which are
+# already set, so they would never be triggered by an access.
+eagerGetters = ['getTypeNames', 'getTypeNums']
+
+#====================================================================
+#====================================================================
+
+class LazyResClass( ResClass):
+  '''
+  A ResClass that ScanOutcar fills on demand, when called
+  with lazy=True.  Each attribute in getterTags is extracted
+  by its getter the first time it is read, and then kept
+  as an ordinary attribute.  For example::
+
+    resObj = ScanOutcar.LazyResClass()
+    ScanOutcar.ScanOutcar( bugLev, inDir, resObj, lazy=True)
+    print resObj.energyNoEntrp    # does not parse the eigenvalues
+
+  Errors are raised when the attribute is read.
+  Call fillAll to extract everything and release the OUTCAR.
+  Pickling calls fillAll, so the scanner, with its open OUTCAR,
+  is never pickled.
+  '''
+
+  # The ScanOutcar, until fillAll.  A slot, so getFieldMap skips it.
+  __slots__ = ['_lazyScanner']
+
+  # Returns the scanner, or None if it was released or never set,
+  # as after unpickling.
+  def getScanner( self):
+    try: return object.__getattribute__( self, '_lazyScanner')
+    except AttributeError: return None
+
+  # Called only if name is not found in the usual ways.
+  def __getattr__( self, name):
+    scanner = self.getScanner()
+    if scanner == None or not scanner.ownerMap.has_key( name):
+      raise AttributeError( name)
+    scanner.runGetter( scanner.ownerMap[name], self)
+    if not self.hasField( name):
+      raise AttributeError( name)
+    return object.__getattribute__( self, name)
+
+  def fillAll( self):
+    scanner = self.getScanner()
+    if scanner != None:
+      for (getterName, tags) in getterTags:
+        scanner.runGetter( getterName, self)
+      scanner.closeLines()
+      self._lazyScanner = None
+
+  def __getstate__( self):
+    self.fillAll()
+    return ResClass.__getstate__( self)
+
+#====================================================================
+#====================================================================
+
 
 # Fills resObj.
+# readMode is 'mmap', to map the whole OUTCAR,
+# or 'stream', to keep only the parts given by readStreamLines.
+# If lazy, resObj must be a LazyResClass, and the getters
+# are run when their attributes are first read.
+# prof is a phaseProfile.PhaseProfile, or None.  The phases are
+# incar, poscar, readOutcar, and the names of the getters run
+# before we return.
+# The OUTCAR is closed when all the getters have run, unless
+# keepLines, for callers that use the scanner afterwards,
+# like benchVasp.  They call closeLines when done.
 
 class ScanOutcar:
 
-  def __init__( self, bugLev, inDir, resObj):
+  def __init__( self, bugLev, inDir, resObj, readMode='mmap', lazy=False,
+    prof=None, keepLines=False):
     self.bugLev = bugLev
     self.inDir = inDir
+    if prof == None: prof = phaseProfile.noProfile
 
     # First, read POSCAR and INCAR
+    prof.mark('incar')
     self.parseIncar( resObj)
+    prof.mark('poscar')
     self.parsePoscar( resObj)
 
     # Now read OUTCAR
+    # The lines are memory mapped and stripped on demand,
+    # or else streamed and only the needed steps are kept.
     fname = os.path.join( inDir, 'OUTCAR')
-    with open( fname) as fin:
-      self.lines = fin.readlines()
+    prof.mark('readOutcar')
+    if readMode == 'mmap': self.lines = MmapLines( fname)
+    elif readMode == 'stream': self.lines = readStreamLines( fname)
+    else: self.throwerr('unknown readMode: %s' % (readMode,), None)
     self.numLine = len( self.lines)
-    # Strip all lines
-    for ii in range( self.numLine):
-      self.lines[ii] = self.lines[ii].strip()
-
-    self.getScalars( resObj)
-    self.getDate( resObj)
-    self.getTimes( resObj)
-    self.getSystem( resObj)
-    self.getCategEnergy( resObj)
-    self.getTypeNames( resObj)
-    self.getTypeNums( resObj)
-    self.getBasisMats( resObj)
-    self.getInitialPositions( resObj)
-    self.getFinalPositionsForce( resObj)
-    self.getStressMat( resObj)
-    self.getTypeMassValence( resObj)
-    self.getTypePseudos( resObj)
-    self.getKpointMat( resObj)
-    self.getEigenMat( resObj)
-
-    self.calcMisc( resObj)
-    self.calcEfermi( resObj)
-    self.calcBandgaps( resObj)
+    self.buildIndex()
+
+    if lazy:
+      # Run only the getters that check the POSCAR values in place.
+      if not isinstance( resObj, LazyResClass):
+        self.throwerr('lazy requires a LazyResClass resObj', None)
+      self.ownerMap = {}             # tag -> name of getter that sets it
+      for (getterName, tags) in getterTags:
+        for tag in tags:
+          self.ownerMap[tag] = getterName
+      self.doneGetters = []
+      self.runningGetters = []
+      for getterName in eagerGetters:
+        prof.mark( getterName)
+        self.runGetter( getterName, resObj)
+      resObj._lazyScanner = self
+    else:
+      try:
+        for (getterName, tags) in getterTags:
+          prof.mark( getterName)
+          getattr( self, getterName)( resObj)
+      finally:
+        if not keepLines: self.closeLines()
+    prof.mark( None)
+
+#====================================================================
+
+  # Releases the OUTCAR: closes the file and map of MmapLines.
+  # The streamed lines are a list, and are just dropped.
+
+  def closeLines( self):
+    if isinstance( self.lines, MmapLines): self.lines.close()
+    self.lines = None
+
+#====================================================================
+
+  # For lazy mode: runs the named getter, once.
+  # Any attributes it sets that are owned by a getter that
+  # has not yet run are dropped, so they are recomputed by
+  # their owner, as in the eager order.  For example
+  # getScalars sets algo from the OUTCAR ALGO line, but
+  # calcMisc replaces it.
+
+  def runGetter( self, getterName, resObj):
+    if getterName in self.doneGetters: return
+    if getterName in self.runningGetters:
+      self.throwerr('circular lazy getters: %s' \
+        % (self.runningGetters + [getterName],), None)
+    self.runningGetters.append( getterName)
+    oldTags = resObj.getFieldMap().keys()
+    try:
+      getattr( self, getterName)( resObj)
+    finally:
+      self.runningGetters.pop()
+    self.doneGetters.append( getterName)
+
+    for tag in resObj.getFieldMap().keys():
+      if tag not in oldTags and self.ownerMap.has_key( tag):
+        owner = self.ownerMap[tag]
+        if owner != getterName and owner not in self.doneGetters:
+          delattr( resObj, tag)
+
 
 
 #====================================================================
@@ -156,6 +555,7 @@ class ScanOutcar:
     with open( fname) as fin:
       lines = fin.readlines()
 
+    incarTags = {}
     for iline in range( len( lines)):
       line = lines[iline].strip()
       if len(line) > 0 and not line.startswith('#'):
@@ -170,13 +570,14 @@ class ScanOutcar:
         if ix >= 0: val = val[:ix].strip()
 
         val = val.strip('"\'')       # strip possibly unbalanced quotes
-        resObj.__dict__[key] = val
+        incarTags[key] = val
         if self.bugLev >= 5:
           print 'parseIncar: %s: %s' % (key, val,)
 
-    if not resObj.__dict__.has_key('ALGO'):
-      resObj.__dict__['ALGO'] = 'Normal'
-    algo = resObj.ALGO.lower()
+    if not incarTags.has_key('ALGO'):
+      incarTags['ALGO'] = 'Normal'
+    resObj.incarTags = incarTags
+    algo = incarTags['ALGO'].lower()
     if algo == 'a': algo = 'all'
 
     if algo in ['chi', 'gw', 'gw0', 'scgw', 'scgw0', 'diag']:
@@ -277,56 +678,44 @@ class ScanOutcar:
 
 #====================================================================
 
+  # Finds the scalarSpecs.
+  # The 'last' specs with no numMax are found by searching back
+  # through their candidate lines.  All the others are found in one pass over the union
+  # of their candidate lines.  Lines that match none of them are
+  # skipped by scalarRegex; the rest are dispatched to each spec.
+
   def getScalars( self, resObj):
-    #   k-points           NKPTS =    260   k-points in BZ     NKDIM =    260   number of bands    NBANDS=     11
-    nkpointPat = r'^k-points +NKPTS *= *(\d+) +k-points in BZ' \
-      + r' +NKDIM *= *\d+ +number of bands +NBANDS *= *\d+$'
-    nbandPat   = r'^k-points +NKPTS *= *\d+ +k-points in BZ' \
-      + r' +NKDIM *= *\d+ +number of bands +NBANDS *= *(\d+)$'
-    specs = [
-      # EDIFF  = 0.6E-04   stopping-criterion for ELM
-      Sspec( 'ediff', r'^EDIFF *= *([-.E0-9]+) *stopping-criterion.*$',
-        'first', 1, 1, float),
-      # ENCUT  =  340.0 eV  24.99 Ry    5.00 a.u. 4.51 4.51  4.51*2*pi/ulx,y,z
-      Sspec( 'encut_ev', r'^ENCUT *= *([-.E0-9]+) eV .*$',
-        'first', 1, 1, float),
-      # IALGO  =     68    algorithm
-      Sspec( 'ialgo', r'^IALGO *= *(\d+) +algorithm$',
-        'first', 1, 1, int),
-      # ALGO = Fast
-      # ALGO    =GW        execute GW part
-      Sspec( 'algo', r'^ALGO *= *([a-zA-Z0-9]+).*$',
-        'first', 0, 1, str),
-      # IBRION =      2    ionic relax: 0-MD 1-quasi-New 2-CG
-      Sspec( 'ibrion', r'^IBRION *= *([-0-9]+) +ionic relax *: .*$',
-        'first', 1, 1, int),
-      # ICHARG =      0    charge: 1-file 2-atom 10-const
-      Sspec( 'icharg', r'^ICHARG *= *(\d+) +charge *: .*$',
-        'first', 1, 1, int),
-      # ISPIN  =      2    # 1: non spin polarized,  2: spin polarized
-      Sspec( 'numSpin', r'^ISPIN *= *(\d+) +spin polarized .*$',
-        'first', 1, 1, int),
-      # ISIF   =      3    stress and relaxation
-      Sspec( 'isif', r'^ISIF *= *(\d+) +stress and relaxation$',
-        'first', 1, 1, int),
-      # NELECT =      14.0000    total number of electrons
-      Sspec( 'numElectron',
-        r'^NELECT *= *([-.E0-9]+) +total number of electrons$',
-        'first', 1, 1, float),
-      # k-points    NKPTS =    260   k-points in BZ     NKDIM =    260 \
-      #   number of bands    NBANDS=     13
-      Sspec( 'numKpoint', nkpointPat, 'first', 1, 1, int),
-      Sspec( 'numBand',   nbandPat, 'first', 1, 1, int),
-
-      # Volume
-      #   volume of cell :       20.0121
-      Sspec( 'finalVolume_ang3', r'^volume of cell *: +([-.E0-9]+)$',
-        'last', 1, 0, float),
-
-    ] # specs
-
-    for spec in specs:
-      ixs = self.findLines( [spec.pat], spec.numMin, spec.numMax)
+    passSpecs = []
+    specIxs = {}               # spec.tag -> ascending line numbers
+    for spec in scalarSpecs:
+      if spec.which == 'last' and spec.numMax == 0:
+        # Only the last one matters: search backward.
+        ix = self.findLastLine( spec.pat, spec.numMin)
+        if ix == None: specIxs[spec.tag] = []
+        else: specIxs[spec.tag] = [ix]
+      else:
+        passSpecs.append( spec)
+        specIxs[spec.tag] = []
+
+    ixSet = set()
+    for spec in passSpecs:
+      ixSet.update( self.getCandidates( spec.pat))
+    for ix in sorted( ixSet):
+      line = self.lines[ix]
+      if scalarRegex.match( line):
+        for spec in passSpecs:
+          if spec.regex.match( line): specIxs[spec.tag].append( ix)
+
+    for spec in passSpecs:
+      ixs = specIxs[spec.tag]
+      if len( ixs) < spec.numMin \
+        or (spec.numMax > 0 and len( ixs) > spec.numMax):
+        self.throwerr(('num found mismatch.  numMin: %d  numMax: %d'
+          + '  numFound: %d  pats: %s')
+          % (spec.numMin, spec.numMax, len( ixs), [spec.pat],), None)
+
+    for spec in scalarSpecs:
+      ixs = specIxs[spec.tag]
       if len(ixs) > 0:
         if spec.which == 'first': ix = ixs[0]
         elif spec.which == 'last': ix = ixs[-1]
@@ -334,12 +723,12 @@ class ScanOutcar:
         mat = spec.regex.match( self.lines[ix])
         value = spec.tp( mat.group(1))
 
-        if resObj.__dict__.has_key( spec.tag):
-          if resObj.__dict__[spec.tag] != value:
+        if resObj.hasField( spec.tag):
+          if getattr( resObj, spec.tag) != value:
             self.throwerr('value conflict: spec: %s  INCAR: %s  OUTCAR: %s' \
-              % (spec, resObj.__dict__[spec.tag], value,), None)
+              % (spec, getattr( resObj, spec.tag), value,), None)
         else:
-          resObj.__dict__[spec.tag] = value
+          setattr( resObj, spec.tag, value)
 
         if self.bugLev >= 5:
           print 'getScalars: %s: %s' % (spec.tag, value,)
@@ -488,13 +877,11 @@ class ScanOutcar:
 
   def getTypeNames( self, resObj):
     pat = r'^VRHFIN *= *([a-zA-Z]+): '
-    regexa = re.compile( pat)
+    ixs = self.findLines( [pat], 0, 0)        # pats, numMin, numMax
     typeNames = []
-    for iline in range( self.numLine):
-      line = self.lines[iline]
-      mat = regexa.match( line)
-      if mat != None:
-        typeNames.append( mat.group( 1))
+    for ix in ixs:
+      mat = re.match( pat, self.lines[ix])
+      typeNames.append( mat.group( 1))
 
     if resObj.typeNames == None:   # if POSCAR didn't have typeNames
       resObj.typeNames = typeNames
@@ -644,8 +1031,7 @@ class ScanOutcar:
       resObj.finalCartPosMat = None
       resObj.finalForceMat_ev_ang = None
     else:
-      ixs = self.findLines( [pat], 1, 0)     # pats, numMin, numMax
-      ix = ixs[-1]    # last one
+      ix = self.findLastLine( pat, 1)        # pat, numMin
       resObj.finalCartPosMat = self.parseMatrix(
         6, ix+2, ix+2+resObj.numAtom, 0, 3)
         # ntok, rowBeg, rowEnd, colBeg, colEnd
@@ -693,8 +1079,7 @@ class ScanOutcar:
       resObj.finalStressMat_kbar = None
       resObj.finalPressure_kbar = None
     else:
-      ixs = self.findLines( [pat], 1, 0)        # pats, numMin, numMax
-      ix = ixs[-1]    # last one
+      ix = self.findLastLine( pat, 1)           # pat, numMin
 
       # Find the "Total" and "in kB" lines
       evline = None
@@ -1046,13 +1431,9 @@ class ScanOutcar:
       firstIxs = self.findLines( [kpFirstPat, bandPat], 1, 0)
       for isp in range( numSpin):
         istart = firstIxs[ -numSpin + isp]    # use the last
-        for ikp in range( numKpoint):
-          # Parse one k-point section, for numBand lines
-          isection = istart + 2 + ikp * (3 + numBand)
-          tmat = self.parseMatrix(
-            3, isection, isection + numBand, 1, 3)  # ntok,rBeg,rEnd,cBeg,cEnd
-          eigenMat[ isp, ikp, 0:numBand] = tmat[ 0:numBand, 0]  # col 0: eigen
-          occupMat[ isp, ikp, 0:numBand] = tmat[ 0:numBand, 1]  # col 1: occup
+        tmat = self.parseEigenBlock( istart, numKpoint, numBand)
+        eigenMat[ isp] = tmat[ :, :, 0]       # col 0: eigen
+        occupMat[ isp] = tmat[ :, :, 1]       # col 1: occup
 
       resObj.eigenMat = eigenMat
       resObj.occupMat = occupMat
@@ -1065,6 +1446,48 @@ class ScanOutcar:
           print 'getEigenMat: isp: %d  occupMat:\n%s' \
             % (isp, resObj.occupMat[isp],)
 
+#====================================================================
+
+  # Returns an array [numKpoint, numBand, 2] of the eigenvalues
+  # and occupations in the numKpoint sections starting at istart.
+  # Each section is:
+  #   k-point     1 :       0.0000    0.0000    0.0000
+  #   band No.  band energies     occupation
+  #   numBand lines like:
+  #     1      -6.5443      1.00000
+  #   (blank line)
+  #
+  # All the rows are converted in one np.fromstring call.
+  # If the number of values, the band numbers, or the line
+  # after a section is off, we parse again with parseMatrix
+  # per k-point, so its ntok and endLine checks give the error.
+
+  def parseEigenBlock( self, istart, numKpoint, numBand):
+    secIxs = [istart + 2 + ikp * (3 + numBand) for ikp in range( numKpoint)]
+    texts = []
+    for isection in secIxs:
+      texts.append( self.getText( isection, isection + numBand))
+    vals = np.fromstring( '\n'.join( texts), dtype=float, sep=' ')
+
+    allOk = len( vals) == numKpoint * numBand * 3
+    if allOk:
+      vals = vals.reshape( [numKpoint, numBand, 3])
+      allOk = np.all( vals[:,:,0] == np.arange( 1, numBand + 1))
+    if allOk:
+      for isection in secIxs:
+        if len( self.lines[isection + numBand].split()) == 3:
+          allOk = False
+          break
+
+    if allOk: tmat = vals[ :, :, 1:3]
+    else:
+      tmat = np.zeros( [numKpoint, numBand, 2])
+      for ikp in range( numKpoint):
+        isection = secIxs[ikp]
+        tmat[ikp] = self.parseMatrix(
+          3, isection, isection + numBand, 1, 3)  # ntok,rBeg,rEnd,cBeg,cEnd
+    return tmat
+
 #====================================================================
 
 
@@ -1153,9 +1576,9 @@ class ScanOutcar:
     else:
 
       # efermiCalc
-      # Make an array allEigs of all the eigenvalues for all the
-      # kpoints, with each eigenvalue replicated by the associated
-      # kpoint weight.
+      # Conceptually, make an array allEigs of all the eigenvalues
+      # for all the kpoints, with each eigenvalue replicated by the
+      # associated kpoint weight.
       # Further, if ispin == 1 (non spin polarized),
       # replicate each eigenvalue again.
       #
@@ -1165,6 +1588,12 @@ class ScanOutcar:
       #   if numSpin == 2: 1/sum(weights)    # spin polarized
       # Start summing: occ = factor * (index into allEigs).
       # When occ = totalValence, the corresponding eigVal is fermi0K.
+      #
+      # Rather than build allEigs, which can have tens of millions
+      # of entries, we sort the distinct eigenvalues, each with its
+      # replication count, and take the cumulative sum of the counts.
+      # allEigs[indx] is the first sorted value whose cumulative
+      # count exceeds indx.
 
       numSpin = resObj.numSpin
       numKpoint = resObj.numKpoint
@@ -1182,26 +1611,19 @@ class ScanOutcar:
           % (numSpin, numKpoint, numBand,)
         print 'calcEfermi: numEig: %d' % (numEig,)
 
-      avgWt = sum( resObj.kpointMults) / float( numKpoint)
-      allEigs = np.zeros( [numEig])
-      kk = 0
-      for isp in range( numSpin):
-        for ikp in range( numKpoint):
-          for iband in range( numBand):
-            # Replicate by kpoint weight
-            for irepl in range( int( round( resObj.kpointMults[ ikp]))):
-              allEigs[kk] = resObj.eigenMat[ isp, ikp, iband]
-              kk += 1
-              if numSpin == 1:
-                # Replicate for both spins
-                allEigs[kk] = allEigs[kk-1]
-                kk += 1
-      if kk != numEig: self.throwerr('numEig mismatch', None)
-
-      allEigs.sort()
-      if self.bugLev >= 5:
-        print 'calcEfermi: numEig: %d' % (numEig,)
-        print 'calcEfermi: allEigs.shape: %s' % (allEigs.shape,)
+      # Replication count of each eigenvalue:
+      # the rounded kpoint weight, doubled if numSpin == 1.
+      kpReps = np.array( [int( round( mult))
+        for mult in resObj.kpointMults], dtype=np.int64)
+      if numSpin == 1: kpReps *= 2
+      reps = np.empty( [numSpin, numKpoint, numBand], dtype=np.int64)
+      reps[:] = kpReps.reshape( [1, numKpoint, 1])
+      if reps.sum() != numEig: self.throwerr('numEig mismatch', None)
+
+      eigVals = resObj.eigenMat.ravel()      # [numSpin, numKpoint, numBand]
+      order = np.argsort( eigVals, kind='mergesort')
+      sortVals = eigVals[order]
+      cumReps = np.cumsum( reps.ravel()[order])
 
       # Find indx such that
       # occupancy = indx / sum(kpWts) == valence
@@ -1209,21 +1631,24 @@ class ScanOutcar:
       # The array index of the last used eigenvalue is dindx-1.
       dindx = resObj.totalValence * sum( resObj.kpointMults)
       indx = int( round( dindx)) - 1
-      if indx < 0 or indx >= allEigs.shape[0]:
+      if indx < 0 or indx >= numEig:
         self.throwerr('bad fermi.  dindx: %g  indx: %d  shape: %s' \
-          % (dindx, indx, allEigs.shape), None)
-      resObj.efermiCalc = allEigs[indx]
+          % (dindx, indx, (numEig,)), None)
+      ipos = np.searchsorted( cumReps, indx, side='right')
+      resObj.efermiCalc = sortVals[ipos]
 
       if self.bugLev >= 5:
         print 'calcEfermi: totalValence: %g' % (resObj.totalValence,)
         print 'calcEfermi: sum( resObj.kpointMults): %g' % (sum( resObj.kpointMults),)
-        print 'calcEfermi: len(allEigs): %g' % (len(allEigs),)
+        print 'calcEfermi: numEig: %g' % (numEig,)
         print 'calcEfermi: dindx: %g  indx: %d' % (dindx, indx,)
         print 'calcEfermi: efermi:     %g' % (resObj.efermi,)
         print 'calcEfermi: efermiCalc: %g' % (resObj.efermiCalc,)
-        for ii in range( max( 0, indx-10), min( numEig, indx+10)):
-          msg = 'calcEfermi: allEigs[%d]: %g' % (ii, allEigs[ii],)
-          if ii == indx: msg += ' ***'
+        for ii in range( max( 0, ipos-10), min( len( sortVals), ipos+10)):
+          msg = 'calcEfermi: allEigs[%d:%d]: %g' \
+            % (cumReps[ii] - reps.ravel()[order[ii]], cumReps[ii],
+            sortVals[ii],)
+          if ii == ipos: msg += ' ***'
           print msg
 
 #====================================================================
@@ -1249,48 +1674,32 @@ class ScanOutcar:
       numKpoint = resObj.numKpoint
       numBand = resObj.numBand
 
-      # For each isp and kpoint, what is min eigvalue > efermi
-      cbMinMat = np.empty( [numSpin, numKpoint], dtype=float)
-      vbMaxMat = np.empty( [numSpin, numKpoint], dtype=float)
-      cbMinMat.fill( np.inf)
-      vbMaxMat.fill( -np.inf)
+      # For each isp and kpoint, what is min eigvalue > efermi,
+      # and max eigvalue <= efermi.  Use inf if there is none.
+      eigenMat = resObj.eigenMat
+      cbMinMat = np.where( eigenMat > resObj.efermiCalc,
+        eigenMat, np.inf).min( axis=2)
+      vbMaxMat = np.where( eigenMat <= resObj.efermiCalc,
+        eigenMat, -np.inf).max( axis=2)
 
       # For each isp, what is min or max across all kpoints
-      cbMinVals = np.empty( [numSpin], dtype=float)
-      vbMaxVals = np.empty( [numSpin], dtype=float)
-      cbMinVals.fill( np.inf)
-      vbMaxVals.fill( -np.inf)
+      cbMinVals = cbMinMat.min( axis=1)
+      vbMaxVals = vbMaxMat.max( axis=1)
 
-      # For each isp, which kpoint has the min or max
-      cbMinIxs = np.empty( [numSpin], dtype=int)
-      vbMaxIxs = np.empty( [numSpin], dtype=int)
-      cbMinIxs.fill( -1)
-      vbMaxIxs.fill( -1)
-
-      for isp in range( numSpin):
-        for ikp in range( numKpoint):
-          for iband in range( numBand):
-            val = resObj.eigenMat[isp][ikp][iband]
-            if val <= resObj.efermiCalc:
-              if val > vbMaxMat[isp][ikp]: vbMaxMat[isp][ikp] = val
-              if val > vbMaxVals[isp]:
-                vbMaxVals[isp] = val
-                vbMaxIxs[isp] = ikp
-
-            else:    # val > resObj.efermi
-              if val < cbMinMat[isp][ikp]: cbMinMat[isp][ikp] = val
-              if val < cbMinVals[isp]:
-                cbMinVals[isp] = val
-                cbMinIxs[isp] = ikp
+      # For each isp, which kpoint has the min or max.
+      # argmin and argmax return the first one, or -1 if there is none.
+      cbMinIxs = cbMinMat.argmin( axis=1)
+      vbMaxIxs = vbMaxMat.argmax( axis=1)
+      cbMinIxs[ cbMinVals == np.inf] = -1
+      vbMaxIxs[ vbMaxVals == -np.inf] = -1
 
       # Find bandgapDirects[isp] = min gap for the same kpoint
       # Find bandgapIndirects[isp] = min gap across kpoints
       bandgapDirects = numSpin * [np.inf]
       bandgapIndirects = numSpin * [np.inf]
+      minDirects = (cbMinMat - vbMaxMat).min( axis=1)
       for isp in range( numSpin):
-        for ikp in range( numKpoint):
-          gap = max( 0, cbMinMat[isp][ikp] - vbMaxMat[isp][ikp])
-          if gap < bandgapDirects[isp]: bandgapDirects[isp] = gap
+        bandgapDirects[isp] = max( 0, minDirects[isp])
         bandgapIndirects[isp] = max( 0, cbMinVals[isp] - vbMaxVals[isp])
 
       resObj.cbMinVals = cbMinVals
@@ -1344,10 +1753,69 @@ class ScanOutcar:
                 print >> fout, '%d  %g' \
                   % (ikp, resObj.eigenMat[isp][ikp][iband],)
 
+#====================================================================
+
+  # Builds self.lineIndex, in one pass over all lines:
+  #   lineIndex[prefix] = ascending list of the numbers of the lines
+  #     whose longest matching anchorPrefixes entry is prefix.
+
+  def buildIndex( self):
+    prefixes = sorted( anchorPrefixes, key=len, reverse=True)
+    regex = re.compile( '|'.join( map( re.escape, prefixes)))
+    self.lineIndex = {}
+    for prefix in prefixes:
+      self.lineIndex[prefix] = []
+    self.candidateCache = {}
+
+    iline = 0
+    for line in self.lines:
+      mat = regex.match( line)
+      if mat != None:
+        self.lineIndex[mat.group()].append( iline)
+      iline += 1
+
+#====================================================================
+
+  # Returns an ascending list of the line numbers that could
+  # match pat: every line starting with the literal prefix of pat.
+  # If no anchor prefix covers pat, returns all line numbers.
+  #
+  # A line starting with the prefix is indexed under its longest
+  # matching anchor, which is either a prefix of the pat prefix
+  # or an extension of it, so we merge the lists for both kinds.
+
+  def getCandidates( self, pat):
+    if self.candidateCache.has_key( pat):
+      return self.candidateCache[pat]
+
+    prefix = literalPrefix( pat)
+    covered = False
+    keys = []
+    for key in self.lineIndex.keys():
+      if prefix.startswith( key):
+        covered = True
+        keys.append( key)
+      elif key.startswith( prefix):
+        keys.append( key)
+
+    if len( prefix) == 0 or not covered:
+      ixs = range( self.numLine)
+    elif len( keys) == 1:
+      ixs = self.lineIndex[keys[0]]
+    else:
+      ixs = []
+      for key in keys:
+        ixs += self.lineIndex[key]
+      ixs.sort()
+
+    self.candidateCache[pat] = ixs
+    return ixs
+
 #====================================================================
 
   # Returns a list of line numbers ixs such that at each ix,
   # lines[ix+i] matches pats[i].
+  # Only the lines given by getCandidates( pats[0]) are examined.
 
   def findLines( self, pats, numMin, numMax):
     # Insure all pats are '^...$'
@@ -1356,7 +1824,7 @@ class ScanOutcar:
       regexs.append( re.compile( pat))
 
     resIxs = []
-    for iline in range( self.numLine):
+    for iline in self.getCandidates( pats[0]):
       # Do the pats match starting at iline ...
       allOk = True
       for ii in range( len( pats)):
@@ -1374,6 +1842,37 @@ class ScanOutcar:
         % (numMin, numMax, len( resIxs), pats,), None)
     return resIxs
 
+#====================================================================
+
+  # Returns the number of the last line matching pat,
+  # searching backward through the lines given by getCandidates,
+  # so the cost is that of the index lookup plus the number of
+  # candidates after the match.
+  # If there is none, returns None, or if numMin > 0, throws
+  # an error like findLines.
+
+  def findLastLine( self, pat, numMin):
+    regex = re.compile( pat)
+    ix = None
+    for iline in reversed( self.getCandidates( pat)):
+      if regex.match( self.lines[iline]):
+        ix = iline
+        break
+    if ix == None and numMin > 0:
+      self.throwerr(('num found mismatch.  numMin: %d  numFound: 0'
+        + '  pat: %s') % (numMin, pat,), None)
+    return ix
+
+#====================================================================
+
+  # Returns the text of lines beg through end-1, joined by newlines.
+  # For mmap lines these are the raw, unstripped lines.
+
+  def getText( self, beg, end):
+    if isinstance( self.lines, MmapLines):
+      return self.lines.getText( beg, end)
+    else: return '\n'.join( self.lines[beg:end])
+
 #====================================================================
 
   def parseMatrix( self, ntok, begLine, endLine, begCol, endCol):
@@ -61,9 +61,11 @@ def main():
   smap = scanner.scan()
 
   # Compare rmap and smap, key for key
-  rkeys = rmap.__dict__.keys()
+  rfields = rmap.getFieldMap()
+  sfields = smap.getFieldMap()
+  rkeys = rfields.keys()
   rkeys.sort()
-  skeys = smap.__dict__.keys()
+  skeys = sfields.keys()
   skeys.sort()
 
   irr = 0      # index into rkeys
@@ -72,17 +74,17 @@ def main():
     if irr >= len( rkeys) and iss >= len( skeys): break
     elif irr >= len( rkeys):
       print '\nTesta: Unique S:'
-      print 'skey: %s  val: %s' % (skeys[iss], smap.__dict__[skeys[iss]],)
+      print 'skey: %s  val: %s' % (skeys[iss], sfields[skeys[iss]],)
       iss += 1
     elif iss >= len( skeys):
       print '\nTesta: Unique R:'
-      print 'rkey: %s  val: %s' % (rkeys[irr], rmap.__dict__[rkeys[irr]],)
+      print 'rkey: %s  val: %s' % (rkeys[irr], rfields[rkeys[irr]],)
       irr += 1
     else:
       rkey = rkeys[irr]
       skey = skeys[iss]
-      rval = rmap.__dict__[rkey]
-      sval = smap.__dict__[skey]
+      rval = rfields[rkey]
+      sval = sfields[skey]
       if rkey == skey:
         epsilon = 5.e-5
         compMsg = deepCompare( epsilon, rval, sval)
@@ -19,6 +19,13 @@
 import datetime, re, sys, traceback, os.path
 import xml.etree.cElementTree as etree
 import numpy as np
+import phaseProfile
+import resRecord
+
+try:
+  import lxml.etree as lxmlEtree     # optional: see getEngine
+except ImportError:
+  lxmlEtree = None
 
 
 #====================================================================
@@ -29,6 +36,12 @@ def badparms( msg):
   print '  -bugLev    <int>      debug level'
   print '  -inFile    <string>   input file'
   print '  -maxLev    <int>      max xml print level'
+  print '  -readMode  <string>   tree (default) / stream'
+  print '  -getTraj   <string>   y / n (default): get the ionic trajectory'
+  print '  -dosMode   <string>   all (default) / total / none'
+  print '  -sections  <string>   comma separated list of sections, or "all"'
+  print '  -engine    <string>   celement (default) / lxml / auto'
+  print '  -recover   <string>   y / n (default): read a truncated file'
   print ''
   sys.exit(1)
 
@@ -46,12 +59,34 @@ def main():
   **-bugLev**       integer      Debug level.  Normally 0.
   **-inFile**       string       Input file
   **-maxLev         int          max xml print level
+  **-readMode**     string       'tree' (the default): parse the whole file.
+                                 'stream': keep only the last calculation.
+                                 See readStreamRoot.
+  **-getTraj**      string       If 'y', get the ionic trajectory.
+                                 See TrajBuilder.  Default 'n'.
+  **-dosMode**      string       'all' (the default): get the total and
+                                 projected DOS.  'total': only the total.
+                                 'none': neither.  See getDos.
+  **-sections**     string       Comma separated list of the sections
+                                 to get, from xmlSections, or 'all'.
+                                 Default: all but trajectory.
+  **-engine**       string       XML parser: 'celement' (the default),
+                                 'lxml' or 'auto'.  See getEngine.
+  **-recover**      string       If 'y', read a truncated file up to
+                                 the last complete calculation.
+                                 See readStreamRoot.  Default 'n'.
   ================  =========    ==============================================
   '''
 
   bugLev = 0
   inFile = None
   maxLev = 0
+  readMode = 'tree'
+  getTraj = False
+  dosMode = 'all'
+  sections = None
+  engine = 'celement'
+  recover = False
 
   if len(sys.argv) % 2 != 1:
     badparms('Parms must be key/value pairs')
@@ -61,6 +96,19 @@ def main():
     if key == '-bugLev': bugLev = int( val)
     elif key == '-inFile': inFile = val
     elif key == '-maxLev': maxLev = int( val)
+    elif key == '-readMode': readMode = val
+    elif key == '-getTraj':
+      if val not in ['y', 'n']: badparms('invalid getTraj')
+      getTraj = val == 'y'
+    elif key == '-dosMode': dosMode = val
+    elif key == '-sections':
+      if val == 'all': sections = xmlSections
+      else:
+        sections = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-engine': engine = val
+    elif key == '-recover':
+      if val not in ['y', 'n']: badparms('invalid recover')
+      recover = val == 'y'
     else: badparms('unknown key: "%s"' % (key,))
 
   if bugLev == None: badparms('parm not specified: -bugLev')
@@ -68,69 +116,159 @@ def main():
   if maxLev == None: badparms('parm not specified: -maxLev')
 
   resObj = ResClass()
-  parseXml( bugLev, inFile, maxLev, resObj)
+  parseXml( bugLev, inFile, maxLev, resObj,
+    readMode=readMode, getTraj=getTraj, dosMode=dosMode, sections=sections,
+    engine=engine, recover=recover)
 
 
 #====================================================================
 #====================================================================
 
-class ResClass:
-  '''
-  An empty class used as a data container for results.
-  '''
+# The data container for results.  See resRecord.ResClass.
 
-  def __str__(self):
-    keys = self.__dict__.keys()
-    keys.sort()
-    msg = ''
-    for key in keys:
-      val = self.__dict__[key]
-      stg = str( val)
-      if stg.find('\n') >= 0: sep = '\n'
-      else: sep = ' '
-      msg += '  %s:  type: %s  val:%s%s\n' % (key, type(val), sep, val,)
-    return msg
+ResClass = resRecord.ResClass
 
 #====================================================================
 #====================================================================
 
 
 # Fills resObj.
-
-def parseXml( bugLev, inFile, maxLev, resObj):
+# readMode is 'tree', to parse the whole file,
+# or 'stream', to keep only the last calculation.  See readStreamRoot.
+# If getTraj, also get the ionic trajectory.  See TrajBuilder.
+# dosMode is 'all', 'total' or 'none'.  See getDos.
+# sections is the list of sections to get, from xmlSections,
+# or None for all but 'trajectory'.  See getWantedSections.
+# engine is the XML parser: 'celement', 'lxml' or 'auto'.  See getEngine.
+# If recover, a truncated file is read up to the last complete
+# calculation.  See readStreamRoot.
+# prof is a phaseProfile.PhaseProfile, or None.
+
+def parseXml( bugLev, inFile, maxLev, resObj, readMode='tree', getTraj=False,
+  dosMode='all', sections=None, engine='celement', recover=False, prof=None):
   '''
   Extracts info from the vasprun.xml file from a VASP run,
-  using the Python xml.etree.cElementTree API.
+  using the ElementTree API of either xml.etree.cElementTree or lxml.
 
   **Parameters**:
 
   * bugLev (int): Debug level.  Normally 0.
   * inFile (str): Path of the input vasprun.xml file.
   * resObj (class ResClass): data object: we set attributes here.
+  * readMode (str): 'tree' to parse the whole file,
+    or 'stream' to parse it incrementally, keeping only the
+    last ``<calculation>``.  See :func:`readStreamRoot`.
+  * getTraj (boolean): If True, also set the traj* attributes
+    of resObj from every ``<calculation>``, in the same parse.
+    See :class:`TrajBuilder`.
+  * dosMode (str): 'all' to set the density of states attributes
+    dosTotalMat and dosPartialMat, 'total' to skip the projected
+    DOS, which is most of the file when present, or 'none'.
+    With readMode 'stream', skipped projected DOS is
+    dropped while reading.  See :func:`getDos`.
+  * sections (list of str): the sections to get, from
+    :data:`xmlSections`, or None for all but 'trajectory'.
+    Sections needed by those given are added.
+    The generator, parameters, times, final energy, and efermi0
+    are always read.  With readMode 'stream', unwanted elements
+    are removed from the text before parsing.  See :class:`SkipReader`.
+  * engine (str): 'celement' for cElementTree, the default,
+    'lxml', or 'auto' to use lxml if it is installed, else
+    cElementTree.  Both give the same resObj.  See :func:`getEngine`.
+  * recover (boolean): If True and the file is truncated, as when
+    the job was killed, read it in stream mode up to the last
+    complete ``<calculation>``, and fill resObj from that.
+    The final structure is then the structure of that calculation,
+    and the sections it lacks, normally 'eigen' and 'dos', are
+    not set.  Always sets resObj.isTruncated and
+    resObj.lostSections, the list of wanted sections not set.
+  * prof (phaseProfile.PhaseProfile): If not None, the time and
+    memory of each section are recorded in it, as phases
+    parse, anchors, and the section names.
+    See :class:`phaseProfile.PhaseProfile`.
 
   **Returns**:
 
   * None
   '''
 
+  if readMode not in ['tree', 'stream']:
+    throwerr('unknown readMode: %s' % (readMode,))
+  if dosMode not in ['all', 'total', 'none']:
+    throwerr('unknown dosMode: %s' % (dosMode,))
+  if prof == None: prof = phaseProfile.noProfile
+  (engine, etreeMod) = getEngine( engine)
+  if bugLev >= 5: print 'parseXml: engine: %s' % (engine,)
+  wanted = getWantedSections( sections, getTraj, dosMode)
+  if bugLev >= 5: print 'parseXml: wanted sections: %s' % (sorted( wanted),)
+  root = None
+  traj = None
+  isTruncated = False
+  prof.mark('parse')
   try:
-    tree = etree.parse( inFile)
+    if readMode == 'tree':
+      try:
+        if engine == 'lxml':
+          root = lxmlEtree.parse( inFile,
+            lxmlEtree.XMLParser( resolve_entities=False)).getroot()
+        else: root = etree.parse( inFile).getroot()
+      except Exception, exc:
+        if not recover: raise
+        if bugLev >= 1:
+          print 'parseXml: tree parse failed: %s.  Recovering.' % (repr(exc),)
+    if root == None:
+      if 'trajectory' in wanted: traj = TrajBuilder( bugLev)
+      (root, isTruncated) = readStreamRoot( bugLev, inFile, traj,
+        skipPat=getSkipPat( wanted, dosMode, recover), engine=engine,
+        recover=recover)
   except Exception, exc:
     throwerr(('parseXml: invalid xml in file: "%s"\n'
       + '  Msg: %s\n') % (inFile, repr(exc),))
 
-  root = tree.getroot()
   if bugLev >= 1: printNode( root, 0, maxLev)      # node, curLev, maxLev
 
+  # Find the top level sections once.  See getAnchors.
+  prof.mark('anchors')
+  anchors = getAnchors( bugLev, root)
+
+  # VASP writes the eigenvalues and dos only in the last
+  # calculation, at the end of the run, so the last complete
+  # calculation of a truncated file normally lacks them.
+  # The band edges need efermi0, from the dos.
+  resObj.isTruncated = isTruncated
+  resObj.lostSections = []
+  if isTruncated:
+    lastCalcNode = getAnchor( anchors, 'lastCalc')
+    lost = set()
+    if lastCalcNode.find('dos') == None: lost.update( ['eigen', 'dos'])
+    if lastCalcNode.find('eigenvalues') == None: lost.add('eigen')
+    resObj.lostSections = sorted( wanted & lost)
+    wanted = wanted - lost
+    if bugLev >= 1:
+      print 'parseXml: truncated file: %s  num calculations: %d  lost: %s' \
+        % (inFile, len( anchors['calculations']), resObj.lostSections,)
+
+  if 'trajectory' in wanted:
+    if bugLev >= 5: print '\n===== trajectory =====\n'
+    prof.mark('trajectory')
+    if traj == None:
+      calcNodes = anchors['calculations']
+      traj = TrajBuilder( bugLev, capacity=len( calcNodes))
+      for calcNode in calcNodes:
+        traj.addCalc( calcNode)
+    traj.setResults( resObj)
+
   if bugLev >= 5: print '\n===== program, version, date etc =====\n'
+  prof.mark('header')
 
   # xxx program, version, subversion, etc
 
   # PyLada: vasp/extract/base.py: datetime()
   # OUTCAR: use the 1 occurance of:
   #   executed on             LinuxIFC date 2013.03.11  09:32:24
-  dtStg = getString( root, 'generator/i[@name=\'date\']')
-  tmStg = getString( root, 'generator/i[@name=\'time\']')
+  genNode = getAnchor( anchors, 'generator')
+  dtStg = getString( genNode, 'i[@name=\'date\']')
+  tmStg = getString( genNode, 'i[@name=\'time\']')
   dateFmtIn = '%Y %m %d %H:%M:%S'
   dateFmtOut = '%Y-%m-%d %H:%M:%S'
   resObj.runDate = datetime.datetime.strptime(
@@ -141,7 +279,9 @@ def parseXml( bugLev, inFile, maxLev, resObj):
   # iterTimes
   # Each node is has cpuTime, wallTime:
   #       <time name='totalsc'>22.49 24.43</time>
-  nodes = root.findall('calculation/time[@name=\'totalsc\']')
+  nodes = []
+  for calcNode in anchors['calculations']:
+    nodes.extend( calcNode.findall('time[@name=\'totalsc\']'))
   iterCpuTimes = []
   iterRealTimes = []
   for node in nodes:
@@ -156,16 +296,16 @@ def parseXml( bugLev, inFile, maxLev, resObj):
       # or just use the first time for both values.
       tok = toks[0]
       ix = tok.find('.')
-      if ix < 0: throwerr('invalid times: %s' % (etree.tostring(node),))
+      if ix < 0: throwerr('invalid times: %s' % (etreeMod.tostring(node),))
       iy = tok.find('.', ix + 1)
       if iy < 0 or iy != len(tok) - 3:
-        throwerr('invalid times: %s' % (etree.tostring(node),))
+        throwerr('invalid times: %s' % (etreeMod.tostring(node),))
       tmStga = tok[:ix+3]
       tmStgb = tok[ix+3:]
     elif len(toks) == 2:
       tmStga = toks[0]
       tmStgb = toks[1]
-    else: throwerr('invalid times: %s' % (etree.tostring(node),))
+    else: throwerr('invalid times: %s' % (etreeMod.tostring(node),))
     iterCpuTimes.append( float( tmStga))
     iterRealTimes.append( float( tmStgb))
 
@@ -178,60 +318,63 @@ def parseXml( bugLev, inFile, maxLev, resObj):
     print 'iterTotalTime: %s' % (resObj.iterTotalTime,)
 
 
-  if bugLev >= 5: print '\n===== incar parameters =====\n'
+  if 'incar' in wanted:
+    if bugLev >= 5: print '\n===== incar parameters =====\n'
+    prof.mark('incar')
 
-  # algo
-  # PyLada: vasp/extract/base.py: algo()
-  # OUTCAR: use the 1 occurance of:
-  #   ALGO = Fast
-  resObj.algo = getString( root, 'incar/i[@name=\'ALGO\']')
-  if bugLev >= 5: print 'algo: "%s"' % (resObj.algo,)
-
-  ediff = getScalar( root, 'incar/i[@name=\'EDIFF\']', float)
-  resObj.ediff = ediff
-  if bugLev >= 5: print 'ediff: %g' % (ediff,)
-
-  # encut
-  # PyLada: vasp/extract/base.py: encut()
-  # OUTCAR: use the first occurance of:
-  #   ENCUT  =  252.0 eV  18.52 Ry    4.30 a.u.   4.08  4.08 15.92*2*pi/ulx,y,z
-  #   ENCUT = 252.0
-  resObj.encut_ev = getScalar( root, 'incar/i[@name=\'ENCUT\']', float)
-  if bugLev >= 5: print 'encut_ev: %g' % (resObj.encut_ev,)
-
-  resObj.isif = getScalar( root, 'incar/i[@name=\'ISIF\']', int)
-  if bugLev >= 5: print 'isif: %g' % (resObj.isif,)
-
-  # ldauType
-  # PyLada: vasp/extract/base.py: LDAUType()
-  # OUTCAR: use the first occurance of:
-  #   LDA+U is selected, type is set to LDAUTYPE =  2
-  #   LDAUTYPE = 2
-  #rawLdauType = getScalar( root, 'incar/v[@name=\'LDAUTYPE\']', int)
-  #if rawLdauType == 1: resObj.ldauType = 'liechtenstein'
-  #elif rawLdauType == 2: resObj.ldauType = 'dudarev'
-  #else: throwerr('unknown rawLdauType: %d' % (rawLdauType,))
-  #if bugLev >= 5:
-  #  print 'rawLdauType: %d  ldauType: %s' % (rawLdauType, resObj.ldauType,)
-
-  resObj.systemName = getString( root, 'incar/i[@name=\'SYSTEM\']')
-  if bugLev >= 5: print 'systemName: "%s"' % (resObj.systemName,)
+    # algo
+    # PyLada: vasp/extract/base.py: algo()
+    # OUTCAR: use the 1 occurance of:
+    #   ALGO = Fast
+    incarNode = getAnchor( anchors, 'incar')
+    resObj.algo = getString( incarNode, 'i[@name=\'ALGO\']')
+    if bugLev >= 5: print 'algo: "%s"' % (resObj.algo,)
+
+    ediff = getScalar( incarNode, 'i[@name=\'EDIFF\']', float)
+    resObj.ediff = ediff
+    if bugLev >= 5: print 'ediff: %g' % (ediff,)
+
+    # encut
+    # PyLada: vasp/extract/base.py: encut()
+    # OUTCAR: use the first occurance of:
+    #   ENCUT  =  252.0 eV  18.52 Ry    4.30 a.u.   4.08  4.08 15.92*2*pi/ulx,y,z
+    #   ENCUT = 252.0
+    resObj.encut_ev = getScalar( incarNode, 'i[@name=\'ENCUT\']', float)
+    if bugLev >= 5: print 'encut_ev: %g' % (resObj.encut_ev,)
+
+    resObj.isif = getScalar( incarNode, 'i[@name=\'ISIF\']', int)
+    if bugLev >= 5: print 'isif: %g' % (resObj.isif,)
+
+    # ldauType
+    # PyLada: vasp/extract/base.py: LDAUType()
+    # OUTCAR: use the first occurance of:
+    #   LDA+U is selected, type is set to LDAUTYPE =  2
+    #   LDAUTYPE = 2
+    #rawLdauType = getScalar( incarNode, 'v[@name=\'LDAUTYPE\']', int)
+    #if rawLdauType == 1: resObj.ldauType = 'liechtenstein'
+    #elif rawLdauType == 2: resObj.ldauType = 'dudarev'
+    #else: throwerr('unknown rawLdauType: %d' % (rawLdauType,))
+    #if bugLev >= 5:
+    #  print 'rawLdauType: %d  ldauType: %s' % (rawLdauType, resObj.ldauType,)
+
+    resObj.systemName = getString( incarNode, 'i[@name=\'SYSTEM\']')
+    if bugLev >= 5: print 'systemName: "%s"' % (resObj.systemName,)
 
 
 
   if bugLev >= 5: print '\n===== general parameters =====\n'
+  prof.mark('parameters')
 
   resObj.generalName = getString(
-    root, 'parameters/separator[@name=\'general\']/i[@name=\'SYSTEM\']')
+    getAnchor( anchors, 'general'), 'i[@name=\'SYSTEM\']')
   if bugLev >= 5: print 'generalName: "%s"' % (resObj.generalName,)
 
 
 
   if bugLev >= 5: print '\n===== electronic parameters =====\n'
 
-  lst = root.findall('parameters/separator[@name=\'electronic\']')
-  if len(lst) != 1: throwerr('electronic parameters not found')
-  elecNode = lst[0]
+  elecNode = anchors.get('electronic')
+  if elecNode == None: throwerr('electronic parameters not found')
 
   # ialgo
   # PyLada: use the 1 occurance of:
@@ -272,413 +415,436 @@ def parseXml( bugLev, inFile, maxLev, resObj):
 
   # Some parameters like IBRION are also found in INCAR, sometimes.
   # But apparently they are always in the parameters section.
-  lst = root.findall('parameters/separator[@name=\'ionic\']')
-  if len(lst) != 1: throwerr('ionic parameters not found')
-  ionNode = lst[0]
+  ionNode = anchors.get('ionic')
+  if ionNode == None: throwerr('ionic parameters not found')
   resObj.ibrion = getScalar( ionNode, 'i[@name=\'IBRION\']', int)
   if bugLev >= 5: print 'ibrion: %g' % (resObj.ibrion,)
 
 
 
-  if bugLev >= 5: print '\n===== atom info =====\n'
-
-  # atomTypeMrr = map containing array.  Example (some whitespace omitted):
-  #   _dimLens: [2]
-  #   _dimNames: ['type']
-  #   _fieldNames: ['atomspertype' 'element' 'mass' 'valence' 'pseudopotential']
-  #   _fieldTypes: ['i' 's' 'f' 'f' 's']
-  #   atomspertype: [1 4]
-  #   element: ['C ' 'Fe']
-  #   mass: [ 12.011  55.847]
-  #   valence: [ 4.  8.]
-  #   pseudopotential: [' PAW_PBE C_s 06Sep2000 ' ' PAW_PBE Fe 06Sep2000 ']
-
-  atomTypeMrr = getArrayByPath(
-    bugLev, root, 'atominfo/array[@name=\'atomtypes\']')
-  resObj.typeNames       = atomTypeMrr['element']
-  resObj.typeNums        = atomTypeMrr['atomspertype']
-  resObj.typeMasses_amu  = atomTypeMrr['mass']
-  resObj.typeValences    = atomTypeMrr['valence']
-  resObj.typePseudos     = atomTypeMrr['pseudopotential']
-
-  if bugLev >= 5:
-    print '\natomTypeMrr:'
-    printMrr( atomTypeMrr)
-    print '\nunsorted atomTypes:'
-    print 'typeNames: %s' % ( resObj.typeNames,)
-    print 'typeNums: %s' % ( resObj.typeNums,)
-    print 'typeMasses_amu: %s' % ( resObj.typeMasses_amu,)
-    print 'typeValences: %s' % ( resObj.typeValences,)
-    print 'typePseudos: %s' % ( resObj.typePseudos,)
-
-  # Sort parallel arrays typeNames, typeNums, etc,
-  # by typeNames alphabetic order,
-  # using an index sort with tpIxs.
-  # In rare cases like icsd_024360.cif/hs-ferro
-  # the names are out of order.
-  # Sort to set tpIxs[newIx] == oldIx.
-  ntype = len( resObj.typeNames)
-  tpIxs = range( ntype)
-  def sortFunc( ia, ib):
-    return cmp( resObj.typeNames[ia], resObj.typeNames[ib])
-  tpIxs.sort( sortFunc)
-  if bugLev >= 5:
-    print 'tpIxs: %s' % (tpIxs,)
-
-  resObj.typeNames      = [resObj.typeNames[ix] for ix in tpIxs]
-  resObj.typeNums       = [resObj.typeNums[ix] for ix in tpIxs]
-  resObj.typeMasses_amu = [resObj.typeMasses_amu[ix] for ix in tpIxs]
-  resObj.typeValences   = [resObj.typeValences[ix] for ix in tpIxs]
-  resObj.typePseudos    = [resObj.typePseudos[ix] for ix in tpIxs]
-
-  if bugLev >= 5:
-    print '\nsorted atomTypes:'
-    print 'typeNames: %s' % ( resObj.typeNames,)
-    print 'typeNums: %s' % ( resObj.typeNums,)
-    print 'typeMasses_amu: %s' % ( resObj.typeMasses_amu,)
-    print 'typeValences: %s' % ( resObj.typeValences,)
-    print 'typePseudos: %s' % ( resObj.typePseudos,)
-
-  # totalValence = sum( count[i] * valence[i])
-  # PyLada calls this valence.
-  resObj.totalValence = np.dot( resObj.typeNums, resObj.typeValences)
-  if bugLev >= 5: print 'totalValence: %g' % (resObj.totalValence,)
-
-  if resObj.numElectron != resObj.totalValence:
-    throwerr('%g == numElectron != totalValence == %g' \
-      % (resObj.numElectron, resObj.totalValence,))
-
-  # atomMrr = map containing array.  Example:
-  #   _dimLens: [5]
-  #   _dimNames: ['ion']
-  #   _fieldNames: ['element' 'atomtype']
-  #   _fieldTypes: ['s' 'i']
-  #   element: ['C ' 'Fe' 'Fe' 'Fe' 'Fe']
-  #   atomtype: [1 2 2 2 2]
-
-  atomMrr = getArrayByPath(
-    bugLev, root, 'atominfo/array[@name=\'atoms\']')
-  atomNames = atomMrr['element']
-  atomTypes = [ix - 1 for ix in atomMrr['atomtype']]  # change to origin 0
-  natom = len( atomTypes)
-
-  if bugLev >= 5:
-    print '\natomMrr:'
-    printMrr( atomMrr)
-    print '\nunsorted atoms:'
-    print 'atomNames: %s' % ( atomNames,)
-    print 'atomTypes: %s' % ( atomTypes,)
-
-  # The permutation array tpIxs maps tpIxs[newIx] = oldIx.
-  # Invert it to get tpIxInvs[oldIx] = newIx.
-  tpIxInvs = ntype * [0]
-  for ii in range( ntype):
-    tpIxInvs[ tpIxs[ii]] = ii
-  if bugLev >= 5:
-    print 'tpIxInvs: %s' % (tpIxInvs,)
-
-  # Sort atomNames, atomTypes by tpIxInvs[atomtype] so they
-  # are in the same order as typenames, typenums, etc, above.
-  # Currently atomType[i] = old index num into atomTypes.
-  # We want to sort by new index num into atomTypes.
-
-  atomIxs = range( natom)
-  def sortFunc( ia, ib):
-    return cmp( tpIxInvs[ atomTypes[ ia]], tpIxInvs[ atomTypes[ ib]])
-  atomIxs.sort( sortFunc)
-  atomNames = [atomNames[ix] for ix in atomIxs]
-  atomTypes = [tpIxInvs[ atomTypes[ix]] for ix in atomIxs]
-
-  if bugLev >= 5:
-    print '\natomIxs: %s' % (atomIxs,)
-    print '\nsorted atoms:'
-    print 'atomNames: %s' % ( atomNames,)
-    print 'atomTypes: %s' % ( atomTypes,)
-
-  resObj.atomNames = atomNames
-  resObj.atomTypes = atomTypes
-  resObj.atomMasses_amu = natom * [None]
-  resObj.atomValences = natom * [None]
-  resObj.atomPseudos = natom * [None]
-  for ii in range( natom):
-    ix = atomTypes[ii]
-    if resObj.atomNames[ii] != resObj.typeNames[ix]:
-      throwerr('name mismatch')
-    resObj.atomMasses_amu[ii] = resObj.typeMasses_amu[ix]
-    resObj.atomValences[ii] = resObj.typeValences[ix]
-    resObj.atomPseudos[ii] = resObj.typePseudos[ix]
-  if bugLev >= 5:
-    print 'atomNames: %s' % ( resObj.atomNames,)
-    print 'atomTypes: %s' % ( resObj.atomTypes,)
-    print 'atomMasses_amu: %s' % ( resObj.atomMasses_amu,)
-    print 'atomValences: %s' % ( resObj.atomValences,)
-    print 'atomPseudos: %s' % ( resObj.atomPseudos,)
-
-  # Make sure typenames are in alphabetic order
-  for ii in range(len(resObj.typeNames) - 1):
-    if resObj.typeNames[ii] > resObj.typeNames[ii+1]:
-      throwerr('typeNames not in order')
-
-  # Make sure atomnames are in alphabetic order
-  for ii in range(len(resObj.atomNames) - 1):
-    if resObj.atomNames[ii] > resObj.atomNames[ii+1]:
-      throwerr('atomNames not in order')
-
-  if bugLev >= 5: print '\n===== initial structure =====\n'
-
-  # Initial structure
-  # PyLada: vasp/extract/base.py: initial_structure()
-  # OUTCAR: uses the appended INITIAL STRUCTURE section.
-  lst = root.findall(
-    'structure[@name=\'initialpos\']/crystal/varray[@name=\'basis\']/v')
-  if bugLev >= 5: print 'len(lst) a:', len(lst)
-
-  # initial_structure
-  # POSCAR specifies each basis vector as one row.
-  # So does vasprun.xml.
-  # But PyLada's structure.cell is the transpose: each basis vec is a column.
-  resObj.initialBasisMat = getRawArray(
-    root,
-    'structure[@name=\'initialpos\']/crystal/varray[@name=\'basis\']/v',
-    3, 3, float)
-  resObj.initialRecipBasisMat = getRawArray(
-    root,
-    'structure[@name=\'initialpos\']/crystal/varray[@name=\'rec_basis\']/v',
-    3, 3, float)
-  resObj.initialFracPosMat = getRawArray(
-    root,
-    'structure[@name=\'initialpos\']/varray[@name=\'positions\']/v',
-    0, 3, float)    # xxx nrow should be natom
-
-  resObj.initialCartPosMat = np.dot(
-    resObj.initialFracPosMat, resObj.initialBasisMat)
-  # xxx mult by scale factor?
-
-  if bugLev >= 5:
-    print 'initialBasisMat:\n%s' % (repr(resObj.initialBasisMat),)
-    print 'initialRecipBasisMat:\n%s' % (repr(resObj.initialRecipBasisMat),)
-    print 'initialFracPosMat:\n%s' % (repr(resObj.initialFracPosMat),)
-    print 'initialCartPosMat:\n%s' % (repr(resObj.initialCartPosMat),)
-
-
-
-  if bugLev >= 5: print '\n===== final structure =====\n'
-
-  # structure == final pos
-  # POSCAR and OUTCAR specify each basis vector as one row.
-  # So does vasprun.xml.
-  # But PyLada's structure.cell is the transpose: each basis vec is a column.
-  #
-  # In vasprun.xml and OUTCAR, the basis vectors are rows.
-  resObj.finalBasisMat = getRawArray(
-    root,
-    'structure[@name=\'finalpos\']/crystal/varray[@name=\'basis\']/v',
-    3, 3, float)
-  resObj.finalRecipBasisMat = getRawArray(
-    root,
-    'structure[@name=\'finalpos\']/crystal/varray[@name=\'rec_basis\']/v',
-    3, 3, float)
-  resObj.finalFracPosMat = getRawArray(
-    root,
-    'structure[@name=\'finalpos\']/varray[@name=\'positions\']/v',
-    0, 3, float)    # xxx nrow should be natom
-
-  resObj.finalCartPosMat = np.dot(
-    resObj.finalFracPosMat, resObj.finalBasisMat)
-  # xxx mult by scale factor?
-
-  if bugLev >= 5:
-    print 'finalBasisMat:\n%s' % (repr(resObj.finalBasisMat),)
-    print 'finalRecipBasisMat:\n%s' % (repr(resObj.finalRecipBasisMat),)
-    print 'finalFracPosMat:\n%s' % (repr(resObj.finalFracPosMat),)
-    print 'finalCartPosMat:\n%s' % (repr(resObj.finalCartPosMat),)
-
-
-
-  if bugLev >= 5: print '\n===== kpoints =====\n'
-
-  # kpoint coordinates.
-  # Not in PyLada?
-  resObj.kpointFracMat = getRawArray(
-    root, 'kpoints/varray[@name=\'kpointlist\']/v',
-    0, 3, float)
-  resObj.numKpoint = resObj.kpointFracMat.shape[0]
-
-  resObj.kpointCartMat \
-    = np.dot( resObj.kpointFracMat, resObj.initialRecipBasisMat)
-  if bugLev >= 5:
-    print 'numKpoint: %g' % (resObj.numKpoint,)
-    print 'kpointFracMat:\n%s' % (repr(resObj.kpointFracMat),)
-    print 'kpointCartMat:\n%s' % (repr(resObj.kpointCartMat),)
-
-  # This is what PyLada calls multiplicity.
-  # The only diff is the scaling.
-  #   sum( Pylada multiplicity) = numKpoint
-  #   sum( our kpointWeights) = 1.0
-  resObj.kpointWeights = getRawArray(
-    root, 'kpoints/varray[@name=\'weights\']/v',
-    0, 1, float)
-  resObj.kpointWeights = resObj.kpointWeights[:,0]   # Only 1 col in 2d array
-  if resObj.kpointWeights.shape[0] != resObj.numKpoint:
-    throwerr('numKpoint mismatch')
-  if bugLev >= 5:
-    print 'kpointWeights:\n%s' % (repr(resObj.kpointWeights),)
-    print 'kpointWeights sum: %g' % (sum(resObj.kpointWeights),)
-
-
-
-  if bugLev >= 5: print '\n===== final volume and density =====\n'
-
-  # volume, Angstrom^3
-  # The scale is hard coded as 1.0 in PyLada crystal/read.py,
-  # in both icsd_cif_a and icsd_cif_b.
-  volScale = 1.0
-  resObj.finalVolumeCalc_ang3 = abs( np.linalg.det(
-    volScale * resObj.finalBasisMat))
-  if bugLev >= 5:
-    print 'finalVolumeCalc_ang3: %g' % (resObj.finalVolumeCalc_ang3,)
-
-  resObj.finalVolume_ang3 = getScalar(
-    root, 'structure[@name=\'finalpos\']/crystal/i[@name=\'volume\']', float)
-  if bugLev >= 5:
-    print 'finalVolume_ang3: %g' % (resObj.finalVolume_ang3,)
-
-  # reciprocal space volume, * (2*pi)**3
-  # As in PyLada.
-  invMat = np.linalg.inv( volScale * resObj.finalBasisMat)
-  resObj.recipVolume = abs( np.linalg.det( invMat)) * (2 * np.pi)**3
-  if bugLev >= 5:
-    print 'recipVolume: origMat:\n%s' \
-      % (repr(volScale * resObj.finalBasisMat),)
-    print 'recipVolume: invMat:\n%s' % (repr(invMat),)
-    print 'recipVolume: det:\n%s' % (repr(np.linalg.det( invMat)),)
-    print 'recipVolume: %g' % (resObj.recipVolume,)
-
-  # Density
-  # xxx better: get atomic weights from periodic table
-  volCm = resObj.finalVolumeCalc_ang3 / (1.e8)**3    # 10**8 Angstrom per cm
-  totMass = np.dot( atomTypeMrr['atomspertype'], atomTypeMrr['mass'])
-  totMassGm = totMass *  1.660538921e-24        #  1.660538921e-24 g / amu
-  resObj.finalDensity_g_cm3 = totMassGm / volCm
-  if bugLev >= 5:
-    print 'volCm: %g' % (volCm,)
-    print 'totMassGm: %g' % (totMassGm,)
-    print 'finalDensity_g_cm3: %g' % (resObj.finalDensity_g_cm3,)
-
-
-  if bugLev >= 5: print '\n===== last calc forces =====\n'
-
-  resObj.finalForceMat_ev_ang = getRawArray(
-    root, 'calculation[last()]/varray[@name=\'forces\']/v',
-    0, 3, float)
-  if bugLev >= 5:
-    print 'finalForceMat_ev_ang:\n%s' % (repr(resObj.finalForceMat_ev_ang),)
-
-  # Get stress
-  resObj.finalStressMat_kbar = getRawArray(
-    root, 'calculation[last()]/varray[@name=\'stress\']/v',
-    3, 3, float)
-  if bugLev >= 5:
-    print 'finalStressMat_kbar:\n%s' % (repr(resObj.finalStressMat_kbar),)
-
-  # Calc pressure
-  # xxx Caution: we do not include the non-diag terms in:
-  #   VASP: force.F: FORCE_AND_STRESS: line 1410:
-  #     PRESS=(TSIF(1,1)+TSIF(2,2)+TSIF(3,3))/3._q &
-  #        &      -DYN%PSTRESS/(EVTOJ*1E22_q)*LATT_CUR%OMEGA
-  diag = [resObj.finalStressMat_kbar[ii][ii] for ii in range(3)]
-  resObj.finalPressure_kbar = sum( diag) / 3.0
-  if bugLev >= 5: print 'finalPressure_kbar: %g' % (resObj.finalPressure_kbar,)
-
-
-  if bugLev >= 5: print '\n===== eigenvalues and occupancies =====\n'
-
-  # PyLada: eigenvalues
-  eigenMrr = getArrayByPath(
-    bugLev, root, 'calculation[last()]/eigenvalues/array')
-  if bugLev >= 5:
-    print '\neigenMrr beg =====:'
-    printMrr( eigenMrr)
-    print '\neigenMrr end =====:'
-    for isp in range( resObj.numSpin):
-      print '\neigenMrr: eigene[isp=%d][0]\n%s' \
-        % (isp, repr(eigenMrr['eigene'][isp][0]),)
-      print '\neigenMrr: occ[isp=%d][0]\n%s' \
-        % (isp, repr(eigenMrr['occ'][isp][0]),)
-
-  shp = eigenMrr['_dimLens']
-  if shp[0] != resObj.numSpin: throwerr('numSpin mismatch')
-  if shp[1] != resObj.numKpoint: throwerr('numKpoint mismatch')
-  if shp[2] != prmNumBand:     # see caution at prmNumBand, above
-    print('numBand mismatch: prm: %d  shape: %d  inFile: %s' \
-      % (prmNumBand, shp[2], inFile,))
-  resObj.numBand = shp[2]
-
-  resObj.eigenMat = eigenMrr['eigene']
-  # Caution: for non-magnetic (numSpin==1),
-  #   OUTCAR has occupMat values = 2, while vasprun.xml has values = 1.
-  # For magnetic (numSpin==2), both OUTCAR and vasprun.xml have 1.
-  resObj.occupMat = eigenMrr['occ']
-  if resObj.numSpin == 1: resObj.occupMat *= 2
-  if bugLev >= 5:
-    print 'resObj.eigenMat.shape: ', resObj.eigenMat.shape
-    print 'resObj.occupMat.shape: ', resObj.occupMat.shape
+  if 'atominfo' in wanted:
+    if bugLev >= 5: print '\n===== atom info =====\n'
+    prof.mark('atominfo')
+
+    # atomTypeMrr = map containing array.  Example (some whitespace omitted):
+    #   _dimLens: [2]
+    #   _dimNames: ['type']
+    #   _fieldNames: ['atomspertype' 'element' 'mass' 'valence' 'pseudopotential']
+    #   _fieldTypes: ['i' 's' 'f' 'f' 's']
+    #   atomspertype: [1 4]
+    #   element: ['C ' 'Fe']
+    #   mass: [ 12.011  55.847]
+    #   valence: [ 4.  8.]
+    #   pseudopotential: [' PAW_PBE C_s 06Sep2000 ' ' PAW_PBE Fe 06Sep2000 ']
+
+    atomInfoNode = getAnchor( anchors, 'atominfo')
+    atomTypeMrr = getArrayByPath(
+      bugLev, atomInfoNode, 'array[@name=\'atomtypes\']')
+    resObj.typeNames       = atomTypeMrr['element']
+    resObj.typeNums        = atomTypeMrr['atomspertype']
+    resObj.typeMasses_amu  = atomTypeMrr['mass']
+    resObj.typeValences    = atomTypeMrr['valence']
+    resObj.typePseudos     = atomTypeMrr['pseudopotential']
+
+    if bugLev >= 5:
+      print '\natomTypeMrr:'
+      printMrr( atomTypeMrr)
+      print '\nunsorted atomTypes:'
+      print 'typeNames: %s' % ( resObj.typeNames,)
+      print 'typeNums: %s' % ( resObj.typeNums,)
+      print 'typeMasses_amu: %s' % ( resObj.typeMasses_amu,)
+      print 'typeValences: %s' % ( resObj.typeValences,)
+      print 'typePseudos: %s' % ( resObj.typePseudos,)
+
+    # Sort parallel arrays typeNames, typeNums, etc,
+    # by typeNames alphabetic order,
+    # using an index sort with tpIxs.
+    # In rare cases like icsd_024360.cif/hs-ferro
+    # the names are out of order.
+    # Sort to set tpIxs[newIx] == oldIx.
+    ntype = len( resObj.typeNames)
+    tpIxs = range( ntype)
+    def sortFunc( ia, ib):
+      return cmp( resObj.typeNames[ia], resObj.typeNames[ib])
+    tpIxs.sort( sortFunc)
+    if bugLev >= 5:
+      print 'tpIxs: %s' % (tpIxs,)
+
+    resObj.typeNames      = [resObj.typeNames[ix] for ix in tpIxs]
+    resObj.typeNums       = [resObj.typeNums[ix] for ix in tpIxs]
+    resObj.typeMasses_amu = [resObj.typeMasses_amu[ix] for ix in tpIxs]
+    resObj.typeValences   = [resObj.typeValences[ix] for ix in tpIxs]
+    resObj.typePseudos    = [resObj.typePseudos[ix] for ix in tpIxs]
+
+    if bugLev >= 5:
+      print '\nsorted atomTypes:'
+      print 'typeNames: %s' % ( resObj.typeNames,)
+      print 'typeNums: %s' % ( resObj.typeNums,)
+      print 'typeMasses_amu: %s' % ( resObj.typeMasses_amu,)
+      print 'typeValences: %s' % ( resObj.typeValences,)
+      print 'typePseudos: %s' % ( resObj.typePseudos,)
+
+    # totalValence = sum( count[i] * valence[i])
+    # PyLada calls this valence.
+    resObj.totalValence = np.dot( resObj.typeNums, resObj.typeValences)
+    if bugLev >= 5: print 'totalValence: %g' % (resObj.totalValence,)
+
+    if resObj.numElectron != resObj.totalValence:
+      throwerr('%g == numElectron != totalValence == %g' \
+        % (resObj.numElectron, resObj.totalValence,))
+
+    # atomMrr = map containing array.  Example:
+    #   _dimLens: [5]
+    #   _dimNames: ['ion']
+    #   _fieldNames: ['element' 'atomtype']
+    #   _fieldTypes: ['s' 'i']
+    #   element: ['C ' 'Fe' 'Fe' 'Fe' 'Fe']
+    #   atomtype: [1 2 2 2 2]
+
+    atomMrr = getArrayByPath(
+      bugLev, atomInfoNode, 'array[@name=\'atoms\']')
+    atomNames = atomMrr['element']
+    atomTypes = [ix - 1 for ix in atomMrr['atomtype']]  # change to origin 0
+    natom = len( atomTypes)
+
+    if bugLev >= 5:
+      print '\natomMrr:'
+      printMrr( atomMrr)
+      print '\nunsorted atoms:'
+      print 'atomNames: %s' % ( atomNames,)
+      print 'atomTypes: %s' % ( atomTypes,)
+
+    # The permutation array tpIxs maps tpIxs[newIx] = oldIx.
+    # Invert it to get tpIxInvs[oldIx] = newIx.
+    tpIxInvs = ntype * [0]
+    for ii in range( ntype):
+      tpIxInvs[ tpIxs[ii]] = ii
+    if bugLev >= 5:
+      print 'tpIxInvs: %s' % (tpIxInvs,)
+
+    # Sort atomNames, atomTypes by tpIxInvs[atomtype] so they
+    # are in the same order as typenames, typenums, etc, above.
+    # Currently atomType[i] = old index num into atomTypes.
+    # We want to sort by new index num into atomTypes.
+
+    atomIxs = range( natom)
+    def sortFunc( ia, ib):
+      return cmp( tpIxInvs[ atomTypes[ ia]], tpIxInvs[ atomTypes[ ib]])
+    atomIxs.sort( sortFunc)
+    atomNames = [atomNames[ix] for ix in atomIxs]
+    atomTypes = [tpIxInvs[ atomTypes[ix]] for ix in atomIxs]
+
+    if bugLev >= 5:
+      print '\natomIxs: %s' % (atomIxs,)
+      print '\nsorted atoms:'
+      print 'atomNames: %s' % ( atomNames,)
+      print 'atomTypes: %s' % ( atomTypes,)
+
+    resObj.atomNames = atomNames
+    resObj.atomTypes = atomTypes
+    resObj.atomMasses_amu = natom * [None]
+    resObj.atomValences = natom * [None]
+    resObj.atomPseudos = natom * [None]
+    for ii in range( natom):
+      ix = atomTypes[ii]
+      if resObj.atomNames[ii] != resObj.typeNames[ix]:
+        throwerr('name mismatch')
+      resObj.atomMasses_amu[ii] = resObj.typeMasses_amu[ix]
+      resObj.atomValences[ii] = resObj.typeValences[ix]
+      resObj.atomPseudos[ii] = resObj.typePseudos[ix]
+    if bugLev >= 5:
+      print 'atomNames: %s' % ( resObj.atomNames,)
+      print 'atomTypes: %s' % ( resObj.atomTypes,)
+      print 'atomMasses_amu: %s' % ( resObj.atomMasses_amu,)
+      print 'atomValences: %s' % ( resObj.atomValences,)
+      print 'atomPseudos: %s' % ( resObj.atomPseudos,)
+
+    # Make sure typenames are in alphabetic order
+    for ii in range(len(resObj.typeNames) - 1):
+      if resObj.typeNames[ii] > resObj.typeNames[ii+1]:
+        throwerr('typeNames not in order')
+
+    # Make sure atomnames are in alphabetic order
+    for ii in range(len(resObj.atomNames) - 1):
+      if resObj.atomNames[ii] > resObj.atomNames[ii+1]:
+        throwerr('atomNames not in order')
+
+  if 'structures' in wanted:
+    if bugLev >= 5: print '\n===== initial structure =====\n'
+    prof.mark('structures')
+
+    # Initial structure
+    # PyLada: vasp/extract/base.py: initial_structure()
+    # OUTCAR: uses the appended INITIAL STRUCTURE section.
+    initNode = getAnchor( anchors, 'initialpos')
+    lst = initNode.findall('crystal/varray[@name=\'basis\']/v')
+    if bugLev >= 5: print 'len(lst) a:', len(lst)
+
+    # initial_structure
+    # POSCAR specifies each basis vector as one row.
+    # So does vasprun.xml.
+    # But PyLada's structure.cell is the transpose: each basis vec is a column.
+    resObj.initialBasisMat = getRawArray(
+      initNode, 'crystal/varray[@name=\'basis\']/v',
+      3, 3, float)
+    resObj.initialRecipBasisMat = getRawArray(
+      initNode, 'crystal/varray[@name=\'rec_basis\']/v',
+      3, 3, float)
+    resObj.initialFracPosMat = getRawArray(
+      initNode, 'varray[@name=\'positions\']/v',
+      0, 3, float)    # xxx nrow should be natom
+
+    resObj.initialCartPosMat = np.dot(
+      resObj.initialFracPosMat, resObj.initialBasisMat)
+    # xxx mult by scale factor?
+
+    if bugLev >= 5:
+      print 'initialBasisMat:\n%s' % (repr(resObj.initialBasisMat),)
+      print 'initialRecipBasisMat:\n%s' % (repr(resObj.initialRecipBasisMat),)
+      print 'initialFracPosMat:\n%s' % (repr(resObj.initialFracPosMat),)
+      print 'initialCartPosMat:\n%s' % (repr(resObj.initialCartPosMat),)
+
+
+
+    if bugLev >= 5: print '\n===== final structure =====\n'
+
+    # structure == final pos
+    # POSCAR and OUTCAR specify each basis vector as one row.
+    # So does vasprun.xml.
+    # But PyLada's structure.cell is the transpose: each basis vec is a column.
+    #
+    # In vasprun.xml and OUTCAR, the basis vectors are rows.
+    #
+    # VASP writes finalpos after the last calculation, so a
+    # truncated file has none: use the structure of the
+    # last complete calculation.
+    if isTruncated and 'finalpos' not in anchors:
+      finalNode = getAnchor( anchors, 'lastCalc').find('structure')
+      if finalNode == None:
+        throwerr('truncated file: last calculation has no structure')
+    else: finalNode = getAnchor( anchors, 'finalpos')
+    resObj.finalBasisMat = getRawArray(
+      finalNode, 'crystal/varray[@name=\'basis\']/v',
+      3, 3, float)
+    resObj.finalRecipBasisMat = getRawArray(
+      finalNode, 'crystal/varray[@name=\'rec_basis\']/v',
+      3, 3, float)
+    resObj.finalFracPosMat = getRawArray(
+      finalNode, 'varray[@name=\'positions\']/v',
+      0, 3, float)    # xxx nrow should be natom
+
+    resObj.finalCartPosMat = np.dot(
+      resObj.finalFracPosMat, resObj.finalBasisMat)
+    # xxx mult by scale factor?
+
+    if bugLev >= 5:
+      print 'finalBasisMat:\n%s' % (repr(resObj.finalBasisMat),)
+      print 'finalRecipBasisMat:\n%s' % (repr(resObj.finalRecipBasisMat),)
+      print 'finalFracPosMat:\n%s' % (repr(resObj.finalFracPosMat),)
+      print 'finalCartPosMat:\n%s' % (repr(resObj.finalCartPosMat),)
+
+
+
+  if 'kpoints' in wanted:
+    if bugLev >= 5: print '\n===== kpoints =====\n'
+    prof.mark('kpoints')
+
+    # kpoint coordinates.
+    # Not in PyLada?
+    kpointNode = getAnchor( anchors, 'kpoints')
+    resObj.kpointFracMat = getRawArray(
+      kpointNode, 'varray[@name=\'kpointlist\']/v',
+      0, 3, float)
+    resObj.numKpoint = resObj.kpointFracMat.shape[0]
+
+    resObj.kpointCartMat \
+      = np.dot( resObj.kpointFracMat, resObj.initialRecipBasisMat)
+    if bugLev >= 5:
+      print 'numKpoint: %g' % (resObj.numKpoint,)
+      print 'kpointFracMat:\n%s' % (repr(resObj.kpointFracMat),)
+      print 'kpointCartMat:\n%s' % (repr(resObj.kpointCartMat),)
+
+    # This is what PyLada calls multiplicity.
+    # The only diff is the scaling.
+    #   sum( Pylada multiplicity) = numKpoint
+    #   sum( our kpointWeights) = 1.0
+    resObj.kpointWeights = getRawArray(
+      kpointNode, 'varray[@name=\'weights\']/v',
+      0, 1, float)
+    resObj.kpointWeights = resObj.kpointWeights[:,0]   # Only 1 col in 2d array
+    if resObj.kpointWeights.shape[0] != resObj.numKpoint:
+      throwerr('numKpoint mismatch')
+    if bugLev >= 5:
+      print 'kpointWeights:\n%s' % (repr(resObj.kpointWeights),)
+      print 'kpointWeights sum: %g' % (sum(resObj.kpointWeights),)
+
+
+
+  if 'structures' in wanted:
+    if bugLev >= 5: print '\n===== final volume and density =====\n'
+    prof.mark('structures')
+
+    # volume, Angstrom^3
+    # The scale is hard coded as 1.0 in PyLada crystal/read.py,
+    # in both icsd_cif_a and icsd_cif_b.
+    volScale = 1.0
+    resObj.finalVolumeCalc_ang3 = abs( np.linalg.det(
+      volScale * resObj.finalBasisMat))
+    if bugLev >= 5:
+      print 'finalVolumeCalc_ang3: %g' % (resObj.finalVolumeCalc_ang3,)
+
+    resObj.finalVolume_ang3 = getScalar(
+      finalNode, 'crystal/i[@name=\'volume\']', float)
+    if bugLev >= 5:
+      print 'finalVolume_ang3: %g' % (resObj.finalVolume_ang3,)
+
+    # reciprocal space volume, * (2*pi)**3
+    # As in PyLada.
+    invMat = np.linalg.inv( volScale * resObj.finalBasisMat)
+    resObj.recipVolume = abs( np.linalg.det( invMat)) * (2 * np.pi)**3
+    if bugLev >= 5:
+      print 'recipVolume: origMat:\n%s' \
+        % (repr(volScale * resObj.finalBasisMat),)
+      print 'recipVolume: invMat:\n%s' % (repr(invMat),)
+      print 'recipVolume: det:\n%s' % (repr(np.linalg.det( invMat)),)
+      print 'recipVolume: %g' % (resObj.recipVolume,)
+
+    # Density
+    # xxx better: get atomic weights from periodic table
+    volCm = resObj.finalVolumeCalc_ang3 / (1.e8)**3    # 10**8 Angstrom per cm
+    totMass = np.dot( atomTypeMrr['atomspertype'], atomTypeMrr['mass'])
+    totMassGm = totMass *  1.660538921e-24        #  1.660538921e-24 g / amu
+    resObj.finalDensity_g_cm3 = totMassGm / volCm
+    if bugLev >= 5:
+      print 'volCm: %g' % (volCm,)
+      print 'totMassGm: %g' % (totMassGm,)
+      print 'finalDensity_g_cm3: %g' % (resObj.finalDensity_g_cm3,)
+
+
+  lastCalcNode = getAnchor( anchors, 'lastCalc')
+
+  if 'forces' in wanted:
+    if bugLev >= 5: print '\n===== last calc forces =====\n'
+    prof.mark('forces')
+
+    resObj.finalForceMat_ev_ang = getRawArray(
+      lastCalcNode, 'varray[@name=\'forces\']/v',
+      0, 3, float)
+    if bugLev >= 5:
+      print 'finalForceMat_ev_ang:\n%s' % (repr(resObj.finalForceMat_ev_ang),)
+
+    # Get stress
+    resObj.finalStressMat_kbar = getRawArray(
+      lastCalcNode, 'varray[@name=\'stress\']/v',
+      3, 3, float)
+    if bugLev >= 5:
+      print 'finalStressMat_kbar:\n%s' % (repr(resObj.finalStressMat_kbar),)
+
+    # Calc pressure
+    # xxx Caution: we do not include the non-diag terms in:
+    #   VASP: force.F: FORCE_AND_STRESS: line 1410:
+    #     PRESS=(TSIF(1,1)+TSIF(2,2)+TSIF(3,3))/3._q &
+    #        &      -DYN%PSTRESS/(EVTOJ*1E22_q)*LATT_CUR%OMEGA
+    diag = [resObj.finalStressMat_kbar[ii][ii] for ii in range(3)]
+    resObj.finalPressure_kbar = sum( diag) / 3.0
+    if bugLev >= 5:
+      print 'finalPressure_kbar: %g' % (resObj.finalPressure_kbar,)
+
+
+  if 'eigen' in wanted:
+    if bugLev >= 5: print '\n===== eigenvalues and occupancies =====\n'
+    prof.mark('eigen')
+
+    # PyLada: eigenvalues
+    eigenMrr = getArrayByPath(
+      bugLev, lastCalcNode, 'eigenvalues/array')
+    if bugLev >= 5:
+      print '\neigenMrr beg =====:'
+      printMrr( eigenMrr)
+      print '\neigenMrr end =====:'
+      for isp in range( resObj.numSpin):
+        print '\neigenMrr: eigene[isp=%d][0]\n%s' \
+          % (isp, repr(eigenMrr['eigene'][isp][0]),)
+        print '\neigenMrr: occ[isp=%d][0]\n%s' \
+          % (isp, repr(eigenMrr['occ'][isp][0]),)
+
+    shp = eigenMrr['_dimLens']
+    if shp[0] != resObj.numSpin: throwerr('numSpin mismatch')
+    if shp[1] != resObj.numKpoint: throwerr('numKpoint mismatch')
+    if shp[2] != prmNumBand:     # see caution at prmNumBand, above
+      print('numBand mismatch: prm: %d  shape: %d  inFile: %s' \
+        % (prmNumBand, shp[2], inFile,))
+    resObj.numBand = shp[2]
+
+    resObj.eigenMat = eigenMrr['eigene']
+    # Caution: for non-magnetic (numSpin==1),
+    #   OUTCAR has occupMat values = 2, while vasprun.xml has values = 1.
+    # For magnetic (numSpin==2), both OUTCAR and vasprun.xml have 1.
+    resObj.occupMat = eigenMrr['occ']
+    if resObj.numSpin == 1: resObj.occupMat *= 2
+    if bugLev >= 5:
+      print 'resObj.eigenMat.shape: ', resObj.eigenMat.shape
+      print 'resObj.occupMat.shape: ', resObj.occupMat.shape
   
-  # Compare projected and standard eigenvalues
-  getProjected = False
-  if getProjected:
-    for isp in range( resObj.numSpin):
-      projEigenMrr = getArrayByPath(
-        bugLev, root, 'calculation[last()]/projected/eigenvalues/array')
+    # Compare projected and standard eigenvalues
+    getProjected = False
+    if getProjected:
+      for isp in range( resObj.numSpin):
+        projEigenMrr = getArrayByPath(
+          bugLev, lastCalcNode, 'projected/eigenvalues/array')
       
-      # eigs and projected eigs are identical
-      eigs = resObj.eigenMrr['eigene'][isp]
-      peigs = projEigenMrr['eigene'][isp]
-      if bugLev >= 5:
-        print 'Compare iegs, peigs for isp: %d' % (isp,)
-        print '  eigs.shape:  ', eigs.shape
-        print '  peigs.shape: ', peigs.shape
-        print '  eigs[0,:]: ', eigs[0,:]
-        print '  peigs[0,:]: ', peigs[0,:]
-        print '  Diff projeigs - eigs: max maxabs: %g' \
-          % (max( map( max, abs(peigs - eigs))),)
-
-      # occs and projected occs are identical
-      occs = resObj.eigenMrr['occ'][isp]
-      poccs = projEigenMrr['occ'][isp]
-      if bugLev >= 5:
-        print 'Compare occs, poccs for isp: %d' % (isp,)
-        print '  occs.shape:  ', occs.shape
-        print '  poccs.shape: ', poccs.shape
-        print '  occs[0,:]: ', occs[0,:]
-        print '  poccs[0,:]: ', poccs[0,:]
-        print '  Diff projoccs - occs: max maxabs: %g' \
-          % (max( map( max, abs(poccs - occs))),)
-
-  if bugLev >= 5: print '\n===== misc junk =====\n'
-
-  # PyLada: vasp/extract/base.py: is_gw()
-  resObj.isGw = False
-  if resObj.algo in  ['gw', 'gw0', 'chi', 'scgw', 'scgw0']: resObj.isGw = True
-  if bugLev >= 5: print 'isGw: %s' % (resObj.isGw,)
-
-  # PyLada: vasp/extract/base.py: is_dft()
-  resObj.isDft = not resObj.isGw
-  if bugLev >= 5: print 'isDft: %s' % (resObj.isDft,)
-
-  # functional: comes from appended FUNCTIONAL.
-
-  # success: look for final section
-  #   General timing and accounting informations for this job:
-
-  # xxx skip: Hubbard / NLEP
+        # eigs and projected eigs are identical
+        eigs = resObj.eigenMrr['eigene'][isp]
+        peigs = projEigenMrr['eigene'][isp]
+        if bugLev >= 5:
+          print 'Compare iegs, peigs for isp: %d' % (isp,)
+          print '  eigs.shape:  ', eigs.shape
+          print '  peigs.shape: ', peigs.shape
+          print '  eigs[0,:]: ', eigs[0,:]
+          print '  peigs[0,:]: ', peigs[0,:]
+          print '  Diff projeigs - eigs: max maxabs: %g' \
+            % (max( map( max, abs(peigs - eigs))),)
+
+        # occs and projected occs are identical
+        occs = resObj.eigenMrr['occ'][isp]
+        poccs = projEigenMrr['occ'][isp]
+        if bugLev >= 5:
+          print 'Compare occs, poccs for isp: %d' % (isp,)
+          print '  occs.shape:  ', occs.shape
+          print '  poccs.shape: ', poccs.shape
+          print '  occs[0,:]: ', occs[0,:]
+          print '  poccs[0,:]: ', poccs[0,:]
+          print '  Diff projoccs - occs: max maxabs: %g' \
+            % (max( map( max, abs(poccs - occs))),)
+
+  if 'incar' in wanted:
+    if bugLev >= 5: print '\n===== misc junk =====\n'
+    prof.mark('incar')
+
+    # PyLada: vasp/extract/base.py: is_gw()
+    resObj.isGw = False
+    if resObj.algo in  ['gw', 'gw0', 'chi', 'scgw', 'scgw0']:
+      resObj.isGw = True
+    if bugLev >= 5: print 'isGw: %s' % (resObj.isGw,)
+
+    # PyLada: vasp/extract/base.py: is_dft()
+    resObj.isDft = not resObj.isGw
+    if bugLev >= 5: print 'isDft: %s' % (resObj.isDft,)
+
+    # functional: comes from appended FUNCTIONAL.
+
+    # success: look for final section
+    #   General timing and accounting informations for this job:
+
+    # xxx skip: Hubbard / NLEP
 
   
 
   if bugLev >= 5: print '\n===== energy, efermi0 =====\n'
+  prof.mark('energy')
 
   resObj.energyNoEntrp = getScalar(
-    root, 'calculation[last()]/energy/i[@name=\'e_wo_entrp\']', float)
+    lastCalcNode, 'energy/i[@name=\'e_wo_entrp\']', float)
 
   # efermi0
   # PyLada uses an algorithm to compare the sum of occupancies
@@ -687,56 +853,70 @@ def parseXml( bugLev, inFile, maxLev, resObj):
   #   PyLada: 5.8574
   #   XML:    5.93253
 
-  resObj.efermi0 = getScalar(
-    root, 'calculation[last()]/dos/i[@name=\'efermi\']', float)
-  if bugLev >= 5: print 'efermi0: %g' % (resObj.efermi0,)
+  if isTruncated and lastCalcNode.find('dos') == None: resObj.efermi0 = None
+  else: resObj.efermi0 = getScalar(
+    lastCalcNode, 'dos/i[@name=\'efermi\']', float)
+  if bugLev >= 5: print 'efermi0: %s' % (resObj.efermi0,)
 
 
-  if bugLev >= 5: print '\n===== cbMin, vbMax, bandgap =====\n'
+  if 'dos' in wanted:
+    if bugLev >= 5: print '\n===== density of states =====\n'
+    prof.mark('dos')
+    dosNodes = lastCalcNode.findall('dos')
+    if len(dosNodes) != 1: throwerr('dos not found')
+    (resObj.dosTotalMat, resObj.dosTotalFields,
+      resObj.dosPartialMat, resObj.dosPartialFields) = getDos(
+      bugLev, dosNodes[0], resObj.numSpin, len( resObj.atomNames), dosMode)
 
-  # Find cbm = min of eigs >  efermi0
-  # Find vbm = max of eigs <= efermi0
 
-  cbms = resObj.numSpin * [np.inf]
-  vbms = resObj.numSpin * [-np.inf]
-  cbmKpis = resObj.numSpin * [None]
-  vbmKpis = resObj.numSpin * [None]
+  if 'eigen' in wanted:
+    if bugLev >= 5: print '\n===== cbMin, vbMax, bandgap =====\n'
+    prof.mark('bandEdges')
 
-  for isp in range( resObj.numSpin):
-    eigs = resObj.eigenMat[isp]
-    for ikp in range( resObj.numKpoint):
-      for iband in range( resObj.numBand):
-        val = eigs[ikp][iband]
-        if val > resObj.efermi0:
-          cbms[isp] = min( cbms[isp], val)
-          cbmKpis[isp] = ikp
-        if val <= resObj.efermi0:
-          vbms[isp] = max( vbms[isp], val)
-          vbmKpis[isp] = ikp
+    # Find cbm = min of eigs >  efermi0
+    # Find vbm = max of eigs <= efermi0
 
-  cbms = map( float, cbms)     # change type from numpy.float64 to float
-  vbms = map( float, vbms)     # change type from numpy.float64 to float
-
-  resObj.cbms = cbms
-  resObj.vbms = vbms
-  resObj.cbmKpis = cbmKpis
-  resObj.vbmKpis = vbmKpis
-  resObj.cbMin = min( cbms)       # This is PyLada's cbm
-  resObj.vbMax = max( vbms)       # This is PyLada's vbm
-
-  resObj.bandgaps = [ (cbms[ii] - vbms[ii]) for ii in range( resObj.numSpin)]
-  resObj.bandgapa = min( resObj.bandgaps)
-  resObj.bandgap  = resObj.cbMin - resObj.vbMax   # This is PyLada version
-
-  if bugLev >= 5:
-    print 'cbmKpis: %s  cbms: %s' % (cbmKpis, cbms,)
-    print 'vbmKpis: %s  vbms: %s' % (vbmKpis, vbms,)
-    print 'cbMin: %g' % (resObj.cbMin,)
-    print 'vbMax: %g' % (resObj.vbMax,)
-    print 'bandgaps: %s' % (resObj.bandgaps,)
-    print 'bandgapa: %g' % (resObj.bandgapa,)
-    print 'bandgap:  %g' % (resObj.bandgap,)
+    cbms = resObj.numSpin * [np.inf]
+    vbms = resObj.numSpin * [-np.inf]
+    cbmKpis = resObj.numSpin * [None]
+    vbmKpis = resObj.numSpin * [None]
 
+    for isp in range( resObj.numSpin):
+      eigs = resObj.eigenMat[isp]
+      for ikp in range( resObj.numKpoint):
+        for iband in range( resObj.numBand):
+          val = eigs[ikp][iband]
+          if val > resObj.efermi0:
+            cbms[isp] = min( cbms[isp], val)
+            cbmKpis[isp] = ikp
+          if val <= resObj.efermi0:
+            vbms[isp] = max( vbms[isp], val)
+            vbmKpis[isp] = ikp
+
+    cbms = map( float, cbms)     # change type from numpy.float64 to float
+    vbms = map( float, vbms)     # change type from numpy.float64 to float
+
+    resObj.cbms = cbms
+    resObj.vbms = vbms
+    resObj.cbmKpis = cbmKpis
+    resObj.vbmKpis = vbmKpis
+    resObj.cbMin = min( cbms)       # This is PyLada's cbm
+    resObj.vbMax = max( vbms)       # This is PyLada's vbm
+
+    resObj.bandgaps = [ (cbms[ii] - vbms[ii]) for ii in range( resObj.numSpin)]
+    resObj.bandgapa = min( resObj.bandgaps)
+    resObj.bandgap  = resObj.cbMin - resObj.vbMax   # This is PyLada version
+
+    if bugLev >= 5:
+      print 'cbmKpis: %s  cbms: %s' % (cbmKpis, cbms,)
+      print 'vbmKpis: %s  vbms: %s' % (vbmKpis, vbms,)
+      print 'cbMin: %g' % (resObj.cbMin,)
+      print 'vbMax: %g' % (resObj.vbMax,)
+      print 'bandgaps: %s' % (resObj.bandgaps,)
+      print 'bandgapa: %g' % (resObj.bandgapa,)
+      print 'bandgap:  %g' % (resObj.bandgap,)
+
+  prof.mark( None)
 
 
   # xxx
@@ -981,6 +1161,624 @@ def parseXml( bugLev, inFile, maxLev, resObj):
 
 #====================================================================
 
+class TrajBuilder:
+  '''
+  Collects the ionic trajectory of a VASP run, one ``<calculation>``
+  element at a time, into preallocated numpy arrays.
+
+  If the number of steps is not known in advance, as when
+  streaming, the arrays start small and double in capacity
+  as needed.  :meth:`setResults` trims them to the number of steps.
+
+  The per step results are:
+
+  ======================    ===================  ==========================
+  resObj attribute          shape                source in <calculation>
+  ======================    ===================  ==========================
+  trajBasisMats             [nstep, 3, 3]        structure basis
+  trajFracPosMats           [nstep, natom, 3]    structure positions
+  trajForceMats_ev_ang      [nstep, natom, 3]    varray forces
+  trajStressMats_kbar       [nstep, 3, 3]        varray stress.  NaN if
+                                                 the step has no stress.
+  trajFreeEnergies          [nstep]              energy e_fr_energy
+  trajEnergyNoEntrps        [nstep]              energy e_wo_entrp
+  trajEnergySigma0s         [nstep]              energy e_0_energy
+  trajNumElecSteps          [nstep]              number of scstep elements
+  ======================    ===================  ==========================
+
+  Also trajNumStep, the number of steps.
+  '''
+
+  # (attribute name, shape of one step, dtype).  natom is filled in.
+  fieldSpecs = [
+    ('trajBasisMats',         [3, 3],        float),
+    ('trajFracPosMats',       ['natom', 3],  float),
+    ('trajForceMats_ev_ang',  ['natom', 3],  float),
+    ('trajStressMats_kbar',   [3, 3],        float),
+    ('trajFreeEnergies',      [],            float),
+    ('trajEnergyNoEntrps',    [],            float),
+    ('trajEnergySigma0s',     [],            float),
+    ('trajNumElecSteps',      [],            int),
+  ]
+
+  def __init__( self, bugLev, capacity=16):
+    '''
+    **Parameters**:
+
+    * bugLev (int): Debug level.  Normally 0.
+    * capacity (int): initial number of steps to allocate.
+    '''
+    self.bugLev = bugLev
+    self.capacity = max( 1, capacity)
+    self.numStep = 0
+    self.natom = None
+    self.mats = None          # map: attribute name -> array
+    self.errMsg = None        # first error found by addCalc
+
+  def addCalc( self, calcNode):
+    '''
+    Appends the results of one ``<calculation>`` element.
+
+    Errors are saved in self.errMsg, and later steps are ignored,
+    so that when streaming an error here is not reported
+    as invalid xml.  :meth:`setResults` raises it.
+    '''
+    if self.errMsg != None: return
+    try:
+      self.addCalcSub( calcNode)
+    except Exception, exc:
+      self.errMsg = 'TrajBuilder: step %d: %s' % (self.numStep, exc,)
+
+  def addCalcSub( self, calcNode):
+    natom = self.natom
+    if natom == None: natom = 0       # allow any number on the first step
+    vals = {
+      'trajBasisMats': getRawArray( calcNode,
+        'structure/crystal/varray[@name=\'basis\']/v', 3, 3, float),
+      'trajFracPosMats': getRawArray( calcNode,
+        'structure/varray[@name=\'positions\']/v', natom, 3, float),
+      'trajFreeEnergies': getScalar( calcNode,
+        'energy/i[@name=\'e_fr_energy\']', float),
+      'trajEnergyNoEntrps': getScalar( calcNode,
+        'energy/i[@name=\'e_wo_entrp\']', float),
+      'trajEnergySigma0s': getScalar( calcNode,
+        'energy/i[@name=\'e_0_energy\']', float),
+      'trajNumElecSteps': len( calcNode.findall('scstep')),
+    }
+    natom = vals['trajFracPosMats'].shape[0]
+    vals['trajForceMats_ev_ang'] = getRawArray( calcNode,
+      'varray[@name=\'forces\']/v', natom, 3, float)
+    if len( calcNode.findall('varray[@name=\'stress\']')) == 0:
+      vals['trajStressMats_kbar'] = np.nan    # no stress, as for ISIF=0
+    else:
+      vals['trajStressMats_kbar'] = getRawArray( calcNode,
+        'varray[@name=\'stress\']/v', 3, 3, float)
+
+    if self.mats == None:
+      self.natom = natom
+      self.mats = self.allocMats( self.capacity)
+    elif self.numStep == self.capacity:
+      self.capacity *= 2
+      newMats = self.allocMats( self.capacity)
+      for (name, mat) in self.mats.items():
+        newMats[name][:self.numStep] = mat[:self.numStep]
+      self.mats = newMats
+
+    for (name, mat) in self.mats.items():
+      mat[self.numStep] = vals[name]
+    self.numStep += 1
+
+  def allocMats( self, capacity):
+    mats = {}
+    for (name, shape, dtype) in self.fieldSpecs:
+      shape = [capacity] + [self.natom if dim == 'natom' else dim
+        for dim in shape]
+      mats[name] = np.empty( shape, dtype=dtype)
+    return mats
+
+  def setResults( self, resObj):
+    '''
+    Sets the traj* attributes of resObj, trimmed to the number
+    of steps, or raises the first error found by :meth:`addCalc`.
+    '''
+    if self.errMsg != None: throwerr( self.errMsg)
+    if self.numStep == 0: throwerr('TrajBuilder: no calculations found')
+    for (name, shape, dtype) in self.fieldSpecs:
+      mat = self.mats[name]
+      if self.numStep < self.capacity: mat = mat[:self.numStep].copy()
+      setattr( resObj, name, mat)
+    resObj.trajNumStep = self.numStep
+    if self.bugLev >= 5:
+      print 'TrajBuilder: numStep: %d  natom: %d  capacity: %d' \
+        % (self.numStep, self.natom, self.capacity,)
+
+#====================================================================
+
+def getDos( bugLev, dosNode, numSpin, natom, dosMode):
+  '''
+  Gets the total and projected density of states from
+  the ``<dos>`` element of a calculation, as float32 arrays.
+
+  Each ``<set comment='spin N'>`` block is parsed on its own
+  and copied into its slice of the preallocated result,
+  so no per-block arrays are kept.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * dosNode (xml.etree.ElementTree.Element): the ``<dos>`` element.
+  * numSpin (int): number of spins.
+  * natom (int): number of atoms.
+  * dosMode (str): 'all' to get the total and projected DOS,
+    or 'total' to get only the total DOS.
+
+  **Returns**:
+
+  * tuple (totalMat, totalFields, partialMat, partialFields):
+
+    * totalMat: float32 array [numSpin, nedos, ncol], or None
+      if there is no ``<total>``.
+    * totalFields: the ncol field names, like
+      ['energy', 'total', 'integrated'].
+    * partialMat: float32 array [natom, numSpin, nedos, norb], or None
+      if dosMode is 'total' or there is no ``<partial>``
+      (VASP writes it only if LORBIT is set).
+      The energy column is omitted, since it repeats
+      the energy column of totalMat.
+    * partialFields: the norb orbital names, like ['s', 'py', ...].
+  '''
+
+  totalMat = None
+  totalFields = None
+  partialMat = None
+  partialFields = None
+
+  arrNodes = dosNode.findall('total/array')
+  if len(arrNodes) > 1: throwerr('multiple matches for path: "total/array"')
+  if len(arrNodes) == 1:
+    totalFields = getDosFields( arrNodes[0], 'total/array')
+    spinNodes = arrNodes[0].findall('set/set')
+    checkDosSpins( spinNodes, numSpin, 'total/array/set/set')
+    nedos = len( spinNodes[0].findall('r'))
+    totalMat = np.empty( [numSpin, nedos, len(totalFields)], dtype=np.float32)
+    for isp in range( numSpin):
+      totalMat[isp] = getRawArray(
+        spinNodes[isp], 'r', nedos, len(totalFields), float)
+    if bugLev >= 5:
+      print 'getDos: totalFields: %s  totalMat.shape: %s' \
+        % (totalFields, totalMat.shape,)
+
+  arrNodes = dosNode.findall('partial/array')
+  if len(arrNodes) > 1:
+    throwerr('multiple matches for path: "partial/array"')
+  if dosMode == 'all' and len(arrNodes) == 1:
+    if totalMat is None: throwerr('dos partial found without total')
+    fields = getDosFields( arrNodes[0], 'partial/array')
+    partialFields = fields[1:]
+    ionNodes = arrNodes[0].findall('set/set')
+    if len(ionNodes) != natom:
+      throwerr('dos partial: natom mismatch.  expected: %d  found: %d' \
+        % (natom, len(ionNodes),))
+    partialMat = np.empty(
+      [natom, numSpin, nedos, len(partialFields)], dtype=np.float32)
+    for iatom in range( natom):
+      if ionNodes[iatom].get('comment') != 'ion %d' % (iatom + 1,):
+        throwerr('dos partial: invalid ion set: %d' % (iatom,))
+      spinNodes = ionNodes[iatom].findall('set')
+      checkDosSpins( spinNodes, numSpin, 'partial/array/set/set/set')
+      for isp in range( numSpin):
+        partialMat[iatom, isp] = getRawArray(
+          spinNodes[isp], 'r', nedos, len(fields), float)[:,1:]
+    if bugLev >= 5:
+      print 'getDos: partialFields: %s  partialMat.shape: %s' \
+        % (partialFields, partialMat.shape,)
+
+  return (totalMat, totalFields, partialMat, partialFields)
+
+#====================================================================
+
+# Returns the stripped <field> names of a dos <array>.
+
+def getDosFields( arrNode, path):
+  fields = [node.text.strip() for node in arrNode.findall('field')]
+  if len(fields) < 2 or fields[0] != 'energy':
+    throwerr('invalid fields for path: "%s"' % (path,))
+  return fields
+
+#====================================================================
+
+# Checks that spinNodes are the numSpin <set comment='spin N'>
+# elements, in order.
+
+def checkDosSpins( spinNodes, numSpin, path):
+  if len(spinNodes) != numSpin:
+    throwerr('numSpin mismatch for path: "%s".  expected: %d  found: %d' \
+      % (path, numSpin, len(spinNodes),))
+  for isp in range( numSpin):
+    if spinNodes[isp].get('comment') != 'spin %d' % (isp + 1,):
+      throwerr('invalid spin set for path: "%s"' % (path,))
+
+#====================================================================
+
+# The anchor elements found by getAnchors, and the equivalent
+# path of each from the root, for error messages.
+
+anchorPaths = {
+  'generator':  'generator',
+  'incar':      'incar',
+  'parameters': 'parameters',
+  'general':    'parameters/separator[@name=\'general\']',
+  'electronic': 'parameters/separator[@name=\'electronic\']',
+  'ionic':      'parameters/separator[@name=\'ionic\']',
+  'atominfo':   'atominfo',
+  'kpoints':    'kpoints',
+  'initialpos': 'structure[@name=\'initialpos\']',
+  'finalpos':   'structure[@name=\'finalpos\']',
+  'lastCalc':   'calculation[last()]',
+}
+
+#====================================================================
+
+def getAnchors( bugLev, root):
+  '''
+  Finds the top level sections of a vasprun.xml in one pass
+  over the children of the root, so that later lookups are
+  relative to these anchor elements rather than repeating
+  paths like ``calculation[last()]/...`` from the root.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * root (xml.etree.ElementTree.Element): The root element.
+
+  **Returns**:
+
+  * A map from anchor name to element, for the names in
+    :data:`anchorPaths` that are present, plus
+    'calculations': the list of all ``<calculation>`` elements.
+  '''
+
+  anchors = {}
+  calcNodes = []
+  for kid in root:
+    if kid.tag == 'calculation':
+      calcNodes.append( kid)
+      continue
+    if kid.tag == 'structure': name = kid.get('name')
+    else: name = kid.tag
+    if name in anchorPaths:
+      if name in anchors:
+        throwerr('multiple matches for path: "%s"' % (anchorPaths[name],))
+      anchors[name] = kid
+
+  if 'parameters' in anchors:
+    for kid in anchors['parameters'].findall('separator'):
+      name = kid.get('name')
+      if name in ['general', 'electronic', 'ionic']:
+        if name in anchors:
+          throwerr('multiple matches for path: "%s"' % (anchorPaths[name],))
+        anchors[name] = kid
+
+  anchors['calculations'] = calcNodes
+  if len( calcNodes) > 0: anchors['lastCalc'] = calcNodes[-1]
+
+  if bugLev >= 5:
+    print 'getAnchors: found: %s  num calculations: %d' \
+      % (sorted( anchors.keys()), len( calcNodes),)
+  return anchors
+
+#====================================================================
+
+# Returns the anchor element with the given name, from getAnchors.
+
+def getAnchor( anchors, name):
+  if name not in anchors:
+    throwerr('path not found: "%s"' % (anchorPaths[name],))
+  return anchors[name]
+
+#====================================================================
+
+# The sections parseXml can get, in addition to the generator,
+# parameters, times, final energy and efermi0, which it always gets.
+#   incar:      algo, ediff, encut_ev, isif, systemName, isGw, isDft
+#   atominfo:   type* and atom* attributes
+#   structures: initial* and final* structures, volume, density
+#   kpoints:    kpointFracMat, kpointCartMat, kpointWeights
+#   eigen:      eigenMat, occupMat, numBand, and the band edges
+#   forces:     finalForceMat_ev_ang, finalStressMat_kbar,
+#               finalPressure_kbar
+#   dos:        dos* attributes.  See getDos.
+#   trajectory: traj* attributes.  See TrajBuilder.
+
+xmlSections = ['incar', 'atominfo', 'structures', 'kpoints', 'eigen',
+  'forces', 'dos', 'trajectory']
+
+# The sections each section needs.
+xmlSectionDeps = {
+  'structures': ['atominfo'],     # density uses the masses
+  'kpoints':    ['structures'],   # kpointCartMat uses initialRecipBasisMat
+  'eigen':      ['kpoints'],
+  'dos':        ['atominfo'],     # the projected DOS has natom ions
+}
+
+#====================================================================
+
+# Returns the set of sections parseXml should get:
+# sections, or all but 'trajectory' if None,
+# plus 'trajectory' if getTraj, less 'dos' if dosMode is 'none',
+# plus the sections those need, from xmlSectionDeps.
+
+def getWantedSections( sections, getTraj, dosMode):
+  if sections == None:
+    sections = [name for name in xmlSections if name != 'trajectory']
+  for name in sections:
+    if name not in xmlSections: throwerr('unknown section: "%s"' % (name,))
+  wanted = set( sections)
+  if getTraj: wanted.add('trajectory')
+  if dosMode == 'none': wanted.discard('dos')
+  todos = list( wanted)
+  while len(todos) > 0:
+    for dep in xmlSectionDeps.get( todos.pop(), []):
+      if dep not in wanted:
+        wanted.add( dep)
+        todos.append( dep)
+  return wanted
+
+#====================================================================
+
+# Returns the regular expression for SkipReader matching the start
+# of every element that no wanted section reads.
+# These elements have no nested elements of the same name,
+# which is what SkipReader requires.
+# If recover, the calculation structures are kept, since a
+# truncated file takes its final structure from the last one.
+
+def getSkipPat( wanted, dosMode, recover=False):
+  def tagPat( tag): return '<%s(?=[\\s/>])' % (tag,)
+  pats = [tagPat('projected')]        # never read
+  if 'incar' not in wanted: pats.append( tagPat('incar'))
+  if 'atominfo' not in wanted: pats.append( tagPat('atominfo'))
+  if 'kpoints' not in wanted: pats.append( tagPat('kpoints'))
+  if 'structures' not in wanted:
+    pats.append('<structure\\s+name=')    # initialpos, finalpos, etc
+  if 'eigen' not in wanted: pats.append( tagPat('eigenvalues'))
+  if 'trajectory' not in wanted:
+    pats.append( tagPat('scstep'))
+    if not recover:
+      pats.append('<structure\\s*>')      # calculation structures
+    if 'forces' not in wanted:
+      pats.append('<varray\\s+name=["\'](?:forces|stress)["\']')
+  if 'dos' not in wanted:
+    pats.append( tagPat('total'))
+    pats.append( tagPat('partial'))
+  elif dosMode == 'total': pats.append( tagPat('partial'))
+  return '|'.join( pats)
+
+#====================================================================
+
+class SkipReader:
+  '''
+  File-like reader of XML text for iterparse, that removes
+  the elements whose start tags match a regular expression,
+  so they are never parsed.  Each is removed through the
+  first following end tag of the same name, so the matched
+  elements must not contain nested elements of their own name.
+
+  The text is read in chunks, searched with the regular
+  expression and with str.find, so skipping costs
+  little more than reading.  The newlines of removed elements
+  are kept, so line numbers in parse errors match the file.
+  '''
+
+  def __init__( self, fin, skipPat, chunkSize=1024*1024):
+    '''
+    **Parameters**:
+
+    * fin (file): the input file.
+    * skipPat (str): regular expression matching the start,
+      including the '<', of each element to remove.
+    * chunkSize (int): number of bytes to read at a time.
+    '''
+    self.fin = fin
+    self.skipRegex = re.compile( skipPat)
+    self.chunkSize = chunkSize
+    self.pending = ''         # text read but not yet scanned
+    self.outBuf = ''          # text scanned but not yet returned
+    self.outPos = 0           # position in outBuf
+    self.endTag = None        # if in a removed element, its end tag
+    self.isEof = False
+    self.numSkip = 0          # number of elements removed
+    self.numByte = 0          # number of bytes read
+    self.numSkipByte = 0      # number of bytes removed
+
+  def read( self, size=-1):
+    '''
+    Returns up to size bytes of the filtered text,
+    or all of it if size < 0.  Returns '' only at the end.
+    '''
+    while not self.isEof and (size < 0
+      or len(self.outBuf) - self.outPos < size):
+      self.fill()
+    if size < 0: size = len(self.outBuf) - self.outPos
+    res = self.outBuf[self.outPos : self.outPos + size]
+    self.outPos += len(res)
+    return res
+
+  def close( self):
+    self.fin.close()
+
+  def fill( self):
+    '''
+    Reads one chunk, and appends its filtered text to outBuf.
+    Text that may hold an incomplete tag is kept in pending.
+    '''
+    chunk = self.fin.read( self.chunkSize)
+    if len(chunk) == 0: self.isEof = True
+    self.numByte += len(chunk)
+    text = self.pending + chunk
+    self.pending = ''
+    outs = [self.outBuf[self.outPos:]]
+    self.outPos = 0
+
+    pos = 0
+    while pos < len(text):
+      if self.endTag != None:
+        ix = text.find( self.endTag, pos)
+        if ix < 0:
+          # Keep enough to find an end tag split across chunks.
+          keep = len(text)
+          if not self.isEof:
+            keep = max( pos, len(text) - len(self.endTag) + 1)
+          self.pending = text[keep:]
+          outs.append( self.skipText( text, pos, keep))
+          break
+        outs.append( self.skipText( text, pos, ix + len(self.endTag)))
+        pos = ix + len(self.endTag)
+        self.endTag = None
+      else:
+        mat = self.skipRegex.search( text, pos)
+        igt = -1
+        if mat != None: igt = text.find('>', mat.end() - 1)
+        if igt < 0:
+          # No complete start tag to remove.  Keep the text from
+          # the last '<', which may start one.
+          ix = len(text)
+          if not self.isEof:
+            if mat != None: ix = mat.start()
+            else: ix = max( pos, text.rfind('<', pos))
+          outs.append( text[pos:ix])
+          self.pending = text[ix:]
+          break
+        outs.append( text[pos:mat.start()])
+        if text[igt-1] != '/':              # not an empty element <a/>
+          tag = re.match('<(\\w+)', mat.group()).group(1)
+          self.endTag = '</%s>' % (tag,)
+        self.numSkip += 1
+        outs.append( self.skipText( text, mat.start(), igt + 1))
+        pos = igt + 1
+
+    self.outBuf = ''.join( outs)
+
+  def skipText( self, text, ibeg, iend):
+    '''
+    Returns the newlines in text[ibeg:iend], which is removed.
+    '''
+    self.numSkipByte += iend - ibeg
+    return '\n' * text.count( '\n', ibeg, iend)
+
+#====================================================================
+
+# The XML parser engines for parseXml:
+#   celement: xml.etree.cElementTree, from the standard library.
+#   lxml:     lxml.etree, if installed.  Its parser is faster,
+#             but uses more memory for the tree.
+#   auto:     lxml if installed, else celement.
+# The default is celement, so lxml is used only if asked for.
+#
+# The files may be uploaded, so lxml is called with
+# resolve_entities=False: lxml before 5.0 resolves external entities
+# by default, which could copy local files into the results.
+# cElementTree never resolves external entities.
+# libxml2's limits on text size and depth are kept.
+
+xmlEngines = ['auto', 'celement', 'lxml']
+
+# Returns (engineName, etree module) for engine,
+# where engineName is 'celement' or 'lxml'.
+
+def getEngine( engine):
+  if engine not in xmlEngines: throwerr('unknown engine: %s' % (engine,))
+  if engine == 'auto':
+    if lxmlEtree != None: engine = 'lxml'
+    else: engine = 'celement'
+  if engine == 'lxml':
+    if lxmlEtree == None: throwerr('engine lxml: lxml is not installed')
+    return (engine, lxmlEtree)
+  return (engine, etree)
+
+#====================================================================
+
+# Returns the root element of a vasprun.xml, parsing it
+# incrementally with iterparse and keeping only:
+#   the top level sections: generator, incar, parameters,
+#     atominfo, kpoints, and the structures,
+#   the totalsc time of each calculation, for iterCpuTimes,
+#   the last calculation, in full.
+# Each time a calculation ends, the previous one is cleared,
+# leaving an empty <calculation> holding just its
+# <time name='totalsc'> element.  So the same paths work
+# on the result as on the full tree, including
+# 'calculation[last()]', while memory is bounded by two
+# calculations rather than the whole trajectory.
+#
+# If traj is not None, each calculation is passed to
+# traj.addCalc when it ends, before it is cleared.
+#
+# If skipPat is not None, the elements it matches are removed
+# from the text before parsing, so they are never built.
+# See SkipReader and getSkipPat.
+#
+# engine is 'celement' or 'lxml'.  See getEngine.
+#
+# If recover, a parse error after the end of at least one
+# calculation, as in a file truncated by a killed job, is not
+# raised.  Instead everything after the last complete calculation
+# is removed from the root, so that calculation is the last one.
+#
+# Returns (root, isTruncated), where isTruncated is True if
+# the file was recovered.
+
+def readStreamRoot( bugLev, inFile, traj=None, skipPat=None,
+  engine='celement', recover=False):
+  root = None
+  depth = 0                # depth of the current element; root is 1
+  prevCalc = None          # previous complete calculation
+  numCalc = 0
+  isTruncated = False
+
+  fin = open( inFile)
+  if skipPat != None: fin = SkipReader( fin, skipPat)
+  try:
+    if engine == 'lxml':
+      events = lxmlEtree.iterparse(
+        fin, events=('start', 'end'), resolve_entities=False)
+    else: events = etree.iterparse( fin, events=('start', 'end'))
+    for (event, ele) in events:
+      if event == 'start':
+        depth += 1
+        if root == None: root = ele
+      else:
+        if depth == 2 and ele.tag == 'calculation':
+          if traj != None: traj.addCalc( ele)
+          if prevCalc != None:
+            timeNodes = prevCalc.findall('time[@name=\'totalsc\']')
+            prevCalc.clear()
+            for node in timeNodes:
+              prevCalc.append( node)
+          prevCalc = ele
+          numCalc += 1
+        depth -= 1
+  except Exception, exc:
+    if not recover or prevCalc == None: raise
+    if bugLev >= 1:
+      print 'readStreamRoot: recovering after %d calculations from: %s' \
+        % (numCalc, repr(exc),)
+    kids = list( root)
+    for kid in kids[kids.index( prevCalc) + 1:]:
+      root.remove( kid)
+    isTruncated = True
+  finally:
+    fin.close()
+
+  if bugLev >= 5:
+    print 'readStreamRoot: inFile: %s  numCalc: %d' % (inFile, numCalc,)
+    if skipPat != None:
+      print 'readStreamRoot: numSkip: %d  skipped bytes: %d  of: %d' \
+        % (fin.numSkip, fin.numSkipByte, fin.numByte,)
+  return (root, isTruncated)
+
+#====================================================================
+
 
 def printNode( node, curLev, maxLev):
   '''
@@ -1159,6 +1957,20 @@ def getRawArray( root, path, nrow, ncol, dtype):
     throwerr('nrow mismatch for path: "%s".  expected: %d  found: %d' \
       % (path, nrow, nlst,))
 
+  # Fast path: parse all the rows in one numpy call.
+  if dtype == float:
+    bulkRes = parseRowsBulk( [ele.text for ele in lst])
+    if bulkRes != None:
+      (rowCounts, vals) = bulkRes
+      ncolActual = rowCounts[0]
+      if ncol > 0 and ncolActual != ncol:
+        throwerr('ncol mismatch path: "%s"' % (path,))
+      if np.any( rowCounts != ncolActual):
+        throwerr('irregular array for path: "%s"' % (path,))
+      return vals.reshape( [nlst, ncolActual])
+
+  # Slow path, token by token, for ints and for
+  # any text numpy cannot parse, giving the detailed error.
   rows = []
   for ii in range(nlst):
 
@@ -1224,7 +2036,9 @@ def getArrayByNode( bugLev, arrNode):
   Converts an XML ``<array>`` element in vasprun.xml
   to a map with an array.
 
-  Calls getArraySub to extract each field.
+  Calls getArraySub once to extract all the fields,
+  splitting each row once, then converts each field to
+  a typed numpy array.
   The output Python map has the following structure:
 
   =============   ========================================================
@@ -1239,6 +2053,9 @@ def getArrayByNode( bugLev, arrNode):
   _fieldTypes     numpy vec of field types in the parallel arrays.
                   len( fieldTypes) == numVariables.
                   The types are: 'i': int, 'f': float, 's': str
+                  Each is the declared ``<field type="...">``
+                  if any, else sniffed from the first value,
+                  widened if any value does not convert.
 
   <fieldName>     numpy n-dimensional array of the field <fieldName>
   <fieldName>     numpy n-dimensional array of the field <fieldName>
@@ -1361,30 +2178,68 @@ def getArrayByNode( bugLev, arrNode):
   fieldNames = [nd.text for nd in fieldNodes]
   fieldNames = np.array( fieldNames, dtype=str)
 
-  # We set fieldTypes[ifield] to max( all found types for ifield)
-  # Types are: 0:int, 1:float, 2:string
-  fieldTypes = nfield * [0]
+  # Types are: 0:int, 1:float, 2:string, None: not declared.
+  fieldTypes = [fieldTypeMap.get( nd.get('type')) for nd in fieldNodes]
 
   setNodes = arrNode.findall('set')
   if len(setNodes) != 1: throwerr('wrong len for primary set')
-  setNode = setNodes[0]
-  resList = nfield * [None]
-  for ifield in range( nfield):
-    amat = getArraySub(
-      bugLev,
-      setNode,
-      ifield,
-      fieldTypes,
-      0,            # idim
-      dimLens)
-
-    # Convert all elements of each field ifield to fieldTypes[ifield].
-    if   fieldTypes[ifield] == 0: amat = np.array( amat, dtype=int)
-    elif fieldTypes[ifield] == 1: amat = np.array( amat, dtype=float)
-    elif fieldTypes[ifield] == 2: amat = np.array( amat, dtype=str)
-    else: throwerr('unknown fieldType')
-
-    resList[ifield] = amat
+  chunks = getArraySub(
+    bugLev,
+    setNodes[0],
+    nfield,
+    0,            # idim
+    dimLens,
+    [])           # chunks
+
+  # For fields with no declared type, sniff the first value.
+  if None in fieldTypes:
+    firstVals = []
+    if len( chunks) > 0 and len( chunks[0][1]) > 0:
+      (form, items) = chunks[0]
+      if form == 'rc': firstVals = items[:nfield]
+      else: firstVals = items[0].split()
+    for ifield in range( nfield):
+      if fieldTypes[ifield] == None:
+        if len( firstVals) == nfield:
+          fieldTypes[ifield] = sniffType( firstVals[ifield])
+        else: fieldTypes[ifield] = 0     # no rows, or bad row found below
+
+  # Fast path: if all rows are short form <r> and all fields
+  # are floats, parse all rows in one numpy call.
+  # Field ifield is column ifield.
+  resList = None
+  isShort = all( [form == 'r' for (form, items) in chunks])
+  if isShort and len( chunks) > 0 \
+    and all( [ftype == 1 for ftype in fieldTypes]):
+    texts = []
+    for (form, items) in chunks:
+      texts.extend( items)
+    bulkRes = parseRowsBulk( texts)
+    if bulkRes != None:
+      (rowCounts, vals) = bulkRes
+      if np.any( rowCounts != nfield): throwerr('wrong num fields')
+      vals = vals.reshape( [len( texts), nfield])
+      resList = [np.ascontiguousarray( vals[:,ifield]).reshape( dimLens)
+        for ifield in range( nfield)]
+
+  # Slow path.  Split the rows into one flat list of values,
+  # nfield per row, so the values of field ifield are vals[ifield::nfield].
+  # Convert the values of field ifield to fieldTypes[ifield],
+  # widening the type if some value does not convert.
+  if resList == None:
+    vals = []
+    for (form, items) in chunks:
+      if form == 'rc': vals.extend( items)
+      else:
+        for text in items:
+          toks = text.split()       # split strips the tokens
+          if len(toks) != nfield: throwerr('wrong num fields')
+          vals.extend( toks)
+    resList = nfield * [None]
+    for ifield in range( nfield):
+      (fieldTypes[ifield], amat) = convertField(
+        vals[ifield::nfield], fieldTypes[ifield])
+      resList[ifield] = amat.reshape( dimLens)
 
   # Convert fieldTypes from 0,1,2 to 'i', 'f', 's'
   fldMap = { 0:'i', 1:'f', 2:'s'}
@@ -1411,13 +2266,13 @@ def getArrayByNode( bugLev, arrNode):
 def getArraySub(
   bugLev,
   setNode,
-  ifield,
-  fieldTypes,
+  nfield,
   idim,
-  dimLens):
+  dimLens,
+  chunks):
   '''
-  Decodes the XML for one field (one variable) for an
-  ``<array>``.
+  Decodes the XML for all the fields (variables) of an
+  ``<array>``, in one pass.
 
   Called by getArrayByNode.  See :func:`getArrayByNode` for details.
 
@@ -1425,23 +2280,24 @@ def getArraySub(
 
   * bugLev (int): Debug level.  Normally 0.
   * setNode (xml.etree.ElementTree.Element): the element for ``<set>``.
-  * ifield (int): the index number of the field.
-  * fieldTypes (int[]): the numeric field types so far.
-    The numeric types are: 0: int, 1: float, 2: str.
-    We take the max of the field types.
-  * tp (Python type): The desired type.
+  * nfield (int): the number of fields.
   * idim (int): dimension number == recursion level == array nest level.
     0 on the first call, 1 for the next level array, etc.
   * dimLens (int[]): list of dimension lengths.  Updated.
+  * chunks (list): list of chunks found so far.  Updated.
 
   **Returns**:
 
-  * A Python array with elements of type str.
-    The caller converts them to the correct type.
+  * chunks: a list of (form, items), one per innermost ``<set>``,
+    in order, with the last dimension varying fastest.
+    For the long form, form is 'rc' and items is a flat list of
+    the stripped strings of the rows, nfield per row.
+    For the short form, form is 'r' and items is the list
+    of row texts, not yet split.
+    The caller converts them to the correct types.
   '''
 
 
-  nfield = len(fieldTypes)
   ndim = len(dimLens)
 
   # If we're at the last dimension, decode the element values.
@@ -1463,62 +2319,135 @@ def getArraySub(
     nval = max( len( rcNodes), len( rNodes))
     if dimLens[idim] == 0: dimLens[idim] = nval
     if nval != dimLens[idim]: throwerr('irregular array')
-    resVec = nval * [None]
 
     if len(rcNodes) > 0:                # long form: <rc> <c>
-      for ival in range( nval):
-        cNodes = rcNodes[ival].findall('c')
+      vals = []
+      for rcNode in rcNodes:
+        cNodes = rcNode.findall('c')
         if len(cNodes) != nfield: throwerr('wrong num fields')
-        stg = cNodes[ifield].text
-        resVec[ival] = stg
+        vals.extend( [cNode.text.strip() for cNode in cNodes])
+      chunks.append( ('rc', vals))
 
     elif len(rNodes) > 0:               # short form: <r>
-      for ival in range( nval):
-        txt = rNodes[ival].text
-        toks = txt.split()
-        if len(toks) != nfield: throwerr('wrong num fields')
-        resVec[ival] = toks[ifield]
+      chunks.append( ('r', [rNode.text for rNode in rNodes]))
 
     else: throwerr('unknown array structure')
 
-    # Strip all strings.
-    # Set fieldTypes[ifield] to max( current type, all found types)
-    # Types are: 0:int, 1:float, 2:string
-    for ival in range( nval):
-      resVec[ival] = resVec[ival].strip()
-      stg = resVec[ival]
-      ftype = 2            # assume worst case: string
-      try:
-        float( stg)
-        ftype = 1
-      except ValueError: pass
-      try:
-        int( stg)
-        ftype = 0
-      except ValueError: pass
-      fieldTypes[ifield] = max( fieldTypes[ifield], ftype)
-
 
   else:    # else idim < ndim - 1.  Recursion.
     setNodes = setNode.findall('set')
     nset = len( setNodes)
     if dimLens[idim] == 0: dimLens[idim] = nset
     if nset != dimLens[idim]: throwerr('irregular array')
-    resVec = nset * [None]
-    for iset in range(nset):
-      resVec[iset] = getArraySub(          # recursion
+    for subNode in setNodes:
+      getArraySub(          # recursion
         bugLev,
-        setNodes[iset],
-        ifield,
-        fieldTypes,
+        subNode,
+        nfield,
         idim + 1,
-        dimLens)
+        dimLens,
+        chunks)
 
-  return resVec
+  return chunks
  
 
 #====================================================================
 
+# Whitespace, as for str.split(): tab, nl, vt, ff, cr, space.
+spaceTable = np.zeros( [256], dtype=bool)
+spaceTable[ [9, 10, 11, 12, 13, 32]] = True
+
+# Fast path for numeric text.
+# Parses the list of row texts with a single np.fromstring call.
+# Returns (rowCounts, vals) where rowCounts is the numpy vec
+# of the number of whitespace separated tokens in each row,
+# and vals is the float numpy vec of all tokens of all rows.
+# Returns None if the fast path does not apply: a text
+# is None or unicode, or numpy could not parse some token
+# as a float.  In that case the caller uses the slow path,
+# which gives the detailed error message.
+#
+# The row counts let the caller make the same ragged row
+# checks as the slow path, without splitting the rows:
+# we join the rows with single spaces, find the token starts
+# (non-space after space), and assign each to its row
+# using the row end offsets.
+#
+# np.fromstring silently stops at the first token it cannot
+# parse, even within a token like "0.1-100" or "1.0D-05".
+# So we append a sentinel token: if it is not the last value
+# parsed, some token was bad.
+
+def parseRowsBulk( texts):
+  nrow = len( texts)
+  sentinel = 1234.5
+  try:
+    lens = np.fromiter( map( len, texts), dtype=int, count=nrow)
+    text = ' '.join( texts + [repr( sentinel)])
+  except TypeError: return None             # some text is None
+  if type( text) != str: return None        # unicode
+
+  buf = np.frombuffer( text, dtype=np.uint8)
+  isSpace = spaceTable[ buf]
+  isStart = ~isSpace
+  isStart[1:] &= isSpace[:-1]
+  rowEnds = np.cumsum( lens + 1) - 1        # offsets of the joining spaces
+  rowIxs = np.searchsorted( rowEnds, np.flatnonzero( isStart), side='right')
+  rowCounts = np.bincount( rowIxs, minlength=nrow + 1)  # sentinel at nrow
+
+  vals = np.fromstring( text, dtype=float, sep=' ')
+  if len( vals) != len( rowIxs) or vals[-1] != sentinel: return None
+  return (rowCounts[:nrow], vals[:-1])
+
+#====================================================================
+
+# Maps the declared type of an array <field> to our field type:
+#   0: int, 1: float, 2: str
+# Fields with no declared type, or an unknown one, are sniffed.
+
+fieldTypeMap = {
+  'int': 0,
+  'float': 1,
+  'string': 2,
+  'logical': 2,
+}
+
+# Returns the field type of the stripped string stg:
+#   0: int, 1: float, 2: str
+
+def sniffType( stg):
+  try:
+    int( stg)
+    return 0
+  except ValueError: pass
+  try:
+    float( stg)
+    return 1
+  except ValueError: pass
+  return 2
+
+# Returns (ftype, amat) for the sequence of stripped strings vals,
+# where amat is the 1 dimensional numpy array of vals converted
+# to type ftype:
+#   0: int, 1: float, 2: str
+# We try the type ftype, and if some val does not convert,
+# widen ftype to the next type.
+# We use the Python int() test, which fails quickly on the
+# first non-int, rather than numpy's, which also accepts "1L".
+
+def convertField( vals, ftype):
+  amat = None
+  if ftype == 0:
+    try: amat = np.array( [int( val) for val in vals], dtype=int)
+    except ValueError: ftype = 1
+  if ftype == 1:
+    try: amat = np.array( vals, dtype=float)
+    except ValueError: ftype = 2
+  if ftype == 2: amat = np.array( vals, dtype=str)
+  return (ftype, amat)
+
+#====================================================================
+
 # Not used
 
 def convertTypesUnused( tp, vec):
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import cPickle, multiprocessing, os, sys, traceback
+
+import phaseProfile, readVasp, ScanXml, wrapUpload
+
+
+#====================================================================
+
+def badparms( msg):
+  print '\nError: %s' % (msg,)
+  print 'Parms:'
+  print '  -bugLev      <int>      debug level'
+  print '  -readType    <string>   outcar / outcarStream / xml / xmlStream'
+  print '  -inDirs      <string>   comma separated list of run dirs'
+  print '  -inTree      <string>   top of a tree of run dirs'
+  print '  -omits       <string>   comma separated list of strings which, if'
+  print '                          in a dir path, causes dir to be omitted.'
+  print '  -numWorker   <int>      num worker processes.  Default: num cpus'
+  print '  -chunkSize   <int>      dirs per worker task.  Default: 1'
+  print '  -getTraj     <string>   y / n (default): get the ionic trajectory'
+  print '  -dosMode     <string>   all (default) / total / none'
+  print '  -sections    <string>   xml sections, comma separated, or "all"'
+  print '  -recover     <string>   y / n (default): read truncated vasprun.xml'
+  print '  -profLog     <string>   JSON lines file to append the phase times to'
+  print '  -outDigest   <string>   output pickle file of results, or "none"'
+  print ''
+  print 'Example:'
+  print './batchVasp.py -readType outcar -inTree /tmp/runs -numWorker 8 -outDigest none'
+  sys.exit(1)
+
+#====================================================================
+
+def main():
+  '''
+  Reads the VASP output in many run directories at once,
+  using a pool of worker processes, each calling
+  :func:`readVasp.parseDir`.
+
+  Command line parameters:
+
+  ================  =========    ==============================================
+  Parameter         Type         Description
+  ================  =========    ==============================================
+  **-bugLev**       integer      Debug level.  Normally 0.
+  **-readType**     string       outcar, outcarStream, xml, or xmlStream.
+                                 See :func:`readVasp.parseDir`.
+  **-inDirs**       string       Comma separated list of run directories.
+  **-inTree**       string       Top directory of a tree.  Every dir in the
+                                 tree containing OUTCAR (for outcar)
+                                 or vasprun.xml (for xml, xmlStream)
+                                 is read.
+  **-omits**        string       Comma separated list of strings which, if
+                                 in a dir path, causes dir to be omitted.
+  **-numWorker**    int          Number of worker processes.
+                                 Default: the number of cpus.
+                                 If 1, no pool is used.
+  **-chunkSize**    int          Number of dirs sent to a worker at a time.
+                                 Default: 1.
+  **-getTraj**      string       If 'y', also get the ionic trajectory.
+                                 Only for xml and xmlStream.  Default 'n'.
+  **-dosMode**      string       'all' (the default), 'total', or 'none':
+                                 which density of states to get.
+                                 Only for xml and xmlStream.
+  **-sections**     string       Comma separated list of the sections to
+                                 get, from ScanXml.xmlSections, or 'all'.
+                                 Default: all but trajectory.
+                                 Only for xml and xmlStream.
+  **-recover**      string       If 'y', read a truncated vasprun.xml up
+                                 to the last complete calculation, rather
+                                 than reporting an error.
+                                 Only for xml and xmlStream.  Default 'n'.
+  **-profLog**      string       If given, record the time and memory
+                                 of each parse phase of each dir, and
+                                 append them to this JSON lines file.
+                                 See :class:`phaseProfile.PhaseProfile`.
+  **-outDigest**    string       Output pickle file, holding the list of
+                                 resObjs, or "none".
+  ================  =========    ==============================================
+
+  At least one of -inDirs and -inTree must be given.
+  '''
+
+  bugLev = 0
+  readType = None
+  inDirs = []
+  inTree = None
+  omits = []
+  numWorker = multiprocessing.cpu_count()
+  chunkSize = 1
+  getTraj = False
+  dosMode = 'all'
+  sections = None
+  recover = False
+  profLog = None
+  outDigest = None
+
+  if len(sys.argv) % 2 != 1:
+    badparms('Parms must be key/value pairs')
+  for iarg in range( 1, len(sys.argv), 2):
+    key = sys.argv[iarg]
+    val = sys.argv[iarg+1]
+    if key == '-bugLev': bugLev = int( val)
+    elif key == '-readType': readType = val
+    elif key == '-inDirs': inDirs = val.strip().split(',')
+    elif key == '-inTree': inTree = val
+    elif key == '-omits':
+      omits = val.strip().split(',')
+      for omit in omits:
+        if len(omit) == 0: badparms('invalid omits')
+    elif key == '-numWorker': numWorker = int( val)
+    elif key == '-chunkSize': chunkSize = int( val)
+    elif key == '-getTraj':
+      if val not in ['y', 'n']: badparms('invalid getTraj')
+      getTraj = val == 'y'
+    elif key == '-dosMode': dosMode = val
+    elif key == '-sections':
+      if val == 'all': sections = ScanXml.xmlSections
+      else:
+        sections = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-recover':
+      if val not in ['y', 'n']: badparms('invalid recover')
+      recover = val == 'y'
+    elif key == '-profLog': profLog = val
+    elif key == '-outDigest': outDigest = val
+    else: badparms('unknown key: "%s"' % (key,))
+
+  if bugLev == None: badparms('parm not specified: -bugLev')
+  if readType == None: badparms('parm not specified: -readType')
+  if len( inDirs) == 0 and inTree == None:
+    badparms('parm not specified: -inDirs or -inTree')
+  if numWorker < 1: badparms('invalid numWorker')
+  if chunkSize < 1: badparms('invalid chunkSize')
+  if outDigest == None: badparms('parm not specified: -outDigest')
+
+  if inTree != None:
+    inDirs = inDirs + findRunDirs( bugLev, readType, inTree)
+  runDirs = []
+  for inDir in inDirs:
+    foundOmit = False
+    for omit in omits:
+      if inDir.find( omit) >= 0: foundOmit = True
+    if foundOmit: wrapUpload.logit('batchVasp: omit inDir: %s' % (inDir,))
+    else: runDirs.append( inDir)
+
+  wrapUpload.logit('batchVasp: num dirs: %d  numWorker: %d  chunkSize: %d' \
+    % (len( runDirs), numWorker, chunkSize,))
+  resList = []
+  numErr = 0
+  numTrunc = 0
+  for (inDir, resObj) in parseDirs(
+    bugLev, readType, runDirs, numWorker, chunkSize,
+    getTraj=getTraj, dosMode=dosMode, sections=sections, recover=recover,
+    profLog=profLog):
+    if resObj.excMsg != None:
+      numErr += 1
+      wrapUpload.logit('batchVasp: error: %s: %s' % (inDir, resObj.excMsg,))
+    elif getattr( resObj, 'isTruncated', False):
+      numTrunc += 1
+      wrapUpload.logit('batchVasp: truncated: %s  lost sections: %s' \
+        % (inDir, resObj.lostSections,))
+    elif bugLev >= 1: wrapUpload.logit('batchVasp: done: %s' % (inDir,))
+    resList.append( resObj)
+  wrapUpload.logit('batchVasp: num dirs: %d  num errors: %d  num truncated: %d' \
+    % (len( resList), numErr, numTrunc,))
+
+  if outDigest != 'none':
+    with open( outDigest, 'w') as fout:
+      cPickle.dump( resList, fout, protocol=cPickle.HIGHEST_PROTOCOL)
+
+#====================================================================
+
+def findRunDirs(
+  bugLev,
+  readType,
+  topDir):
+  '''
+  Returns the sorted list of dirs in the tree at topDir
+  that contain the VASP output file for readType.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * readType (str): If 'xml' or 'xmlStream' look for vasprun.xml,
+    else for OUTCAR.
+  * topDir (str): Top of the directory tree.
+
+  **Returns**:
+
+  * list of str: the run dirs.
+  '''
+
+  if readType in ['xml', 'xmlStream']: tname = 'vasprun.xml'
+  else: tname = 'OUTCAR'
+  runDirs = []
+  for (dirPath, dirNames, fileNames) in os.walk( topDir):
+    if tname in fileNames: runDirs.append( dirPath)
+  runDirs.sort()
+  if bugLev >= 1:
+    wrapUpload.logit('findRunDirs: topDir: %s  num dirs: %d' % (topDir, len( runDirs),))
+  return runDirs
+
+#====================================================================
+
+def parseDirs(
+  bugLev,
+  readType,
+  inDirs,
+  numWorker,
+  chunkSize,
+  getTraj=False,
+  dosMode='all',
+  sections=None,
+  recover=False,
+  profLog=None):
+  '''
+  Generator: reads the VASP output in each of inDirs,
+  using a pool of numWorker processes, and yields
+  the results in the order they complete.
+
+  Errors are captured per dir, as by :func:`readVasp.parseDir`:
+  the resObj has excMsg and excTrace set.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * readType (str): See :func:`readVasp.parseDir`.
+  * inDirs (list of str): The run dirs.
+  * numWorker (int): Number of worker processes.
+    If 1, the dirs are read in this process.
+  * chunkSize (int): Number of dirs sent to a worker at a time.
+  * getTraj (boolean): If True, also get the ionic trajectory.
+    See :func:`readVasp.parseDir`.
+  * dosMode (str): 'all', 'total' or 'none'.
+    See :func:`readVasp.parseDir`.
+  * sections (list of str): the xml sections to get, or None.
+    See :func:`readVasp.parseDir`.
+  * recover (boolean): If True, read a truncated vasprun.xml up to
+    the last complete calculation.  See :func:`readVasp.parseDir`.
+  * profLog (str): If not None, each worker records the parse
+    phases of each dir in resObj.phaseProfile and appends them
+    to this JSON lines file.  See :class:`phaseProfile.PhaseProfile`.
+
+  **Yields**:
+
+  * (inDir, resObj) tuples, where resObj is a
+    :class:`readVasp.ResClass` instance.
+  '''
+
+  taskList = [(bugLev, readType, inDir, getTraj, dosMode, sections, recover,
+    profLog) for inDir in inDirs]
+  if numWorker == 1:
+    for task in taskList:
+      yield parseOne( task)
+  else:
+    pool = multiprocessing.Pool( processes=numWorker)
+    try:
+      for res in pool.imap_unordered( parseOne, taskList, chunkSize):
+        yield res
+      pool.close()
+    except:
+      pool.terminate()          # caller stopped early, or an error
+      raise
+    finally:
+      pool.join()
+
+#====================================================================
+
+# Worker: reads one dir, and returns (inDir, resObj).
+# Never raises: any error is saved in resObj.excMsg, excTrace.
+
+def parseOne( task):
+  (bugLev, readType, inDir, getTraj, dosMode, sections, recover,
+    profLog) = task
+  prof = None
+  if profLog != None: prof = phaseProfile.PhaseProfile( bugLev, profLog)
+  try:
+    resObj = readVasp.parseDir(                     # maxLev = -1
+      bugLev, readType, inDir, -1, getTraj=getTraj, dosMode=dosMode,
+      sections=sections, recover=recover, prof=prof)
+  except Exception, exc:
+    resObj = readVasp.ResClass()
+    resObj.excMsg = repr(exc)
+    resObj.excTrace = traceback.format_exc( limit=None)
+  return (inDir, resObj)
+
+#====================================================================
+
+if __name__ == '__main__': main()
+
+#====================================================================
@@ -0,0 +1,2354 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime, json, math, os, platform, re, resource, subprocess, sys, time
+import numpy as np
+import readVasp, ScanOutcar, ScanXml
+
+
+#====================================================================
+
+def badparms( msg):
+  print '\nError: %s' % (msg,)
+  print 'Parms:'
+  print '  -bugLev      <int>      debug level'
+  print '  -func        <string>   writeOutcar / outcarIndex / outcarRead /'
+  print '                          outcarTail / eigenParse / efermi / bandgaps /'
+  print '                          writeXml / xmlRead / xmlArray / xmlAnchors /'
+  print '                          xmlDos / xmlSections / xmlEngines /'
+  print '                          check / suite / suiteCompare'
+  print '  -inDir       <string>   dir containing OUTCAR, INCAR, POSCAR,'
+  print '                          or vasprun.xml for the xml funcs,'
+  print '                          or "none" to generate one in -outDir'
+  print '  -outDir      <string>   dir for generated files'
+  print '  -readMode    <string>   outcarReadOne: list / mmap / stream'
+  print '                          xmlReadOne: tree / stream'
+  print '  -dosMode     <string>   xmlReadOne: all (default) / total / none'
+  print '  -sections    <string>   xmlReadOne: xml sections, comma separated'
+  print '  -engine      <string>   xmlReadOne: celement (default) / lxml / auto'
+  print '  -numAtom     <int>      synthetic: num atoms'
+  print '  -numKpoint   <int>      synthetic: num kpoints'
+  print '  -numBand     <int>      synthetic: num bands'
+  print '  -numSpin     <int>      synthetic: 1 or 2'
+  print '  -numStep     <int>      synthetic: num ionic steps'
+  print '  -numElec     <int>      synthetic: electronic steps per ionic step'
+  print '  -numDos      <int>      synthetic xml: num DOS points, or 0 for none'
+  print '  -checks      <string>   check: comma separated func names.  Default all'
+  print '  -cases       <string>   suite: comma separated case names.  Default all'
+  print '  -numRep      <int>      suite: runs per target.  Default 3'
+  print '  -target      <string>   suiteOne: target name, from suiteTargets'
+  print '  -outJson     <string>   suite: output results file'
+  print '  -baseJson    <string>   suiteCompare: base results file'
+  print '  -tolerance   <float>    suiteCompare: allowed increase.  Default 0.1'
+  print ''
+  print 'Examples:'
+  print './benchVasp.py -func outcarIndex -inDir none -outDir /tmp/bench -numStep 800'
+  print './benchVasp.py -func check -outDir /tmp/check'
+  print './benchVasp.py -func suite -outDir /tmp/bench -outJson /tmp/new.json'
+  print './benchVasp.py -func suiteCompare -baseJson /tmp/old.json -outJson /tmp/new.json'
+  sys.exit(1)
+
+#====================================================================
+
+def main():
+  '''
+  Benchmarks for the VASP parsers, using either an existing
+  run directory or a synthetic one.
+
+  Command line parameters:
+
+  ================  =========    ==============================================
+  Parameter         Type         Description
+  ================  =========    ==============================================
+  **-bugLev**       integer      Debug level.  Normally 0.
+  **-func**         string       Function.  See below.
+  **-inDir**        string       Dir containing OUTCAR, INCAR, POSCAR,
+                                 or vasprun.xml for the xml funcs,
+                                 or "none" to generate a synthetic
+                                 set in outDir.
+  **-outDir**       string       Dir for generated files.
+  **-readMode**     string       For outcarReadOne: list, mmap, or stream.
+                                 For xmlReadOne: tree or stream.
+  **-dosMode**      string       For xmlReadOne: all, total, or none.
+                                 See :func:`ScanXml.parseXml`.  Default all.
+  **-sections**     string       For xmlReadOne: comma separated list of
+                                 sections, or 'all'.
+                                 See :func:`ScanXml.parseXml`.
+  **-engine**       string       For xmlReadOne: celement, lxml, or auto.
+                                 See :func:`ScanXml.getEngine`.  Default celement.
+  **-numAtom**      int          Synthetic: number of atoms.  Default 8.
+  **-numKpoint**    int          Synthetic: number of kpoints.  Default 10.
+  **-numBand**      int          Synthetic: number of bands.  Default 40.
+  **-numSpin**      int          Synthetic: 1 or 2.  Default 2.
+  **-numStep**      int          Synthetic: number of ionic steps.
+                                 Default 10.
+  **-numElec**      int          Synthetic: number of electronic steps
+                                 per ionic step.  Default 10.
+  **-numDos**       int          Synthetic xml: number of DOS points,
+                                 or 0 for no total and projected DOS.
+                                 Default 301.
+  **-checks**       string       For check: comma separated names from
+                                 checkFuncs.  Default: all.
+  **-cases**        string       For suite: comma separated names from
+                                 suiteCases.  Default: all.
+  **-numRep**       int          For suite: number of runs of each
+                                 target.  Default 3.
+  **-target**       string       For suiteOne: name from suiteTargets.
+  **-outJson**      string       For suite: output JSON results file.
+                                 For suiteCompare: the new results.
+  **-baseJson**     string       For suiteCompare: the base results.
+  **-tolerance**    float        For suiteCompare: the allowed fractional
+                                 increase in time or peak memory.
+                                 Default 0.1.
+  ================  =========    ==============================================
+
+  With the defaults, each ionic step is about 1100 lines,
+  so ``-numStep 900`` gives an OUTCAR of roughly 1M lines.
+
+  **Values for the -func Parameter:**
+
+  **writeOutcar**
+    Write a synthetic OUTCAR, INCAR, POSCAR set to outDir.
+
+  **outcarIndex**
+    Compare the ScanOutcar indexed findLines against
+    a full scan of all lines, for every pattern ScanOutcar uses.
+
+  **outcarRead**
+    Compare reading the OUTCAR into a list of stripped lines
+    against the memory mapped :class:`ScanOutcar.MmapLines`
+    and the streaming :func:`ScanOutcar.readStreamLines`:
+    time and peak memory for a read and one pass over the lines.
+    Each reader is run in a separate process by outcarReadOne.
+
+  **outcarReadOne**
+    Used by outcarRead: run the reader given by -readMode.
+
+  **outcarTail**
+    Compare the indexed backward search,
+    :meth:`ScanOutcar.ScanOutcar.findLastLine`, against a forward
+    scan of all lines, for the last-occurrence sections.
+
+  **eigenParse**
+    Compare :meth:`ScanOutcar.ScanOutcar.parseEigenBlock` against
+    the per-k-point parseMatrix loop it replaced.
+    Use a large -numKpoint and -numBand, and a small -numStep.
+
+  **efermi**
+    Compare :meth:`ScanOutcar.ScanOutcar.calcEfermi` against the
+    replicate-and-sort version it replaced, on the given run
+    and on random variations of its eigenvalues and weights.
+
+  **bandgaps**
+    Compare :meth:`ScanOutcar.ScanOutcar.calcBandgaps` against the
+    element by element version it replaced, on the given run
+    and on random variations of its eigenvalues and efermiCalc.
+    For example::
+
+      ./benchVasp.py -func bandgaps -inDir none -outDir /tmp/bench \\
+        -numSpin 2 -numKpoint 2000 -numBand 500 -numStep 1 -numElec 1
+
+  **writeXml**
+    Write a synthetic vasprun.xml to outDir.
+
+  **xmlRead**
+    Compare :func:`ScanXml.parseXml` with readMode 'tree'
+    against readMode 'stream': time and peak memory,
+    each run in a separate process by xmlReadOne,
+    and check that both give the same results.
+    Use a large -numStep.
+
+  **xmlReadOne**
+    Used by xmlRead: run parseXml with the given -readMode.
+
+  **xmlArray**
+    Compare the single pass :func:`ScanXml.getArrayByNode`
+    against the per-field version it replaced,
+    on every ``<array>`` in the vasprun.xml,
+    and :func:`ScanXml.getRawArray` against the token by token
+    version it replaced, on every ``<varray>``.
+    Use a large -numKpoint and -numBand, and a small -numStep.
+
+  **xmlAnchors**
+    Compare the parseXml lookups relative to the anchors
+    found by :func:`ScanXml.getAnchors` against the same
+    lookups by full paths from the root, and report the
+    per-file parse time before and after.
+
+  **xmlDos**
+    Compare the float32 DOS arrays from :func:`ScanXml.getDos`
+    against the generic :func:`ScanXml.getArrayByPath`, and
+    the time and peak memory of parseXml with dosMode
+    'all', 'total' and 'none', each run by xmlReadOne.
+    Use a large -numAtom and -numDos.
+
+  **xmlSections**
+    Compare the time and peak memory of :func:`ScanXml.parseXml`
+    for several lists of sections, each run by xmlReadOne,
+    and check that each gives the same values as the full parse.
+    Use a large -numStep.
+
+  **xmlEngines**
+    Compare the cElementTree and lxml engines of
+    :func:`ScanXml.parseXml`, for every vasprun.xml in the
+    tree at -inDir: time and peak memory for each engine and
+    readMode, each run by xmlReadOne, and check that both
+    engines give identical results.
+
+  **check**
+    The smoke test: run each func in checkFuncs, in its own process,
+    on a small synthetic set in -outDir.  Exits with status 1
+    if any func raises an error, which they do on any mismatch
+    between the new and old code paths.  See :func:`benchCheck`.
+    -inDir is not used.
+
+  **suite**
+    The regression benchmark suite.  First runs check.
+    Then for each case in suiteCases,
+    write a synthetic set to -outDir, and time :func:`ScanXml.parseXml`,
+    :class:`ScanOutcar.ScanOutcar` and :func:`readVasp.parseDir` on it,
+    each run by suiteOne.  Writes the check results, throughput
+    and peak memory to -outJson.  See :func:`benchSuite`.
+    -inDir is not used.
+
+  **suiteOne**
+    Used by suite: run the target given by -target.
+
+  **suiteCompare**
+    Compare the -baseJson and -outJson results of suite, as from
+    two commits.  Exits with status 1 if any check failed in
+    -outJson, or if any case and target is slower or larger
+    by more than -tolerance.
+  '''
+
+  bugLev = 0
+  func = None
+  inDir = None
+  outDir = None
+  readMode = None
+  dosMode = 'all'
+  sections = None
+  engine = 'celement'
+  synSpec = SynSpec()
+  checkNames = None
+  caseNames = None
+  numRep = 3
+  target = None
+  outJson = None
+  baseJson = None
+  tolerance = 0.1
+
+  if len(sys.argv) % 2 != 1:
+    badparms('Parms must be key/value pairs')
+  for iarg in range( 1, len(sys.argv), 2):
+    key = sys.argv[iarg]
+    val = sys.argv[iarg+1]
+    if key == '-bugLev': bugLev = int( val)
+    elif key == '-func': func = val
+    elif key == '-inDir': inDir = val
+    elif key == '-outDir': outDir = val
+    elif key == '-readMode': readMode = val
+    elif key == '-dosMode': dosMode = val
+    elif key == '-sections':
+      if val == 'all': sections = ScanXml.xmlSections
+      else:
+        sections = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-engine': engine = val
+    elif key == '-numAtom': synSpec.numAtom = int( val)
+    elif key == '-numKpoint': synSpec.numKpoint = int( val)
+    elif key == '-numBand': synSpec.numBand = int( val)
+    elif key == '-numSpin': synSpec.numSpin = int( val)
+    elif key == '-numStep': synSpec.numStep = int( val)
+    elif key == '-numElec': synSpec.numElec = int( val)
+    elif key == '-numDos': synSpec.numDos = int( val)
+    elif key == '-checks':
+      checkNames = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-cases':
+      caseNames = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-numRep': numRep = int( val)
+    elif key == '-target': target = val
+    elif key == '-outJson': outJson = val
+    elif key == '-baseJson': baseJson = val
+    elif key == '-tolerance': tolerance = float( val)
+    else: badparms('unknown key: "%s"' % (key,))
+
+  if bugLev == None: badparms('parm not specified: -bugLev')
+  if func == None: badparms('parm not specified: -func')
+
+  if func == 'check':
+    if outDir == None: badparms('parm not specified: -outDir')
+    checkResults = benchCheck( bugLev, outDir, checkNames)
+    if not all( [res['ok'] for res in checkResults]): sys.exit(1)
+    return
+  elif func == 'suite':
+    if outDir == None: badparms('parm not specified: -outDir')
+    if outJson == None: badparms('parm not specified: -outJson')
+    if numRep < 1: badparms('invalid numRep')
+    benchSuite( bugLev, outDir, caseNames, numRep, outJson)
+    return
+  elif func == 'suiteCompare':
+    if baseJson == None: badparms('parm not specified: -baseJson')
+    if outJson == None: badparms('parm not specified: -outJson')
+    numRegress = benchSuiteCompare( bugLev, baseJson, outJson, tolerance)
+    if numRegress > 0: sys.exit(1)
+    return
+
+  if inDir == None: badparms('parm not specified: -inDir')
+
+  if inDir == 'none':
+    if outDir == None: badparms('parm not specified: -outDir')
+    if not os.path.isdir( outDir): os.makedirs( outDir)
+    if func in xmlFuncs: writeFunc = writeXmlSet
+    else: writeFunc = writeOutcarSet
+    (tm, nline) = timeCall( writeFunc, bugLev, outDir, synSpec)
+    logit('wrote synthetic set: %s  lines: %d  time: %.3f s' \
+      % (outDir, nline, tm,))
+    inDir = outDir
+
+  if func == 'writeOutcar': pass
+  elif func == 'outcarIndex': benchOutcarIndex( bugLev, inDir)
+  elif func == 'outcarRead': benchOutcarRead( bugLev, inDir)
+  elif func == 'outcarTail': benchOutcarTail( bugLev, inDir)
+  elif func == 'eigenParse': benchEigenParse( bugLev, inDir)
+  elif func == 'efermi': benchEfermi( bugLev, inDir)
+  elif func == 'bandgaps': benchBandgaps( bugLev, inDir)
+  elif func == 'outcarReadOne':
+    if readMode == None: badparms('parm not specified: -readMode')
+    benchOutcarReadOne( bugLev, inDir, readMode)
+  elif func == 'writeXml': pass
+  elif func == 'xmlRead': benchXmlRead( bugLev, inDir)
+  elif func == 'xmlReadOne':
+    if readMode == None: badparms('parm not specified: -readMode')
+    benchXmlReadOne( bugLev, inDir, readMode, dosMode, sections, engine)
+  elif func == 'xmlArray': benchXmlArray( bugLev, inDir)
+  elif func == 'xmlAnchors': benchXmlAnchors( bugLev, inDir)
+  elif func == 'xmlDos': benchXmlDos( bugLev, inDir)
+  elif func == 'xmlSections': benchXmlSections( bugLev, inDir)
+  elif func == 'xmlEngines': benchXmlEngines( bugLev, inDir)
+  elif func == 'suiteOne':
+    if target == None: badparms('parm not specified: -target')
+    benchSuiteOne( bugLev, inDir, target)
+  else: badparms('unknown func: "%s"' % (func,))
+
+# Funcs that read a vasprun.xml rather than an OUTCAR.
+xmlFuncs = ['writeXml', 'xmlRead', 'xmlReadOne', 'xmlArray', 'xmlAnchors',
+  'xmlDos', 'xmlSections', 'xmlEngines']
+
+#====================================================================
+#====================================================================
+
+class SynSpec:
+  '''
+  Sizes of a synthetic VASP run.
+  '''
+
+  def __init__( self):
+    self.numAtom = 8
+    self.numKpoint = 10
+    self.numBand = 40
+    self.numSpin = 2
+    self.numStep = 10
+    self.numElec = 10
+    self.numDos = 301         # xml only
+    self.seed = 1
+
+#====================================================================
+#====================================================================
+
+# Atom types of the synthetic runs, in alphabetic order.
+
+synTypeNames = ['Fe', 'O']
+synTypeMasses = [55.847, 16.000]
+synTypeValences = [8., 6.]
+synTypePseudos = ['PAW_PBE Fe 06Sep2000', 'PAW_PBE O 08Apr2002']
+
+#====================================================================
+
+def writeOutcarSet( bugLev, outDir, synSpec):
+  '''
+  Writes a synthetic INCAR, POSCAR and OUTCAR to outDir.
+
+  The OUTCAR has the layout that :class:`ScanOutcar.ScanOutcar`
+  expects, with self-consistent basis, recip basis, kpoint
+  and position sections, so that all the ScanOutcar cross checks pass.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * outDir (str): Output directory.
+  * synSpec (SynSpec): sizes of the run.
+
+  **Returns**:
+
+  * Number of lines written to the OUTCAR.
+  '''
+
+  ss = synSpec
+  rand = np.random.RandomState( ss.seed)
+
+  typeNames = synTypeNames
+  typeMasses = synTypeMasses
+  typeValences = synTypeValences
+  typePseudos = synTypePseudos
+  typeNums = [ (ss.numAtom + 1) / 2, ss.numAtom / 2]
+  totalValence = np.dot( typeNums, typeValences)
+  if not totalValence < 2 * ss.numBand:
+    throwerr('numBand too small for numAtom.  need numBand > %g' \
+      % (totalValence / 2,))
+  sysName = 'synth_%s%d%s%d' \
+    % (typeNames[0], typeNums[0], typeNames[1], typeNums[1],)
+
+  basisMat = 4.0 * np.eye( 3) + 0.1 * rand.rand( 3, 3)
+  fracPosMat = rand.rand( ss.numAtom, 3)
+  cartPosMat = np.dot( fracPosMat, basisMat)
+
+  kpFracMat = 0.5 * rand.rand( ss.numKpoint, 3)
+  kpFracMat[0] = 0
+  kpMults = rand.randint( 1, 9, size=ss.numKpoint).astype( float)
+  kpWts = kpMults / kpMults.sum()
+
+  # Band energies: a rising ladder of bands, with a gap
+  # above the occupied ones.
+  numOcc = int( round( totalValence / 2))
+  eigenMat = np.zeros( [ss.numSpin, ss.numKpoint, ss.numBand])
+  for iband in range( ss.numBand):
+    eigenMat[ :, :, iband] = -15.0 + 0.5 * iband
+    if iband >= numOcc: eigenMat[ :, :, iband] += 2.0
+  eigenMat += 0.2 * rand.rand( ss.numSpin, ss.numKpoint, ss.numBand)
+  occMax = 1.0
+  if ss.numSpin == 1: occMax = 2.0
+
+  # INCAR
+  with open( os.path.join( outDir, 'INCAR'), 'w') as fout:
+    print >> fout, 'SYSTEM = %s' % (sysName,)
+    print >> fout, 'ISPIN = %d' % (ss.numSpin,)
+    print >> fout, 'ALGO = Fast'
+    print >> fout, 'IBRION = 2'
+    print >> fout, 'ISIF = 3'
+    print >> fout, 'EDIFF = 1.0E-04      # stopping criterion'
+    print >> fout, 'ENCUT = 340'
+
+  # POSCAR
+  with open( os.path.join( outDir, 'POSCAR'), 'w') as fout:
+    print >> fout, sysName
+    print >> fout, '1.0'
+    for row in basisMat:
+      print >> fout, '  %14.8f %14.8f %14.8f' % tuple( row)
+    print >> fout, '  ' + '  '.join( typeNames)
+    print >> fout, '  ' + '  '.join( map( str, typeNums))
+    print >> fout, 'Direct'
+    for row in fracPosMat:
+      print >> fout, '  %14.8f %14.8f %14.8f' % tuple( row)
+
+  # OUTCAR
+  nline = 0
+  with open( os.path.join( outDir, 'OUTCAR'), 'w') as fout:
+    buf = []
+    buf.append(' vasp.5.3.3 18Dez12 (build Mar 19 2013 10:52:35) complex')
+    buf.append(' ')
+    buf.append(' executed on             LinuxIFC date 2013.10.18  08:44:21')
+    buf.append(' running on   16 total cores')
+    buf.append(' INCAR:')
+    for ii in range( len( typeNames)):
+      buf.append(' POTCAR:    %s' % (typePseudos[ii],))
+    buf.append('')
+    for ii in range( len( typeNames)):
+      buf.append('   VRHFIN =%s:  s2p4' % (typeNames[ii],))
+      buf.append('   TITEL  = %s' % (typePseudos[ii],))
+      buf.append('   POMASS =   %.3f; ZVAL   =    %.3f    mass and valenz' \
+        % (typeMasses[ii], typeValences[ii],))
+      buf.append('')
+    buf.append('   ions per type =  ' \
+      + ''.join( [ '%4d' % (nn,) for nn in typeNums]))
+    buf.append('')
+    buf.append(' Dimension of arrays:')
+    buf.append(('   k-points           NKPTS = %6d   k-points in BZ'
+      + '     NKDIM = %6d   number of bands    NBANDS= %6d')
+      % (ss.numKpoint, ss.numKpoint, ss.numBand,))
+    buf.append('   number of dos      NEDOS =    301   number of ions'
+      + '     NIONS = %6d' % (ss.numAtom,))
+    buf.append('')
+    buf.append(' SYSTEM =  %s' % (sysName,))
+    buf.append(' POSCAR =  %s' % (sysName,))
+    buf.append('')
+    buf.append(' Electronic Relaxation 1')
+    buf.append('   ENCUT  =  340.0 eV  24.99 Ry    5.00 a.u.'
+      + '   4.51  4.51  4.51*2*pi/ulx,y,z')
+    buf.append('   ISPIN  =      %d    spin polarized calculation?' \
+      % (ss.numSpin,))
+    buf.append('   NELECT =      %.4f    total number of electrons' \
+      % (totalValence,))
+    buf.append('   EDIFF  = 0.1E-03   stopping-criterion for ELM')
+    buf.append('')
+    buf.append(' Ionic relaxation')
+    buf.append('   IBRION =      2    ionic relax: 0-MD 1-quasi-New 2-CG')
+    buf.append('   ISIF   =      3    stress and relaxation')
+    buf.append('')
+    buf.append(' Electronic relaxation 2 (details)')
+    buf.append('   IALGO  =     68    algorithm')
+    buf.append('   ICHARG =      2    charge: 1-file 2-atom 10-const')
+    buf.append('   ALGO   =  Fast')
+    buf.append('')
+    addBasis( buf, basisMat)
+    buf.append('')
+    buf.append(' Found %6d irreducible k-points:' % (ss.numKpoint,))
+    buf.append('')
+    buf.append(' Following reciprocal coordinates:')
+    buf.append('            Coordinates               Weight')
+    for ikp in range( ss.numKpoint):
+      buf.append('  %10.6f %10.6f %10.6f %14.6f' \
+        % (tuple( kpFracMat[ikp]) + (kpMults[ikp],)))
+    buf.append('')
+    recipMat = np.linalg.inv( basisMat).T
+    kpCartMat = np.dot( kpFracMat, recipMat)
+    buf.append(' Following cartesian coordinates:')
+    buf.append('            Coordinates               Weight')
+    for ikp in range( ss.numKpoint):
+      buf.append('  %10.6f %10.6f %10.6f %14.6f' \
+        % (tuple( kpCartMat[ikp]) + (kpMults[ikp],)))
+    buf.append('')
+    buf.append('')
+    buf.append(' k-points in units of 2pi/SCALE and weight:'
+      + ' Automatic generation')
+    for ikp in range( ss.numKpoint):
+      buf.append('  %12.8f %12.8f %12.8f %14.6f' \
+        % (tuple( kpCartMat[ikp]) + (kpWts[ikp],)))
+    buf.append('')
+    buf.append(' k-points in reciprocal lattice and weights:'
+      + ' Automatic generation')
+    for ikp in range( ss.numKpoint):
+      buf.append('  %12.8f %12.8f %12.8f %14.6f' \
+        % (tuple( kpFracMat[ikp]) + (kpWts[ikp],)))
+    buf.append('')
+    buf.append(' position of ions in fractional coordinates (direct lattice)')
+    for row in fracPosMat:
+      buf.append('   %12.8f %12.8f %12.8f' % tuple( row))
+    buf.append('')
+    buf.append(' position of ions in cartesian coordinates  (Angst):')
+    for row in cartPosMat:
+      buf.append('   %12.8f %12.8f %12.8f' % tuple( row))
+    buf.append('')
+    nline += writeBuf( fout, buf)
+
+    for istep in range( ss.numStep):
+      # Each ionic step the cell and atoms move slightly.
+      stepBasisMat = basisMat + 0.001 * istep * np.eye( 3)
+      stepCartMat = cartPosMat + 0.002 * rand.rand( ss.numAtom, 3)
+      forceMat = 0.05 * (rand.rand( ss.numAtom, 3) - 0.5)
+      energy = -60.5 - 0.01 * istep + 0.001 * rand.rand()
+
+      for ielec in range( ss.numElec):
+        buf.append(('-------------------------------------- Iteration'
+          + ' %6d(%4d)  --------------------------------------')
+          % (istep + 1, ielec + 1,))
+        for nm in ['POTLOK', 'SETDIJ', 'EDDAV', 'DOS', 'CHARGE', 'MIXING']:
+          buf.append('    %-8s cpu time    0.0178: real time    0.0178' \
+            % (nm + ':',))
+        buf.append('  ' + 50 * '-')
+        buf.append('      LOOP:  cpu time    0.0716: real time    0.0718')
+        buf.append('')
+        buf.append(' eigenvalue-minimisations  :   848')
+        buf.append(' total energy-change (2. order) :-0.1104458E+03'
+          + '  (-0.1373233E+04)')
+        buf.append(' number of electron      %.7f magnetization' \
+          % (totalValence,))
+        buf.append('')
+        buf.append(' Free energy of the ion-electron system (eV)')
+        buf.append('  ' + 50 * '-')
+        buf.append('  free energy    TOTEN  =       %.8f eV' % (energy,))
+        buf.append('')
+        buf.append('  energy without entropy =      %.8f'
+          '  energy(sigma->0) =      %.8f' % (energy, energy,))
+        buf.append('')
+
+      # Eigenvalues: printed in the last electronic step
+      buf.append(' E-fermi :   %.4f     XC(G=0): -12.1737'
+        '     alpha+bet :-11.7851' % (eigenMat[0, 0, numOcc],))
+      buf.append('')
+      for isp in range( ss.numSpin):
+        if ss.numSpin == 2:
+          buf.append(' spin component %d' % (isp + 1,))
+          buf.append('')
+        for ikp in range( ss.numKpoint):
+          buf.append(' k-point %5d :   %10.4f%10.4f%10.4f' \
+            % ((ikp + 1,) + tuple( kpFracMat[ikp])))
+          buf.append('  band No.  band energies     occupation ')
+          for iband in range( ss.numBand):
+            occ = 0.0
+            if iband < numOcc: occ = occMax
+            buf.append('  %5d   %10.4f   %10.5f' \
+              % (iband + 1, eigenMat[isp, ikp, iband], occ,))
+          buf.append('')
+      buf.append('')
+
+      buf.append('  FORCE on cell =-STRESS in cart. coord.  units (eV):')
+      buf.append('  Direction    XX          YY          ZZ'
+        + '          XY          YZ          ZX')
+      buf.append('  ' + 70 * '-')
+      buf.append('  Alpha Z    76.60341    76.60341    76.60341')
+      buf.append('  Ewald    -318.46783  -318.46428  -318.52959'
+        + '    -0.00310     0.03083     0.02783')
+      buf.append('  ' + 70 * '-')
+      stress = 0.1 * rand.rand( 6)
+      buf.append('  Total   ' + ''.join( [' %11.5f' % (x,) for x in stress]))
+      buf.append('  in kB   ' \
+        + ''.join( [' %11.5f' % (80 * x,) for x in stress]))
+      buf.append('  external pressure =       96.67 kB'
+        + '  Pullay stress =        0.00 kB')
+      buf.append('')
+      buf.append(' VOLUME and BASIS-vectors are now :')
+      buf.append(' ' + 70 * '-')
+      buf.append('  energy-cutoff  :      340.00')
+      buf.append('  volume of cell :      %.4f' \
+        % (abs( np.linalg.det( stepBasisMat)),))
+      addBasis( buf, stepBasisMat)
+      buf.append('')
+      buf.append(' POSITION                                       '
+        + 'TOTAL-FORCE (eV/Angst)')
+      buf.append(' ' + 80 * '-')
+      for ia in range( ss.numAtom):
+        buf.append('     %12.5f %12.5f %12.5f      %12.6f %12.6f %12.6f' \
+          % (tuple( stepCartMat[ia]) + tuple( forceMat[ia])))
+      buf.append(' ' + 80 * '-')
+      buf.append('    total drift:        0.000000      0.000000   0.000000')
+      buf.append('')
+      buf.append('  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)')
+      buf.append('  ---------------------------------------------------')
+      buf.append('  free  energy   TOTEN  =       %.8f eV' % (energy,))
+      buf.append('')
+      buf.append('  energy  without entropy=      %.8f'
+        '  energy(sigma->0) =      %.8f' % (energy, energy,))
+      buf.append('')
+      buf.append('     LOOP+:  cpu time   %.2f: real time   %.2f' \
+        % (22.49 + istep, 24.43 + istep,))
+      buf.append('')
+      nline += writeBuf( fout, buf)
+
+    buf.append(' General timing and accounting informations for this job:')
+    buf.append(' ========================================================')
+    buf.append('')
+    buf.append('                  Total CPU time used (sec):       11.725')
+    buf.append('                            User time (sec):        9.392')
+    buf.append('                          System time (sec):        2.334')
+    buf.append('                         Elapsed time (sec):       14.468')
+    nline += writeBuf( fout, buf)
+
+  if bugLev >= 1:
+    print 'writeOutcarSet: outDir: %s  nline: %d' % (outDir, nline,)
+  return nline
+
+#====================================================================
+
+# Appends the OUTCAR "direct lattice vectors" section to buf.
+
+def addBasis( buf, basisMat):
+  recipMat = np.linalg.inv( basisMat).T
+  buf.append(' direct lattice vectors                 '
+    + 'reciprocal lattice vectors')
+  for ii in range(3):
+    buf.append('   %12.9f %12.9f %12.9f    %12.9f %12.9f %12.9f' \
+      % (tuple( basisMat[ii]) + tuple( recipMat[ii])))
+
+#====================================================================
+
+# Writes the lines in buf to fout, empties buf,
+# and returns the number of lines written.
+
+def writeBuf( fout, buf):
+  nline = len( buf)
+  buf.append('')
+  fout.write('\n'.join( buf))
+  del buf[:]
+  return nline
+
+#====================================================================
+
+def writeXmlSet( bugLev, outDir, synSpec):
+  '''
+  Writes a synthetic vasprun.xml to outDir.
+
+  The file has the elements that :func:`ScanXml.parseXml` reads,
+  with one ``<calculation>`` per ionic step.  As in a VASP
+  relaxation, only the last calculation has the
+  ``<eigenvalues>`` and ``<dos>`` sections.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * outDir (str): Output directory.
+  * synSpec (SynSpec): sizes of the run.
+
+  **Returns**:
+
+  * Number of lines written to the vasprun.xml.
+  '''
+
+  ss = synSpec
+  rand = np.random.RandomState( ss.seed)
+
+  typeNums = [ (ss.numAtom + 1) / 2, ss.numAtom / 2]
+  totalValence = np.dot( typeNums, synTypeValences)
+  if not totalValence < 2 * ss.numBand:
+    throwerr('numBand too small for numAtom.  need numBand > %g' \
+      % (totalValence / 2,))
+  sysName = 'synth_%s%d%s%d' \
+    % (synTypeNames[0], typeNums[0], synTypeNames[1], typeNums[1],)
+
+  basisMat = 4.0 * np.eye( 3) + 0.1 * rand.rand( 3, 3)
+  fracPosMat = rand.rand( ss.numAtom, 3)
+  kpFracMat = 0.5 * rand.rand( ss.numKpoint, 3)
+  kpFracMat[0] = 0
+  kpMults = rand.randint( 1, 9, size=ss.numKpoint).astype( float)
+  kpWts = kpMults / kpMults.sum()
+
+  numOcc = int( round( totalValence / 2))
+  eigenMat = np.zeros( [ss.numSpin, ss.numKpoint, ss.numBand])
+  for iband in range( ss.numBand):
+    eigenMat[ :, :, iband] = -15.0 + 0.5 * iband
+    if iband >= numOcc: eigenMat[ :, :, iband] += 2.0
+  eigenMat += 0.2 * rand.rand( ss.numSpin, ss.numKpoint, ss.numBand)
+  efermi = -15.0 + 0.5 * numOcc + 0.5
+
+  def addVarray( buf, name, mat):
+    buf.append('  <varray name="%s" >' % (name,))
+    for row in mat:
+      buf.append('   <v>' + ''.join( [' %16.8f' % (x,) for x in row])
+        + ' </v>')
+    buf.append('  </varray>')
+
+  def addStructure( buf, name, stepBasisMat, stepFracMat):
+    if name == None: buf.append(' <structure>')
+    else: buf.append(' <structure name="%s" >' % (name,))
+    buf.append('  <crystal>')
+    addVarray( buf, 'basis', stepBasisMat)
+    buf.append('   <i name="volume">  %16.8f </i>' \
+      % (abs( np.linalg.det( stepBasisMat)),))
+    addVarray( buf, 'rec_basis', np.linalg.inv( stepBasisMat).T)
+    buf.append('  </crystal>')
+    addVarray( buf, 'positions', stepFracMat)
+    buf.append(' </structure>')
+
+  nline = 0
+  # Density of states: the total for each spin, and
+  # the projection on 9 orbitals for each atom and spin.
+  dosFields = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
+  dosEnergies = np.linspace( -25.0, 10.0, max( 2, ss.numDos))
+  dosPartialMat = 0.1 * rand.rand(
+    ss.numAtom, ss.numSpin, ss.numDos, len( dosFields))
+  dosTotalMat = dosPartialMat.sum( axis=3).sum( axis=0)
+  dosIntegMat = np.cumsum( dosTotalMat, axis=1) \
+    * (dosEnergies[1] - dosEnergies[0])
+
+  with open( os.path.join( outDir, 'vasprun.xml'), 'w') as fout:
+    buf = []
+    buf.append('<?xml version="1.0" encoding="ISO-8859-1"?>')
+    buf.append('<modeling>')
+    buf.append(' <generator>')
+    buf.append('  <i name="program" type="string">vasp </i>')
+    buf.append('  <i name="version" type="string">5.3.3  </i>')
+    buf.append('  <i name="date" type="string">2013 10 18 </i>')
+    buf.append('  <i name="time" type="string">08:44:21 </i>')
+    buf.append(' </generator>')
+    buf.append(' <incar>')
+    buf.append('  <i type="string" name="SYSTEM">%s</i>' % (sysName,))
+    buf.append('  <i name="ISPIN">      %d</i>' % (ss.numSpin,))
+    buf.append('  <i type="string" name="ALGO">Fast</i>')
+    buf.append('  <i name="IBRION">      2</i>')
+    buf.append('  <i name="ISIF">      3</i>')
+    buf.append('  <i name="EDIFF">      0.00010000</i>')
+    buf.append('  <i name="ENCUT">    340.00000000</i>')
+    buf.append(' </incar>')
+    buf.append(' <kpoints>')
+    addVarray( buf, 'kpointlist', kpFracMat)
+    addVarray( buf, 'weights', kpWts.reshape( [ss.numKpoint, 1]))
+    buf.append(' </kpoints>')
+    buf.append(' <parameters>')
+    buf.append('  <separator name="general" >')
+    buf.append('   <i type="string" name="SYSTEM">%s</i>' % (sysName,))
+    buf.append('  </separator>')
+    buf.append('  <separator name="electronic" >')
+    buf.append('   <i type="string" name="PREC">normal</i>')
+    buf.append('   <i name="ENCUT">    340.00000000</i>')
+    buf.append('   <i type="int" name="NBANDS">    %d</i>' % (ss.numBand,))
+    buf.append('   <i name="NELECT">     %.8f</i>' % (totalValence,))
+    buf.append('   <i type="int" name="IALGO">    68</i>')
+    buf.append('   <separator name="electronic startup" >')
+    buf.append('    <i type="int" name="ICHARG">     2</i>')
+    buf.append('   </separator>')
+    buf.append('   <separator name="electronic spin" >')
+    buf.append('    <i type="int" name="ISPIN">     %d</i>' % (ss.numSpin,))
+    buf.append('   </separator>')
+    buf.append('  </separator>')
+    buf.append('  <separator name="ionic" >')
+    buf.append('   <i type="int" name="IBRION">     2</i>')
+    buf.append('   <i type="int" name="ISIF">     3</i>')
+    buf.append('  </separator>')
+    buf.append(' </parameters>')
+    buf.append(' <atominfo>')
+    buf.append('  <atoms>      %d </atoms>' % (ss.numAtom,))
+    buf.append('  <types>       %d </types>' % (len( synTypeNames),))
+    buf.append('  <array name="atoms" >')
+    buf.append('   <dimension dim="1">ion</dimension>')
+    buf.append('   <field type="string">element</field>')
+    buf.append('   <field type="int">atomtype</field>')
+    buf.append('   <set>')
+    for itype in range( len( synTypeNames)):
+      for ii in range( typeNums[itype]):
+        buf.append('    <rc><c>%-2s</c><c>   %d</c></rc>' \
+          % (synTypeNames[itype], itype + 1,))
+    buf.append('   </set>')
+    buf.append('  </array>')
+    buf.append('  <array name="atomtypes" >')
+    buf.append('   <dimension dim="1">type</dimension>')
+    buf.append('   <field type="int">atomspertype</field>')
+    buf.append('   <field type="string">element</field>')
+    buf.append('   <field>mass</field>')
+    buf.append('   <field>valence</field>')
+    buf.append('   <field type="string">pseudopotential</field>')
+    buf.append('   <set>')
+    for itype in range( len( synTypeNames)):
+      buf.append(('    <rc><c>   %d</c><c>%-2s</c><c>  %14.8f</c>'
+        + '<c>  %14.8f</c><c>  %-36s</c></rc>') \
+        % (typeNums[itype], synTypeNames[itype], synTypeMasses[itype],
+        synTypeValences[itype], synTypePseudos[itype],))
+    buf.append('   </set>')
+    buf.append('  </array>')
+    buf.append(' </atominfo>')
+    addStructure( buf, 'initialpos', basisMat, fracPosMat)
+    nline += writeBuf( fout, buf)
+
+    for istep in range( ss.numStep):
+      # Each ionic step the cell and atoms move slightly.
+      stepBasisMat = basisMat + 0.001 * istep * np.eye( 3)
+      stepFracMat = fracPosMat + 0.0005 * rand.rand( ss.numAtom, 3)
+      forceMat = 0.05 * (rand.rand( ss.numAtom, 3) - 0.5)
+      stressMat = 10 * rand.rand( 3, 3)
+      stressMat = 0.5 * (stressMat + stressMat.T)
+      energy = -60.5 - 0.01 * istep + 0.001 * rand.rand()
+
+      buf.append(' <calculation>')
+      for ielec in range( ss.numElec):
+        buf.append('  <scstep>')
+        buf.append('   <time name="dav">    0.07    0.07</time>')
+        buf.append('   <time name="total">    0.10    0.11</time>')
+        buf.append('   <energy>')
+        buf.append('    <i name="e_fr_energy">  %16.8f </i>' % (energy,))
+        buf.append('    <i name="e_wo_entrp">  %16.8f </i>' % (energy,))
+        buf.append('    <i name="e_0_energy">  %16.8f </i>' % (energy,))
+        buf.append('   </energy>')
+        buf.append('  </scstep>')
+      addStructure( buf, None, stepBasisMat, stepFracMat)
+      addVarray( buf, 'forces', forceMat)
+      addVarray( buf, 'stress', stressMat)
+      buf.append('  <energy>')
+      buf.append('   <i name="e_fr_energy">  %16.8f </i>' % (energy,))
+      buf.append('   <i name="e_wo_entrp">  %16.8f </i>' % (energy,))
+      buf.append('   <i name="e_0_energy">  %16.8f </i>' % (energy,))
+      buf.append('  </energy>')
+      buf.append('  <time name="totalsc">   %.2f   %.2f</time>' \
+        % (22.49 + istep, 24.43 + istep,))
+
+      if istep == ss.numStep - 1:
+        buf.append('  <eigenvalues>')
+        buf.append('   <array>')
+        buf.append('    <dimension dim="1">band</dimension>')
+        buf.append('    <dimension dim="2">kpoint</dimension>')
+        buf.append('    <dimension dim="3">spin</dimension>')
+        buf.append('    <field>eigene</field>')
+        buf.append('    <field>occ</field>')
+        buf.append('    <set>')
+        for isp in range( ss.numSpin):
+          buf.append('     <set comment="spin %d">' % (isp + 1,))
+          for ikp in range( ss.numKpoint):
+            buf.append('      <set comment="kpoint %d">' % (ikp + 1,))
+            for iband in range( ss.numBand):
+              occ = 0.0
+              if iband < numOcc: occ = 1.0
+              buf.append('       <r> %10.4f %9.4f </r>' \
+                % (eigenMat[isp, ikp, iband], occ,))
+            buf.append('      </set>')
+          buf.append('     </set>')
+        buf.append('    </set>')
+        buf.append('   </array>')
+        buf.append('  </eigenvalues>')
+        buf.append('  <dos>')
+        buf.append('   <i name="efermi">     %.8f </i>' % (efermi,))
+        if ss.numDos > 0:
+          buf.append('   <total>')
+          buf.append('    <array>')
+          buf.append('     <dimension dim="1">gridpoints</dimension>')
+          buf.append('     <dimension dim="2">spin</dimension>')
+          buf.append('     <field>energy</field>')
+          buf.append('     <field>total</field>')
+          buf.append('     <field>integrated</field>')
+          buf.append('     <set>')
+          for isp in range( ss.numSpin):
+            buf.append('      <set comment="spin %d">' % (isp + 1,))
+            for idos in range( ss.numDos):
+              buf.append('       <r> %10.4f %10.4f %10.4f </r>' \
+                % (dosEnergies[idos], dosTotalMat[isp, idos],
+                dosIntegMat[isp, idos],))
+            buf.append('      </set>')
+          buf.append('     </set>')
+          buf.append('    </array>')
+          buf.append('   </total>')
+          buf.append('   <partial>')
+          buf.append('    <array>')
+          buf.append('     <dimension dim="1">gridpoints</dimension>')
+          buf.append('     <dimension dim="2">spin</dimension>')
+          buf.append('     <dimension dim="3">ion</dimension>')
+          buf.append('     <field>energy</field>')
+          for field in dosFields:
+            buf.append('     <field>%5s</field>' % (field,))
+          buf.append('     <set>')
+          for iatom in range( ss.numAtom):
+            buf.append('      <set comment="ion %d">' % (iatom + 1,))
+            for isp in range( ss.numSpin):
+              buf.append('       <set comment="spin %d">' % (isp + 1,))
+              for idos in range( ss.numDos):
+                buf.append('        <r> %10.4f' % (dosEnergies[idos],)
+                  + ''.join( [' %9.4f' % (x,)
+                  for x in dosPartialMat[iatom, isp, idos]])
+                  + ' </r>')
+              buf.append('       </set>')
+            buf.append('      </set>')
+            nline += writeBuf( fout, buf)
+          buf.append('     </set>')
+          buf.append('    </array>')
+          buf.append('   </partial>')
+        buf.append('  </dos>')
+
+      buf.append(' </calculation>')
+      nline += writeBuf( fout, buf)
+
+    addStructure( buf, 'finalpos', stepBasisMat, stepFracMat)
+    buf.append('</modeling>')
+    nline += writeBuf( fout, buf)
+
+  if bugLev >= 1:
+    print 'writeXmlSet: outDir: %s  nline: %d' % (outDir, nline,)
+  return nline
+
+#====================================================================
+#====================================================================
+
+def benchOutcarIndex( bugLev, inDir):
+  '''
+  Compares the indexed :meth:`ScanOutcar.ScanOutcar.findLines`
+  with a full scan of all lines, the way findLines used to work,
+  for all the patterns used by ScanOutcar.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  # Record the pattern lists that ScanOutcar passes to findLines.
+  patLists = []
+  origFindLines = ScanOutcar.ScanOutcar.findLines
+  def recordFindLines( self, pats, numMin, numMax):
+    if pats not in patLists: patLists.append( pats)
+    return origFindLines( self, pats, numMin, numMax)
+  ScanOutcar.ScanOutcar.findLines = recordFindLines
+  try:
+    resObj = ScanOutcar.ResClass()
+    (tmScan, scanner) = timeCall( lambda: ScanOutcar.ScanOutcar(
+      bugLev, inDir, resObj, keepLines=True))
+  finally:
+    ScanOutcar.ScanOutcar.findLines = origFindLines
+  # getScalars uses the index without calling findLines.
+  for spec in ScanOutcar.scalarSpecs:
+    if [spec.pat] not in patLists: patLists.append( [spec.pat])
+  logit('outcarIndex: numLine: %d  full ScanOutcar: %.3f s' \
+    % (scanner.numLine, tmScan,))
+
+  (tmIndex, junk) = timeCall( scanner.buildIndex)
+  logit('outcarIndex: buildIndex: %.3f s' % (tmIndex,))
+
+  tmIndexed = 0
+  tmFull = 0
+  for pats in patLists:
+    (tma, ixsa) = timeCall( scanner.findLines, pats, 0, 0)
+    (tmb, ixsb) = timeCall( findLinesFull, scanner.lines, pats)
+    if ixsa != ixsb:
+      throwerr('findLines mismatch for pats: %s\n  indexed: %s\n  full: %s' \
+        % (pats, ixsa, ixsb,))
+    tmIndexed += tma
+    tmFull += tmb
+    if bugLev >= 1:
+      print '  pat: %-60s  num: %6d  indexed: %.4f s  full: %.4f s' \
+        % (repr( pats[0])[:60], len( ixsa), tma, tmb,)
+
+  logit('outcarIndex: num pats: %d' % (len( patLists),))
+  logit('outcarIndex: indexed findLines: %.3f s  (plus buildIndex %.3f s)' \
+    % (tmIndexed, tmIndex,))
+  scanner.closeLines()
+  logit('outcarIndex: full scan findLines: %.3f s' % (tmFull,))
+  if tmIndexed + tmIndex > 0:
+    logit('outcarIndex: speedup: %.1f' % (tmFull / (tmIndexed + tmIndex),))
+
+#====================================================================
+
+def benchOutcarRead( bugLev, inDir):
+  '''
+  Compares the time and peak memory of the old list reader,
+  :class:`ScanOutcar.MmapLines`, and :func:`ScanOutcar.readStreamLines`.
+  Since ru_maxrss never decreases, each reader runs
+  in its own process, via ``-func outcarReadOne``.
+  For mmap, ru_maxrss includes the mapped file pages that were
+  touched; those are clean page cache pages that the
+  kernel can drop, unlike the list of line strings.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  for readMode in ['list', 'mmap', 'stream']:
+    cmd = [sys.executable, os.path.abspath( __file__),
+      '-bugLev', str( bugLev), '-func', 'outcarReadOne',
+      '-readMode', readMode, '-inDir', inDir]
+    proc = subprocess.Popen( cmd, stdout=subprocess.PIPE)
+    (stdout, stderr) = proc.communicate()
+    if proc.returncode != 0:
+      throwerr('outcarReadOne failed: rc: %d  cmd: %s' \
+        % (proc.returncode, cmd,))
+    toks = stdout.strip().split('\n')[-1].split()
+    if len( toks) != 6 or toks[0] != 'outcarReadOne:':
+      throwerr('invalid outcarReadOne output: %s' % (stdout,))
+    (numLine, tm, baseRss, peakRss) = (
+      int( toks[2]), float( toks[3]), int( toks[4]), int( toks[5]))
+    logit(('outcarRead: %-6s  numLine: %d  time: %.3f s'
+      + '  peak rss: %.1f MB  growth: %.1f MB') \
+      % (readMode, numLine, tm, peakRss / 1024.,
+      (peakRss - baseRss) / 1024.,))
+
+#====================================================================
+
+# Reads the OUTCAR with the given readMode, makes one pass
+# over all lines, and prints a single result line:
+#   outcarReadOne: readMode numLine seconds baseRssKb peakRssKb
+
+def benchOutcarReadOne( bugLev, inDir, readMode):
+  fname = os.path.join( inDir, 'OUTCAR')
+  baseRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  tma = time.time()
+  if readMode == 'list':        # the way ScanOutcar used to read
+    with open( fname) as fin:
+      lines = fin.readlines()
+    for ii in range( len( lines)):
+      lines[ii] = lines[ii].strip()
+  elif readMode == 'mmap':
+    lines = ScanOutcar.MmapLines( fname)
+  elif readMode == 'stream':
+    lines = ScanOutcar.readStreamLines( fname)
+  else: throwerr('unknown readMode: %s' % (readMode,))
+
+  numLine = len( lines)
+  numChar = 0
+  for line in lines:
+    numChar += len( line)
+  tmb = time.time()
+  peakRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  if bugLev >= 1:
+    print 'outcarReadOne: numChar: %d' % (numChar,)
+  print 'outcarReadOne: %s %d %.6f %d %d' \
+    % (readMode, numLine, tmb - tma, baseRss, peakRss,)
+
+#====================================================================
+
+# Patterns of the last-occurrence sections that ScanOutcar
+# finds with findLastLine.
+
+tailPats = [
+  r'^volume of cell *: +([-.E0-9]+)$',
+  r'^POSITION +TOTAL-FORCE \(eV/Angst\)$',
+  r'^FORCE on cell *= *-STRESS in cart. coord. +units \(eV\) *:$',
+]
+
+def benchOutcarTail( bugLev, inDir):
+  '''
+  Compares :meth:`ScanOutcar.ScanOutcar.findLastLine`, which
+  searches backward through the indexed candidate lines,
+  with a forward scan of all lines, for the last-occurrence sections.
+  The index is built once per OUTCAR for all the getters,
+  so its time is shown but not charged to findLastLine.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  resObj = ScanOutcar.ResClass()
+  scanner = ScanOutcar.ScanOutcar( bugLev, inDir, resObj, keepLines=True)
+  (tmIndex, junk) = timeCall( scanner.buildIndex)
+  logit('outcarTail: numLine: %d  buildIndex: %.3f s' \
+    % (scanner.numLine, tmIndex,))
+
+  tmTail = 0
+  tmFull = 0
+  for pat in tailPats:
+    (tma, ixa) = timeCall( scanner.findLastLine, pat, 0)
+    (tmb, ixsb) = timeCall( findLinesFull, scanner.lines, [pat])
+    if len( ixsb) == 0: ixb = None
+    else: ixb = ixsb[-1]
+    if ixa != ixb:
+      throwerr('findLastLine mismatch for pat: %s  tail: %s  full: %s' \
+        % (pat, ixa, ixb,))
+    tmTail += tma
+    tmFull += tmb
+    logit('outcarTail: pat: %-40s  ix: %s  tail: %.4f s  full: %.4f s' \
+      % (repr( pat)[:40], ixa, tma, tmb,))
+  scanner.closeLines()
+
+  logit('outcarTail: tail: %.4f s  full: %.3f s' % (tmTail, tmFull,))
+  if tmTail > 0:
+    logit('outcarTail: speedup: %.1f' % (tmFull / tmTail,))
+
+#====================================================================
+
+def benchEigenParse( bugLev, inDir):
+  '''
+  Compares the bulk eigenvalue parse,
+  :meth:`ScanOutcar.ScanOutcar.parseEigenBlock`,
+  with the per-k-point parseMatrix loop, :func:`parseEigenLoop`.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  resObj = ScanOutcar.ResClass()
+  scanner = ScanOutcar.ScanOutcar( bugLev, inDir, resObj, keepLines=True)
+  numSpin = resObj.numSpin
+  numKpoint = resObj.numKpoint
+  numBand = resObj.numBand
+  logit('eigenParse: numSpin: %d  numKpoint: %d  numBand: %d' \
+    % (numSpin, numKpoint, numBand,))
+
+  kpFirstPat = '^k-point +1 *: +[-.E0-9]+ +[-.E0-9]+ +[-.E0-9]+$'
+  bandPat    = '^band No. +band energies +occupation$'
+  firstIxs = scanner.findLines( [kpFirstPat, bandPat], 1, 0)
+
+  tmBulk = 0
+  tmLoop = 0
+  for isp in range( numSpin):
+    istart = firstIxs[ -numSpin + isp]
+    (tma, mata) = timeCall(
+      scanner.parseEigenBlock, istart, numKpoint, numBand)
+    (tmb, matb) = timeCall(
+      parseEigenLoop, scanner, istart, numKpoint, numBand)
+    if not np.array_equal( mata, matb):
+      throwerr('eigenParse mismatch.  isp: %d  max delta: %g' \
+        % (isp, np.max( np.abs( mata - matb)),))
+    tmBulk += tma
+    tmLoop += tmb
+  scanner.closeLines()
+
+  logit('eigenParse: bulk: %.3f s  loop: %.3f s' % (tmBulk, tmLoop,))
+  if tmBulk > 0:
+    logit('eigenParse: speedup: %.1f' % (tmLoop / tmBulk,))
+
+#====================================================================
+
+# The pre-bulk version of the ScanOutcar.getEigenMat parse:
+# one parseMatrix call per k-point.
+# Used as the reference implementation.
+
+def parseEigenLoop( scanner, istart, numKpoint, numBand):
+  tmat = np.zeros( [numKpoint, numBand, 2])
+  for ikp in range( numKpoint):
+    isection = istart + 2 + ikp * (3 + numBand)
+    tmat[ikp] = scanner.parseMatrix(
+      3, isection, isection + numBand, 1, 3)  # ntok,rBeg,rEnd,cBeg,cEnd
+  return tmat
+
+#====================================================================
+
+def benchEfermi( bugLev, inDir):
+  '''
+  Compares :meth:`ScanOutcar.ScanOutcar.calcEfermi` with the
+  replicate-and-sort version, :func:`calcEfermiRepl`,
+  on the run in inDir and on random variations of it:
+  eigenvalues rounded to create ties, and integer kpoint weights.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  resObj = ScanOutcar.ResClass()
+  scanner = ScanOutcar.ScanOutcar( bugLev, inDir, resObj)
+  logit('efermi: numSpin: %d  numKpoint: %d  numBand: %d' \
+    % (resObj.numSpin, resObj.numKpoint, resObj.numBand,))
+
+  ranGen = np.random.RandomState( 1)
+  numTrial = 20
+  tmNew = 0
+  tmOld = 0
+  for itrial in range( numTrial + 1):
+    if itrial > 0:
+      # Random variation: ties, weights, and valence.
+      resObj.eigenMat = np.round( ranGen.normal(
+        0, 5, resObj.eigenMat.shape), ranGen.randint( 0, 3))
+      resObj.kpointMults = map( float,
+        ranGen.randint( 1, 49, resObj.numKpoint))
+      resObj.totalValence = ranGen.randint( 1, 2 * resObj.numBand)
+    (tma, junk) = timeCall( scanner.calcEfermi, resObj)
+    (tmb, efermiOld) = timeCall( calcEfermiRepl, resObj)
+    if resObj.efermiCalc != efermiOld:
+      throwerr('efermi mismatch.  itrial: %d  new: %g  old: %g' \
+        % (itrial, resObj.efermiCalc, efermiOld,))
+    if bugLev >= 1:
+      print '  itrial: %2d  efermiCalc: %10.4f  new: %.4f s  old: %.4f s' \
+        % (itrial, resObj.efermiCalc, tma, tmb,)
+    tmNew += tma
+    tmOld += tmb
+
+  logit('efermi: num runs: %d, all match' % (numTrial + 1,))
+  logit('efermi: new: %.3f s  old: %.3f s' % (tmNew, tmOld,))
+  if tmNew > 0:
+    logit('efermi: speedup: %.1f' % (tmOld / tmNew,))
+
+#====================================================================
+
+# The pre-vectorized version of ScanOutcar.calcEfermi:
+# replicate each eigenvalue by its kpoint weight, and again
+# if numSpin == 1, sort, and index.
+# Used as the reference implementation.  Returns efermiCalc.
+
+def calcEfermiRepl( resObj):
+  numSpin = resObj.numSpin
+  numKpoint = resObj.numKpoint
+  numBand = resObj.numBand
+
+  numEig = 0
+  for ikp in range( numKpoint):
+    numEig += numBand * resObj.kpointMults[ikp]
+  numEig *= 2    # for two spin levels, whether numSpin is 1 or 2
+  numEig = int( round( numEig))
+
+  allEigs = np.zeros( [numEig])
+  kk = 0
+  for isp in range( numSpin):
+    for ikp in range( numKpoint):
+      for iband in range( numBand):
+        for irepl in range( int( round( resObj.kpointMults[ ikp]))):
+          allEigs[kk] = resObj.eigenMat[ isp, ikp, iband]
+          kk += 1
+          if numSpin == 1:
+            allEigs[kk] = allEigs[kk-1]
+            kk += 1
+  if kk != numEig: throwerr('numEig mismatch')
+  allEigs.sort()
+
+  dindx = resObj.totalValence * sum( resObj.kpointMults)
+  indx = int( round( dindx)) - 1
+  if indx < 0 or indx >= allEigs.shape[0]:
+    throwerr('bad fermi.  dindx: %g  indx: %d' % (dindx, indx,))
+  return allEigs[indx]
+
+#====================================================================
+
+def benchBandgaps( bugLev, inDir):
+  '''
+  Compares :meth:`ScanOutcar.ScanOutcar.calcBandgaps` with the
+  element by element version, :func:`calcBandgapsLoop`,
+  on the run in inDir and on random variations of it:
+  eigenvalues rounded to create ties, and efermiCalc values
+  that may fall below or above all the eigenvalues.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing OUTCAR, INCAR, POSCAR.
+
+  **Returns**:
+
+  * None
+  '''
+
+  resObj = ScanOutcar.ResClass()
+  scanner = ScanOutcar.ScanOutcar( bugLev, inDir, resObj)
+  logit('bandgaps: numSpin: %d  numKpoint: %d  numBand: %d' \
+    % (resObj.numSpin, resObj.numKpoint, resObj.numBand,))
+  tags = ['cbMinVals', 'cbMinIxs', 'vbMaxVals', 'vbMaxIxs',
+    'bandgapDirects', 'bandgapIndirects']
+
+  ranGen = np.random.RandomState( 1)
+  numTrial = 8
+  tmNew = 0
+  tmOld = 0
+  for itrial in range( numTrial + 1):
+    if itrial > 0:
+      resObj.eigenMat = np.round( ranGen.normal(
+        0, 5, resObj.eigenMat.shape), ranGen.randint( 0, 3))
+      resObj.efermiCalc = [ranGen.normal( 0, 5), resObj.eigenMat[0,0,0],
+        -100., 100.][itrial % 4]
+    (tma, junk) = timeCall( scanner.calcBandgaps, resObj)
+    (tmb, oldMap) = timeCall( calcBandgapsLoop, resObj)
+    for tag in tags:
+      newVal = getattr( resObj, tag)
+      oldVal = oldMap[tag]
+      if isinstance( oldVal, np.ndarray):
+        isOk = newVal.dtype == oldVal.dtype \
+          and np.array_equal( newVal, oldVal)
+      else: isOk = newVal == oldVal
+      if not isOk:
+        throwerr('bandgaps mismatch.  itrial: %d  tag: %s  new: %s  old: %s' \
+          % (itrial, tag, newVal, oldVal,))
+    if bugLev >= 1:
+      print '  itrial: %d  bandgapDirects: %s  new: %.4f s  old: %.4f s' \
+        % (itrial, resObj.bandgapDirects, tma, tmb,)
+    tmNew += tma
+    tmOld += tmb
+
+  logit('bandgaps: num runs: %d, all match' % (numTrial + 1,))
+  logit('bandgaps: new: %.3f s  old: %.3f s' % (tmNew, tmOld,))
+  if tmNew > 0:
+    logit('bandgaps: speedup: %.1f' % (tmOld / tmNew,))
+
+#====================================================================
+
+# The pre-vectorized version of ScanOutcar.calcBandgaps.
+# Used as the reference implementation.  Returns a map
+# of tag -> value for cbMinVals, cbMinIxs, vbMaxVals, vbMaxIxs,
+# bandgapDirects, bandgapIndirects.
+
+def calcBandgapsLoop( resObj):
+  numSpin = resObj.numSpin
+  numKpoint = resObj.numKpoint
+  numBand = resObj.numBand
+
+  cbMinMat = np.empty( [numSpin, numKpoint], dtype=float)
+  vbMaxMat = np.empty( [numSpin, numKpoint], dtype=float)
+  cbMinMat.fill( np.inf)
+  vbMaxMat.fill( -np.inf)
+  cbMinVals = np.empty( [numSpin], dtype=float)
+  vbMaxVals = np.empty( [numSpin], dtype=float)
+  cbMinVals.fill( np.inf)
+  vbMaxVals.fill( -np.inf)
+  cbMinIxs = np.empty( [numSpin], dtype=int)
+  vbMaxIxs = np.empty( [numSpin], dtype=int)
+  cbMinIxs.fill( -1)
+  vbMaxIxs.fill( -1)
+
+  for isp in range( numSpin):
+    for ikp in range( numKpoint):
+      for iband in range( numBand):
+        val = resObj.eigenMat[isp][ikp][iband]
+        if val <= resObj.efermiCalc:
+          if val > vbMaxMat[isp][ikp]: vbMaxMat[isp][ikp] = val
+          if val > vbMaxVals[isp]:
+            vbMaxVals[isp] = val
+            vbMaxIxs[isp] = ikp
+        else:
+          if val < cbMinMat[isp][ikp]: cbMinMat[isp][ikp] = val
+          if val < cbMinVals[isp]:
+            cbMinVals[isp] = val
+            cbMinIxs[isp] = ikp
+
+  bandgapDirects = numSpin * [np.inf]
+  bandgapIndirects = numSpin * [np.inf]
+  for isp in range( numSpin):
+    for ikp in range( numKpoint):
+      gap = max( 0, cbMinMat[isp][ikp] - vbMaxMat[isp][ikp])
+      if gap < bandgapDirects[isp]: bandgapDirects[isp] = gap
+    bandgapIndirects[isp] = max( 0, cbMinVals[isp] - vbMaxVals[isp])
+
+  return {
+    'cbMinVals': cbMinVals,
+    'cbMinIxs': cbMinIxs,
+    'vbMaxVals': vbMaxVals,
+    'vbMaxIxs': vbMaxIxs,
+    'bandgapDirects': bandgapDirects,
+    'bandgapIndirects': bandgapIndirects,
+  }
+
+#====================================================================
+
+def benchXmlRead( bugLev, inDir):
+  '''
+  Compares the time and peak memory of :func:`ScanXml.parseXml`
+  with readMode 'tree', which parses the whole vasprun.xml,
+  and readMode 'stream', which keeps only the last calculation.
+  Each mode runs in its own process, via ``-func xmlReadOne``.
+  Then both modes run in this process, to check that they
+  fill identical resObjs.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  for readMode in ['tree', 'stream']:
+    (tm, baseRss, peakRss) = runXmlReadOne( bugLev, inDir, readMode, 'all')
+    logit(('xmlRead: %-6s  time: %.3f s'
+      + '  peak rss: %.1f MB  growth: %.1f MB') \
+      % (readMode, tm, peakRss / 1024., (peakRss - baseRss) / 1024.,))
+
+  fname = os.path.join( inDir, 'vasprun.xml')
+  resMap = {}
+  for readMode in ['tree', 'stream']:
+    resObj = ScanXml.ResClass()
+    ScanXml.parseXml( bugLev, fname, 0, resObj, readMode=readMode)
+    resMap[readMode] = resObj.getFieldMap()
+  diffKeys = compareAttrs( resMap['tree'], resMap['stream'])
+  if len( diffKeys) > 0:
+    throwerr('xmlRead: tree and stream differ for: %s' % (diffKeys,))
+  logit('xmlRead: tree and stream results agree: %d attributes' \
+    % (len( resMap['tree']),))
+
+#====================================================================
+
+# Parses the vasprun.xml with the given readMode, dosMode,
+# sections and engine, and prints a single result line:
+#   xmlReadOne: readMode seconds baseRssKb peakRssKb
+
+def benchXmlReadOne( bugLev, inDir, readMode, dosMode, sections, engine):
+  fname = os.path.join( inDir, 'vasprun.xml')
+  baseRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  resObj = ScanXml.ResClass()
+  (tm, junk) = timeCall( ScanXml.parseXml,
+    bugLev, fname, 0, resObj, readMode, False, dosMode, sections, engine)
+  peakRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  print 'xmlReadOne: %s %.6f %d %d' % (readMode, tm, baseRss, peakRss,)
+
+#====================================================================
+
+# Runs xmlReadOne in a separate process, and returns
+# (seconds, baseRssKb, peakRssKb).
+
+def runXmlReadOne( bugLev, inDir, readMode, dosMode, sections=None,
+  engine='celement'):
+  cmd = [sys.executable, os.path.abspath( __file__),
+    '-bugLev', str( bugLev), '-func', 'xmlReadOne',
+    '-readMode', readMode, '-dosMode', dosMode, '-engine', engine,
+    '-inDir', inDir]
+  if sections != None: cmd += ['-sections', ','.join( sections)]
+  proc = subprocess.Popen( cmd, stdout=subprocess.PIPE)
+  (stdout, stderr) = proc.communicate()
+  if proc.returncode != 0:
+    throwerr('xmlReadOne failed: rc: %d  cmd: %s' \
+      % (proc.returncode, cmd,))
+  toks = stdout.strip().split('\n')[-1].split()
+  if len( toks) != 5 or toks[0] != 'xmlReadOne:':
+    throwerr('invalid xmlReadOne output: %s' % (stdout,))
+  return (float( toks[2]), int( toks[3]), int( toks[4]))
+
+#====================================================================
+
+def benchXmlArray( bugLev, inDir):
+  '''
+  Compares the single pass :func:`ScanXml.getArrayByNode`
+  with the per-field version it replaced, :func:`getArrayByNodeLoop`,
+  on every ``<array>`` element in the vasprun.xml.
+  Then compares the bulk :func:`ScanXml.getRawArray` with the
+  token by token version it replaced, :func:`getRawArrayLoop`,
+  on every ``<varray>`` element.
+  Use a large -numKpoint and -numBand, and a small -numStep.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  fname = os.path.join( inDir, 'vasprun.xml')
+  root = ScanXml.etree.parse( fname).getroot()
+  arrNodes = root.findall('.//array')
+
+  tmSingle = 0
+  tmLoop = 0
+  for arrNode in arrNodes:
+    (tma, mapa) = timeCall( ScanXml.getArrayByNode, bugLev, arrNode)
+    (tmb, mapb) = timeCall( getArrayByNodeLoop, bugLev, arrNode)
+    diffKeys = compareAttrs( mapa, mapb)
+    if len( diffKeys) > 0:
+      throwerr('xmlArray mismatch.  array: %s  keys: %s' \
+        % (arrNode.attrib, diffKeys,))
+    tmSingle += tma
+    tmLoop += tmb
+    if bugLev >= 1:
+      print '  array: %-24s  dimLens: %-16s  single: %.4f s  loop: %.4f s' \
+        % (arrNode.attrib.get('name'), mapa['_dimLens'], tma, tmb,)
+
+  logit('xmlArray: num arrays: %d' % (len( arrNodes),))
+  logit('xmlArray: single: %.3f s  loop: %.3f s' % (tmSingle, tmLoop,))
+  if tmSingle > 0:
+    logit('xmlArray: speedup: %.1f' % (tmLoop / tmSingle,))
+
+  # Each varray, as a path relative to its parent.
+  varrayNodes = []
+  for parent in root.iter():
+    for kid in parent.findall('varray'):
+      varrayNodes.append( (parent, 'varray[@name=\'%s\']/v' \
+        % (kid.attrib['name'],)))
+
+  tmBulk = 0
+  tmLoop = 0
+  for (parent, path) in varrayNodes:
+    (tma, mata) = timeCall( ScanXml.getRawArray, parent, path, 0, 0, float)
+    (tmb, matb) = timeCall( getRawArrayLoop, parent, path)
+    if not (mata.shape == matb.shape and np.array_equal( mata, matb)):
+      throwerr('xmlArray: getRawArray mismatch.  path: %s' % (path,))
+    tmBulk += tma
+    tmLoop += tmb
+  logit('xmlArray: num varrays: %d' % (len( varrayNodes),))
+  logit('xmlArray: getRawArray bulk: %.3f s  loop: %.3f s' \
+    % (tmBulk, tmLoop,))
+  if tmBulk > 0:
+    logit('xmlArray: getRawArray speedup: %.1f' % (tmLoop / tmBulk,))
+
+#====================================================================
+
+# The pre-single-pass version of ScanXml.getArrayByNode:
+# one traversal of the <set> tree per field, sniffing the
+# type of every value, and converting nested lists of strings.
+# Used as the reference implementation.
+
+def getArrayByNodeLoop( bugLev, arrNode):
+  dimNodes = arrNode.findall('dimension')
+  ndim = len( dimNodes)
+  dimNames = [nd.text for nd in dimNodes]
+  dimNames.reverse()
+  dimLens = np.zeros( [ndim], dtype=int)
+  fieldNames = [nd.text for nd in arrNode.findall('field')]
+  nfield = len( fieldNames)
+  fieldTypes = nfield * [0]
+  setNode = arrNode.findall('set')[0]
+
+  resMap = {
+    '_dimNames': np.array( dimNames, dtype=str),
+    '_dimLens': dimLens,
+    '_fieldNames': np.array( fieldNames, dtype=str),
+  }
+  for ifield in range( nfield):
+    amat = getArraySubLoop( setNode, ifield, fieldTypes, 0, dimLens)
+    tp = [int, float, str][fieldTypes[ifield]]
+    resMap[fieldNames[ifield]] = np.array( amat, dtype=tp)
+  resMap['_fieldTypes'] = np.array(
+    [ 'ifs'[ftype] for ftype in fieldTypes], dtype=str)
+  return resMap
+
+
+# The pre-bulk version of ScanXml.getRawArray, for floats:
+# parseText on each row.
+# Used as the reference implementation.
+
+def getRawArrayLoop( root, path):
+  rows = [ScanXml.parseText( path, 0, 0, float, ele.text)
+    for ele in root.findall( path)]
+  return np.array( rows, dtype=float)
+
+
+def getArraySubLoop( setNode, ifield, fieldTypes, idim, dimLens):
+  if idim == len( dimLens) - 1:
+    rcNodes = setNode.findall('rc')
+    rNodes = setNode.findall('r')
+    nval = max( len( rcNodes), len( rNodes))
+    if dimLens[idim] == 0: dimLens[idim] = nval
+    if len( rcNodes) > 0:
+      resVec = [ nd.findall('c')[ifield].text.strip() for nd in rcNodes]
+    else:
+      resVec = [ nd.text.split()[ifield] for nd in rNodes]
+    for stg in resVec:
+      ftype = 2
+      try:
+        float( stg)
+        ftype = 1
+      except ValueError: pass
+      try:
+        int( stg)
+        ftype = 0
+      except ValueError: pass
+      fieldTypes[ifield] = max( fieldTypes[ifield], ftype)
+  else:
+    setNodes = setNode.findall('set')
+    if dimLens[idim] == 0: dimLens[idim] = len( setNodes)
+    resVec = [ getArraySubLoop( nd, ifield, fieldTypes, idim + 1, dimLens)
+      for nd in setNodes]
+  return resVec
+
+#====================================================================
+
+def benchXmlAnchors( bugLev, inDir):
+  '''
+  Compares the lookups made by :func:`ScanXml.parseXml`,
+  relative to the anchor elements found once by
+  :func:`ScanXml.getAnchors`, with the same lookups made
+  by full paths from the root, the way parseXml used to work.
+  Reports the per-file parse time before and after.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  fname = os.path.join( inDir, 'vasprun.xml')
+
+  # Record the (node, path) pairs that parseXml looks up.
+  lookups = []
+  origFuncs = (ScanXml.getString, ScanXml.getRawArray, ScanXml.getArrayByPath)
+  def recordString( root, path):
+    lookups.append( (root, path))
+    return origFuncs[0]( root, path)
+  def recordRawArray( root, path, nrow, ncol, dtype):
+    lookups.append( (root, path))
+    return origFuncs[1]( root, path, nrow, ncol, dtype)
+  def recordArrayByPath( bugLev, baseNode, path):
+    lookups.append( (baseNode, path))
+    return origFuncs[2]( bugLev, baseNode, path)
+  (ScanXml.getString, ScanXml.getRawArray, ScanXml.getArrayByPath) \
+    = (recordString, recordRawArray, recordArrayByPath)
+  try:
+    origParse = ScanXml.etree.parse
+    trees = []
+    def keepParse( inFile):
+      trees.append( origParse( inFile))
+      return trees[-1]
+    ScanXml.etree.parse = keepParse
+    try:
+      resObj = ScanXml.ResClass()
+      (tmTotal, junk) = timeCall( ScanXml.parseXml,
+        bugLev, fname, 0, resObj, 'tree', False, 'all', None, 'celement')
+    finally:
+      ScanXml.etree.parse = origParse
+  finally:
+    (ScanXml.getString, ScanXml.getRawArray, ScanXml.getArrayByPath) \
+      = origFuncs
+  root = trees[0].getroot()
+
+  # After: getAnchors, then the relative lookups.
+  # Before: the same lookups by full paths from the root.
+  (tmAnchors, anchors) = timeCall( ScanXml.getAnchors, bugLev, root)
+  anchorNames = {}
+  for (name, node) in anchors.items():
+    if name != 'calculations': anchorNames[id( node)] = name
+
+  # Some lookups are relative to other nodes, like the spin sets
+  # that getDos reads.  They are the same before and after, so skip them.
+  numOther = len( lookups)
+  lookups = [(node, path) for (node, path) in lookups
+    if anchorNames.has_key( id( node))]
+  numOther -= len( lookups)
+
+  tmAfter = tmAnchors
+  tmBefore = 0
+  for (node, path) in lookups:
+    fullPath = ScanXml.anchorPaths[ anchorNames[id( node)]] + '/' + path
+    (tma, lsta) = timeCall( node.findall, path)
+    (tmb, lstb) = timeCall( root.findall, fullPath)
+    if map( id, lsta) != map( id, lstb):
+      throwerr('xmlAnchors mismatch for path: %s' % (fullPath,))
+    tmAfter += tma
+    tmBefore += tmb
+    if bugLev >= 1:
+      print '  path: %-60s  anchored: %.5f s  full: %.5f s' \
+        % (fullPath[:60], tma, tmb,)
+
+  logit('xmlAnchors: num calculations: %d  num lookups: %d  not anchored: %d' \
+    % (len( anchors['calculations']), len( lookups), numOther,))
+  logit('xmlAnchors: lookups: anchored: %.4f s (getAnchors %.4f s)'
+    '  full paths: %.4f s' % (tmAfter, tmAnchors, tmBefore,))
+  logit('xmlAnchors: parseXml per file: after: %.3f s  before: %.3f s' \
+    % (tmTotal, tmTotal - tmAfter + tmBefore,))
+
+#====================================================================
+
+def benchXmlDos( bugLev, inDir):
+  '''
+  Compares the float32 DOS arrays from :func:`ScanXml.getDos`
+  with the float64 per-field arrays from the generic
+  :func:`ScanXml.getArrayByPath`: values, size, and time.
+  Also reports the time and peak memory of
+  :func:`ScanXml.parseXml` for each readMode and dosMode,
+  each run in its own process via ``-func xmlReadOne``.
+  Use a large -numAtom and -numDos.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  # First the separate processes, since on Linux a child
+  # inherits the ru_maxrss of this process.
+  for readMode in ['tree', 'stream']:
+    for dosMode in ['all', 'total', 'none']:
+      (tm, baseRss, peakRss) = runXmlReadOne( bugLev, inDir, readMode, dosMode)
+      logit(('xmlDos: %-6s  dosMode: %-5s  time: %.3f s'
+        + '  peak rss: %.1f MB  growth: %.1f MB') \
+        % (readMode, dosMode, tm, peakRss / 1024.,
+        (peakRss - baseRss) / 1024.,))
+
+  fname = os.path.join( inDir, 'vasprun.xml')
+  resObj = ScanXml.ResClass()
+  ScanXml.parseXml( bugLev, fname, 0, resObj, dosMode='none')
+  root = ScanXml.etree.parse( fname).getroot()
+  dosNode = root.findall('calculation[last()]/dos')[0]
+  natom = len( resObj.atomNames)
+
+  (tmNew, (totalMat, totalFields, partialMat, partialFields)) = timeCall(
+    ScanXml.getDos, bugLev, dosNode, resObj.numSpin, natom, 'all')
+  if totalMat is None or partialMat is None:
+    throwerr('xmlDos: no total and partial DOS in: %s' % (fname,))
+  (tmTotal, totalRes) = timeCall(
+    ScanXml.getDos, bugLev, dosNode, resObj.numSpin, natom, 'total')
+
+  (tmOld, totalMrr) = timeCall(
+    ScanXml.getArrayByPath, bugLev, dosNode, 'total/array')
+  (tmb, partialMrr) = timeCall(
+    ScanXml.getArrayByPath, bugLev, dosNode, 'partial/array')
+  tmOld += tmb
+
+  # getArrayByPath gives one float64 array per field,
+  # [numSpin, nedos] for the total and
+  # [natom, numSpin, nedos] for the projections.
+  oldBytes = 0
+  maxDiff = 0
+  for (mat, fields, mrr) in [
+    (totalMat, totalFields, totalMrr),
+    (partialMat, partialFields, partialMrr)]:
+    # The getArrayByPath keys are the unstripped <field> texts.
+    mrrFields = {}
+    for (key, val) in mrr.items():
+      mrrFields[key.strip()] = val
+    for ifield in range( len( fields)):
+      oldMat = mrrFields[fields[ifield]]
+      oldBytes += oldMat.nbytes
+      newMat = mat[..., ifield]
+      if newMat.shape != oldMat.shape:
+        throwerr('xmlDos: shape mismatch for field: %s' % (fields[ifield],))
+      maxDiff = max( maxDiff, np.max( np.abs( newMat - oldMat)))
+    oldBytes += mrrFields['energy'].nbytes
+  tol = 1.e-6 * max( np.max( np.abs( totalMat)), np.max( np.abs( partialMat)))
+  if maxDiff > tol:
+    throwerr('xmlDos: values differ: maxDiff: %g' % (maxDiff,))
+
+  logit('xmlDos: totalMat: %s  partialMat: %s  maxDiff: %.3g' \
+    % (totalMat.shape, partialMat.shape, maxDiff,))
+  logit('xmlDos: getDos: %.3f s  total only: %.3f s  getArrayByPath: %.3f s' \
+    % (tmNew, tmTotal, tmOld,))
+  logit('xmlDos: bytes: getDos: %d  getArrayByPath: %d' \
+    % (totalMat.nbytes + partialMat.nbytes, oldBytes,))
+
+#====================================================================
+
+def benchXmlSections( bugLev, inDir):
+  '''
+  Compares the time and peak memory of :func:`ScanXml.parseXml`
+  for several lists of sections, in readMode 'tree' and 'stream',
+  each run in its own process via ``-func xmlReadOne``.
+  Then checks that each list gives the same values
+  as the full parse, for the attributes it sets.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Dir containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  secLists = [
+    ScanXml.xmlSections,
+    None,                                       # the default
+    ['incar', 'atominfo', 'structures', 'eigen', 'forces'],  # fillDbVasp
+    ['structures'],
+    [],
+  ]
+
+  for sections in secLists:
+    for readMode in ['tree', 'stream']:
+      (tm, baseRss, peakRss) = runXmlReadOne(
+        bugLev, inDir, readMode, 'all', sections)
+      logit(('xmlSections: %-6s  time: %.3f s'
+        + '  peak rss: %.1f MB  growth: %.1f MB  sections: %s') \
+        % (readMode, tm, peakRss / 1024., (peakRss - baseRss) / 1024.,
+        sections,))
+
+  fname = os.path.join( inDir, 'vasprun.xml')
+  fullObj = ScanXml.ResClass()
+  ScanXml.parseXml( bugLev, fname, 0, fullObj, sections=ScanXml.xmlSections)
+  for sections in secLists:
+    for readMode in ['tree', 'stream']:
+      resObj = ScanXml.ResClass()
+      ScanXml.parseXml(
+        bugLev, fname, 0, resObj, readMode=readMode, sections=sections)
+      subMap = {}
+      resMap = resObj.getFieldMap()
+      fullMap = fullObj.getFieldMap()
+      for key in resMap.keys():
+        subMap[key] = fullMap.get( key, None)
+      diffKeys = compareAttrs( resMap, subMap)
+      if len( diffKeys) > 0:
+        throwerr('xmlSections: %s %s differs from the full parse for: %s' \
+          % (readMode, sections, diffKeys,))
+  logit('xmlSections: all section lists agree with the full parse')
+
+#====================================================================
+
+def benchXmlEngines( bugLev, inDir):
+  '''
+  Compares the cElementTree and lxml engines of
+  :func:`ScanXml.parseXml` on every vasprun.xml in the tree
+  at inDir.  For each file, engine and readMode, reports
+  the time and peak memory, each run in its own process
+  via ``-func xmlReadOne``.  Then checks that both engines
+  fill identical resObjs, and reports the totals.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inDir (str): Top of a tree of dirs containing vasprun.xml.
+
+  **Returns**:
+
+  * None
+  '''
+
+  engines = ['celement', 'lxml']
+  if ScanXml.lxmlEtree == None:
+    logit('xmlEngines: lxml is not installed.  Using celement only.')
+    engines = ['celement']
+
+  runDirs = []
+  for (dirPath, dirNames, fileNames) in os.walk( inDir):
+    if 'vasprun.xml' in fileNames: runDirs.append( dirPath)
+  runDirs.sort()
+  if len( runDirs) == 0: throwerr('xmlEngines: no vasprun.xml under: %s' \
+    % (inDir,))
+
+  # totals[(engine, readMode)] = [seconds, max peak rss]
+  totals = {}
+  for runDir in runDirs:
+    for readMode in ['tree', 'stream']:
+      for engine in engines:
+        (tm, baseRss, peakRss) = runXmlReadOne(
+          bugLev, runDir, readMode, 'all', ScanXml.xmlSections, engine)
+        logit(('xmlEngines: %-8s  %-6s  time: %.3f s'
+          + '  peak rss: %.1f MB  dir: %s') \
+          % (engine, readMode, tm, peakRss / 1024., runDir,))
+        tot = totals.setdefault( (engine, readMode), [0, 0])
+        tot[0] += tm
+        tot[1] = max( tot[1], peakRss)
+
+  for runDir in runDirs:
+    fname = os.path.join( runDir, 'vasprun.xml')
+    for readMode in ['tree', 'stream']:
+      resMap = {}
+      for engine in engines:
+        resObj = ScanXml.ResClass()
+        ScanXml.parseXml( bugLev, fname, 0, resObj, readMode=readMode,
+          sections=ScanXml.xmlSections, engine=engine)
+        resMap[engine] = resObj.getFieldMap()
+      diffKeys = compareAttrs( resMap[engines[0]], resMap[engines[-1]])
+      if len( diffKeys) > 0:
+        throwerr('xmlEngines: engines differ for: %s  %s  file: %s' \
+          % (readMode, diffKeys, fname,))
+
+  logit('xmlEngines: num files: %d.  engines agree on all.' \
+    % (len( runDirs),))
+  for readMode in ['tree', 'stream']:
+    for engine in engines:
+      (tm, peakRss) = totals[(engine, readMode)]
+      logit('xmlEngines: total: %-8s  %-6s  time: %.3f s  max peak rss: %.1f MB' \
+        % (engine, readMode, tm, peakRss / 1024.,))
+
+#====================================================================
+
+# The funcs that compare a new code path against the old one
+# it replaced, and throw an error on any mismatch.  See benchCheck.
+
+checkFuncs = ['outcarIndex', 'outcarRead', 'outcarTail', 'eigenParse',
+  'efermi', 'bandgaps', 'xmlRead', 'xmlArray', 'xmlAnchors', 'xmlDos',
+  'xmlSections', 'xmlEngines']
+
+# SynSpec overrides for check: a small set, so all funcs run in seconds.
+
+checkSpec = {'numStep': 5}
+
+#====================================================================
+
+def benchCheck( bugLev, outDir, checkNames):
+  '''
+  Runs the smoke test.  Runs each func in :data:`checkFuncs`
+  in its own process, on a small synthetic set written to
+  outDir/funcName, as::
+
+    benchVasp.py -func funcName -inDir none -outDir outDir/funcName
+
+  with the sizes in :data:`checkSpec`.  A func fails if its process
+  exits with a nonzero status: each throws an error on any mismatch
+  between the new and old code paths, so this catches both
+  exceptions and mismatches.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * outDir (str): Dir for the synthetic sets.
+  * checkNames (list of str): Names of the funcs to run,
+    or None for all.
+
+  **Returns**:
+
+  * list of maps, one per func, with keys func, ok, seconds.
+  '''
+
+  if checkNames == None: checkNames = checkFuncs
+  for nm in checkNames:
+    if nm not in checkFuncs: throwerr('unknown check func: %s' % (nm,))
+
+  checkResults = []
+  for funcName in checkFuncs:
+    if funcName not in checkNames: continue
+    cmd = [sys.executable, os.path.abspath( __file__),
+      '-bugLev', str( bugLev), '-func', funcName,
+      '-inDir', 'none', '-outDir', os.path.join( outDir, funcName)]
+    for (key, val) in sorted( checkSpec.items()):
+      cmd += ['-' + key, str( val)]
+    tma = time.time()
+    proc = subprocess.Popen( cmd, stdout=subprocess.PIPE,
+      stderr=subprocess.STDOUT)
+    (stdout, stderr) = proc.communicate()
+    tm = time.time() - tma
+    ok = proc.returncode == 0
+    if not ok or bugLev >= 1:
+      print stdout
+    logit('check: %-12s  %-4s  time: %7.3f s' \
+      % (funcName, ['FAIL', 'ok'][ok], tm,))
+    checkResults.append( {'func': funcName, 'ok': ok, 'seconds': tm})
+
+  numFail = len( [res for res in checkResults if not res['ok']])
+  logit('check: num funcs: %d  num failed: %d' \
+    % (len( checkResults), numFail,))
+  return checkResults
+
+#====================================================================
+
+# The cases of the benchmark suite: (case name, SynSpec overrides).
+# Each case varies one size from the SynSpec defaults.
+# numBand must exceed half the total valence, about 3.5 * numAtom,
+# so the atom cases also raise numBand.
+
+suiteCases = [
+  ('base',        {}),
+  ('atoms64',     {'numAtom': 64, 'numBand': 260}),
+  ('atoms256',    {'numAtom': 256, 'numBand': 1000, 'numKpoint': 2}),
+  ('kpoints200',  {'numKpoint': 200}),
+  ('bands800',    {'numBand': 800}),
+  ('spin1',       {'numSpin': 1}),
+  ('steps200',    {'numStep': 200}),
+]
+
+# The suite targets: (target name, file whose size gives the MB/s).
+# See benchSuiteOne.
+
+suiteTargets = [
+  ('parseXmlTree',      'vasprun.xml'),
+  ('parseXmlStream',    'vasprun.xml'),
+  ('scanOutcarMmap',    'OUTCAR'),
+  ('scanOutcarStream',  'OUTCAR'),
+  ('parseDirXml',       'vasprun.xml'),
+  ('parseDirOutcar',    'OUTCAR'),
+]
+
+suiteFormatVersion = 1
+
+#====================================================================
+
+def benchSuite( bugLev, outDir, caseNames, numRep, outJson):
+  '''
+  Runs the regression benchmark suite.  First runs the smoke test,
+  :func:`benchCheck`, in outDir/check.  Then for each case in
+  :data:`suiteCases`, writes a synthetic OUTCAR, INCAR, POSCAR
+  and vasprun.xml set to outDir/caseName, then times each target
+  in :data:`suiteTargets` numRep times, each run in its own process
+  via ``-func suiteOne``, so that the peak RSS is its own.
+
+  Writes outJson, a JSON map with the keys:
+
+  * suiteFormatVersion, date, hostname, python, numpy,
+    parserVersion, gitCommit, gitDirty, numRep
+  * checks: the list returned by :func:`benchCheck`.
+  * results: a list of maps, one per case and target, with keys
+    case, target, synSpec (map of the sizes), fileMb,
+    seconds (the min over the reps), allSeconds,
+    mbPerSec, runsPerSec, peakRssMb and rssGrowthMb (the max
+    over the reps).
+
+  Use ``-func suiteCompare`` to compare two outJson files.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * outDir (str): Dir for the synthetic sets.
+  * caseNames (list of str): Names of the cases to run,
+    or None for all.
+  * numRep (int): Number of runs of each target.
+  * outJson (str): Output JSON file.
+
+  **Returns**:
+
+  * None
+  '''
+
+  allNames = [nm for (nm, overMap) in suiteCases]
+  if caseNames == None: caseNames = allNames
+  for nm in caseNames:
+    if nm not in allNames: throwerr('unknown suite case: %s' % (nm,))
+
+  checkResults = benchCheck( bugLev, os.path.join( outDir, 'check'), None)
+
+  results = []
+  for (caseName, overMap) in suiteCases:
+    if caseName not in caseNames: continue
+    synSpec = SynSpec()
+    for (key, val) in overMap.items(): setattr( synSpec, key, val)
+    caseDir = os.path.join( outDir, caseName)
+    if not os.path.isdir( caseDir): os.makedirs( caseDir)
+    writeOutcarSet( bugLev, caseDir, synSpec)
+    writeXmlSet( bugLev, caseDir, synSpec)
+
+    for (target, fname) in suiteTargets:
+      fileMb = os.path.getsize( os.path.join( caseDir, fname)) \
+        / (1024. * 1024)
+      allSeconds = []
+      peakRssMb = 0
+      rssGrowthMb = 0
+      for irep in range( numRep):
+        (tm, baseRss, peakRss) = runSuiteOne( bugLev, caseDir, target)
+        allSeconds.append( tm)
+        peakRssMb = max( peakRssMb, peakRss / 1024.)
+        rssGrowthMb = max( rssGrowthMb, (peakRss - baseRss) / 1024.)
+      tm = min( allSeconds)
+      results.append( {
+        'case': caseName,
+        'target': target,
+        'synSpec': dict( synSpec.__dict__),
+        'fileMb': fileMb,
+        'seconds': tm,
+        'allSeconds': allSeconds,
+        'mbPerSec': fileMb / tm,
+        'runsPerSec': 1 / tm,
+        'peakRssMb': peakRssMb,
+        'rssGrowthMb': rssGrowthMb,
+      })
+      logit(('suite: %-11s  %-17s  file: %7.1f MB  time: %8.3f s'
+        + '  %7.2f MB/s  %7.2f runs/s  peak rss: %7.1f MB') \
+        % (caseName, target, fileMb, tm, fileMb / tm, 1 / tm, peakRssMb,))
+
+  (gitCommit, gitDirty) = getGitCommit()
+  suiteMap = {
+    'suiteFormatVersion': suiteFormatVersion,
+    'date': datetime.datetime.now().isoformat(' '),
+    'hostname': platform.node(),
+    'python': platform.python_version(),
+    'numpy': np.__version__,
+    'parserVersion': readVasp.parserVersion,
+    'gitCommit': gitCommit,
+    'gitDirty': gitDirty,
+    'numRep': numRep,
+    'checks': checkResults,
+    'results': results,
+  }
+  with open( outJson, 'w') as fout:
+    json.dump( suiteMap, fout, indent=2, sort_keys=True)
+  logit('suite: wrote %d results to %s' % (len( results), outJson,))
+
+#====================================================================
+
+# Runs the suite target once on inDir, and prints a single result line:
+#   suiteOne: target seconds baseRssKb peakRssKb
+
+def benchSuiteOne( bugLev, inDir, target):
+  xmlName = os.path.join( inDir, 'vasprun.xml')
+  baseRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  tma = time.time()
+  if target in ['parseXmlTree', 'parseXmlStream']:
+    if target == 'parseXmlTree': readMode = 'tree'
+    else: readMode = 'stream'
+    resObj = ScanXml.ResClass()
+    ScanXml.parseXml( bugLev, xmlName, 0, resObj, readMode=readMode)
+  elif target in ['scanOutcarMmap', 'scanOutcarStream']:
+    if target == 'scanOutcarMmap': readMode = 'mmap'
+    else: readMode = 'stream'
+    resObj = ScanOutcar.ResClass()
+    ScanOutcar.ScanOutcar( bugLev, inDir, resObj, readMode=readMode)
+  elif target in ['parseDirXml', 'parseDirOutcar']:
+    if target == 'parseDirXml': readType = 'xml'
+    else: readType = 'outcar'
+    resObj = readVasp.parseDir( bugLev, readType, inDir, -1)
+    if resObj.excMsg != None:
+      throwerr('suiteOne: parseDir failed: %s' % (resObj.excMsg,))
+  else: throwerr('unknown target: %s' % (target,))
+  tmb = time.time()
+  peakRss = resource.getrusage( resource.RUSAGE_SELF).ru_maxrss
+  print 'suiteOne: %s %.6f %d %d' % (target, tmb - tma, baseRss, peakRss,)
+
+#====================================================================
+
+# Runs suiteOne in a separate process, and returns
+# (seconds, baseRssKb, peakRssKb).
+
+def runSuiteOne( bugLev, inDir, target):
+  cmd = [sys.executable, os.path.abspath( __file__),
+    '-bugLev', str( bugLev), '-func', 'suiteOne',
+    '-target', target, '-inDir', inDir]
+  proc = subprocess.Popen( cmd, stdout=subprocess.PIPE)
+  (stdout, stderr) = proc.communicate()
+  if proc.returncode != 0:
+    throwerr('suiteOne failed: rc: %d  cmd: %s' % (proc.returncode, cmd,))
+  toks = stdout.strip().split('\n')[-1].split()
+  if len( toks) != 5 or toks[0] != 'suiteOne:':
+    throwerr('invalid suiteOne output: %s' % (stdout,))
+  return (float( toks[2]), int( toks[3]), int( toks[4]))
+
+#====================================================================
+
+def benchSuiteCompare( bugLev, baseJson, outJson, tolerance):
+  '''
+  Compares two outJson files written by :func:`benchSuite`,
+  as from two commits, by case and target.
+  Reports the ratio new / base of the seconds and the peak RSS,
+  and flags as a regression any ratio over 1 + tolerance.
+  Each check that failed in outJson also counts as a regression.
+  Files written before the checks were added have no checks.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * baseJson (str): The base results.
+  * outJson (str): The new results.
+  * tolerance (float): Allowed fractional increase.
+
+  **Returns**:
+
+  * int: the number of regressions.
+  '''
+
+  suiteMaps = []
+  for fname in [baseJson, outJson]:
+    with open( fname) as fin:
+      suiteMap = json.load( fin)
+    if suiteMap['suiteFormatVersion'] != suiteFormatVersion:
+      throwerr('%s has suiteFormatVersion %s, but we read %s' \
+        % (fname, suiteMap['suiteFormatVersion'], suiteFormatVersion,))
+    suiteMaps.append( suiteMap)
+    logit('suiteCompare: %s  commit: %s  dirty: %s  date: %s' \
+      % (fname, suiteMap['gitCommit'], suiteMap['gitDirty'],
+      suiteMap['date'],))
+
+  numRegress = 0
+  for res in suiteMaps[1].get('checks', []):
+    if not res['ok']:
+      numRegress += 1
+      logit('suiteCompare: check failed: %s' % (res['func'],))
+
+  baseMap = {}
+  for res in suiteMaps[0]['results']:
+    baseMap[(res['case'], res['target'])] = res
+
+  for res in suiteMaps[1]['results']:
+    base = baseMap.get( (res['case'], res['target']))
+    if base == None:
+      logit('suiteCompare: %-11s  %-17s  not in base' \
+        % (res['case'], res['target'],))
+      continue
+    if res['synSpec'] != base['synSpec']:
+      logit('suiteCompare: %-11s  %-17s  sizes differ: skipped' \
+        % (res['case'], res['target'],))
+      continue
+    timeRatio = res['seconds'] / base['seconds']
+    rssRatio = res['peakRssMb'] / base['peakRssMb']
+    flags = []
+    if timeRatio > 1 + tolerance: flags.append('TIME')
+    if rssRatio > 1 + tolerance: flags.append('RSS')
+    if len( flags) > 0: numRegress += 1
+    logit(('suiteCompare: %-11s  %-17s  time: %8.3f -> %8.3f s  (%5.2f)'
+      + '  peak rss: %7.1f -> %7.1f MB  (%5.2f)  %s') \
+      % (res['case'], res['target'], base['seconds'], res['seconds'],
+      timeRatio, base['peakRssMb'], res['peakRssMb'], rssRatio,
+      ' '.join( flags),))
+  logit('suiteCompare: num regressions: %d  tolerance: %g' \
+    % (numRegress, tolerance,))
+  return numRegress
+
+#====================================================================
+
+# Returns (commit hash, dirty) of the git checkout containing
+# this file, or (None, None) if there is none.
+
+def getGitCommit():
+  srcDir = os.path.dirname( os.path.abspath( __file__))
+  try:
+    proc = subprocess.Popen( ['git', 'rev-parse', 'HEAD'], cwd=srcDir,
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = proc.communicate()
+    if proc.returncode != 0: return (None, None)
+    gitCommit = stdout.strip()
+    proc = subprocess.Popen( ['git', 'status', '--porcelain', '-uno'],
+      cwd=srcDir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = proc.communicate()
+    return (gitCommit, len( stdout.strip()) > 0)
+  except OSError:
+    return (None, None)
+
+#====================================================================
+
+# Returns the sorted list of keys whose values differ
+# between the maps amap and bmap.  Numpy arrays are compared
+# by shape and values, and lists and tuples element by element.
+
+def compareAttrs( amap, bmap):
+  def isSame( aval, bval):
+    if isinstance( aval, np.ndarray) or isinstance( bval, np.ndarray):
+      return np.shape( aval) == np.shape( bval) \
+        and np.array_equal( aval, bval)
+    if isinstance( aval, (list, tuple)) and isinstance( bval, (list, tuple)):
+      return type( aval) == type( bval) and len( aval) == len( bval) \
+        and all( [isSame( aval[ii], bval[ii]) for ii in range( len( aval))])
+    return type( aval) == type( bval) and aval == bval
+
+  keys = sorted( set( amap.keys() + bmap.keys()))
+  diffKeys = []
+  for key in keys:
+    if key not in amap or key not in bmap \
+      or not isSame( amap[key], bmap[key]):
+      diffKeys.append( key)
+  return diffKeys
+
+#====================================================================
+
+# The pre-index version of ScanOutcar.findLines:
+# a full scan of all lines, without the numMin, numMax checks.
+# Used as the reference implementation.
+
+def findLinesFull( lines, pats):
+  regexs = [re.compile( pat) for pat in pats]
+  numLine = len( lines)
+  resIxs = []
+  for iline in range( numLine):
+    allOk = True
+    for ii in range( len( pats)):
+      if iline + ii >= numLine or not regexs[ii].match( lines[iline+ii]):
+        allOk = False
+        break
+    if allOk: resIxs.append( iline)
+  return resIxs
+
+#====================================================================
+
+# Returns (elapsed seconds, func result).
+
+def timeCall( func, *args):
+  tma = time.time()
+  res = func( *args)
+  tmb = time.time()
+  return (tmb - tma, res)
+
+#====================================================================
+
+# Print a logging message with a millisecond time stamp.
+
+def logit(msg):
+  tm = time.time()
+  itm = int( math.floor( tm))
+  delta = tm - itm
+  loctm = time.localtime( itm)
+
+  stg = time.strftime( '%Y-%m-%d %H:%M:%S', loctm)
+  mdelta = int( math.floor( 1000 * delta))
+  stg += '.%03d' % (mdelta,)
+
+  print '%s %s' % (stg, msg,)
+
+#====================================================================
+
+def throwerr( msg):
+  '''
+  Prints an error message and raises Exception.
+
+  **Parameters**:
+
+  * msg (str): Error message.
+
+  **Returns**
+
+  * (Never returns)
+
+  **Raises**
+
+  * Exception
+  '''
+
+  print msg
+  print >> sys.stderr, msg
+  raise Exception( msg)
+
+#====================================================================
+
+if __name__ == '__main__': main()
+
+#====================================================================
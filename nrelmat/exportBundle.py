@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime, json, os, sys
+import numpy as np
+
+try:
+  import h5py                       # optional: see BundleWriter
+except ImportError:
+  h5py = None
+
+import batchVasp
+import readVasp
+
+
+#====================================================================
+
+bundleFormatVersion = 1
+
+manifestName = 'manifest.json'
+hdf5Name = 'bundle.h5'
+
+# The scalar columns: (name, dtype).
+# Missing values are stored as nan for floats,
+# -1 for ints, and '' for strings.
+
+scalarCols = [
+  ('mident',                 int),
+  ('relPath',                str),
+  ('excMsg',                 str),
+  ('runDate',                str),
+  ('iterTotalTime',          float),
+  ('systemName',             str),
+  ('encut_ev',               float),
+  ('ibrion',                 int),
+  ('isif',                   int),
+  ('numAtom',                int),
+  ('finalVolume_ang3',       float),
+  ('finalDensity_g_cm3',     float),
+  ('finalPressure_kbar',     float),
+  ('energyNoEntrp',          float),
+  ('energyPerAtom',          float),
+  ('efermi0',                float),
+  ('cbMin',                  float),
+  ('vbMax',                  float),
+  ('bandgap',                float),
+]
+
+# The ragged columns: (name, dtype, ndim).
+# Each is stored as the flat concatenation of the row values,
+# with offsets and shapes.  See BundleWriter.
+
+raggedCols = [
+  ('typeNames',              str,    1),
+  ('typeNums',               int,    1),
+  ('typeMasses_amu',         float,  1),
+  ('typeValences',           float,  1),
+  ('atomNames',              str,    1),
+  ('atomMasses_amu',         float,  1),
+  ('atomValences',           float,  1),
+  ('initialBasisMat',        float,  2),
+  ('initialCartPosMat',      float,  2),
+  ('initialFracPosMat',      float,  2),
+  ('finalBasisMat',          float,  2),
+  ('finalCartPosMat',        float,  2),
+  ('finalFracPosMat',        float,  2),
+  ('finalForceMat_ev_ang',   float,  2),
+  ('finalStressMat_kbar',    float,  2),
+  ('eigenMat',               float,  3),
+]
+
+# The vasprun.xml sections the columns need.  See ScanXml.parseXml.
+exportSections = ['incar', 'atominfo', 'structures', 'eigen', 'forces']
+
+#====================================================================
+
+def badparms( msg):
+  print '\nError: %s' % (msg,)
+  print 'Parms:'
+  print '  -bugLev      <int>      debug level'
+  print '  -func        <string>   writeDirs / writeDb / info'
+  print '  -readType    <string>   outcar / outcarStream / xml / xmlStream'
+  print '  -inTree      <string>   top of a tree of run dirs, for writeDirs'
+  print '  -numWorker   <int>      num worker processes.  Default: num cpus'
+  print '  -inSpec      <string>   inSpecJsonFile, for writeDb'
+  print '  -format      <string>   npy (default) / hdf5'
+  print '  -bundle      <string>   bundle directory'
+  print ''
+  print 'Examples:'
+  print './exportBundle.py -func writeDirs -readType xml -inTree /tmp/runs -bundle /tmp/runs.bundle'
+  print './exportBundle.py -func writeDb -inSpec inSpec.json -bundle /tmp/model.bundle'
+  print './exportBundle.py -func info -bundle /tmp/model.bundle'
+  sys.exit(1)
+
+#====================================================================
+
+def main():
+  '''
+  Exports parsed VASP runs to a columnar bundle, for bulk analysis.
+  See :class:`BundleWriter` for the layout and :func:`loadBundle`
+  to read it.
+
+  Command line parameters:
+
+  ================  =========    ==============================================
+  Parameter         Type         Description
+  ================  =========    ==============================================
+  **-bugLev**       integer      Debug level.  Normally 0.
+  **-func**         string       Function.  See below.
+  **-readType**     string       outcar, outcarStream, xml, or xmlStream.
+                                 See :func:`readVasp.parseDir`.
+                                 For writeDirs.
+  **-inTree**       string       Top of a tree of run dirs.  For writeDirs.
+  **-numWorker**    int          Number of worker processes.  For writeDirs.
+                                 Default: the number of cpus.
+  **-inSpec**       string       JSON file containing DB parameters,
+                                 as for :func:`augmentDb.main`.
+                                 For writeDb.
+  **-format**       string       'npy' (the default): one .npy file per
+                                 array, which loadBundle memory maps.
+                                 'hdf5': a single HDF5 file.
+                                 Requires h5py.
+  **-bundle**       string       The bundle directory.
+  ================  =========    ==============================================
+
+  **Values for the -func Parameter:**
+
+  **writeDirs**
+    Parse every run dir in inTree, as by :func:`batchVasp.parseDirs`,
+    and write the results to the bundle.
+
+  **writeDb**
+    Write the rows of the model table to the bundle.
+
+  **info**
+    Print the bundle manifest.
+  '''
+
+  bugLev = 0
+  func = None
+  readType = None
+  inTree = None
+  numWorker = None
+  inSpec = None
+  fmt = 'npy'
+  bundle = None
+
+  if len(sys.argv) % 2 != 1:
+    badparms('Parms must be key/value pairs')
+  for iarg in range( 1, len(sys.argv), 2):
+    key = sys.argv[iarg]
+    val = sys.argv[iarg+1]
+    if key == '-bugLev': bugLev = int( val)
+    elif key == '-func': func = val
+    elif key == '-readType': readType = val
+    elif key == '-inTree': inTree = val
+    elif key == '-numWorker': numWorker = int( val)
+    elif key == '-inSpec': inSpec = val
+    elif key == '-format': fmt = val
+    elif key == '-bundle': bundle = val
+    else: badparms('unknown key: "%s"' % (key,))
+
+  if bugLev == None: badparms('parm not specified: -bugLev')
+  if func == None: badparms('parm not specified: -func')
+  if fmt not in ['npy', 'hdf5']: badparms('invalid format')
+  if bundle == None: badparms('parm not specified: -bundle')
+
+  if func == 'writeDirs':
+    if readType == None: badparms('parm not specified: -readType')
+    if inTree == None: badparms('parm not specified: -inTree')
+    writeDirs( bugLev, readType, inTree, numWorker, fmt, bundle)
+  elif func == 'writeDb':
+    if inSpec == None: badparms('parm not specified: -inSpec')
+    writeDb( bugLev, inSpec, fmt, bundle)
+  elif func == 'info':
+    bdl = loadBundle( bugLev, bundle)
+    print json.dumps( bdl.manifest, indent=2, sort_keys=True)
+  else: badparms('unknown func: "%s"' % (func,))
+
+#====================================================================
+
+def writeDirs( bugLev, readType, inTree, numWorker, fmt, bundle):
+  '''
+  Parses every run dir in inTree and writes the results to a bundle.
+  The rows are in the sorted order of the dirs.
+  Only the :data:`exportSections` of vasprun.xml are parsed,
+  and each result is reduced to its row as it arrives.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * readType (str): See :func:`readVasp.parseDir`.
+  * inTree (str): Top of a tree of run dirs.
+  * numWorker (int): Number of worker processes, or None
+    for the number of cpus.
+  * fmt (str): 'npy' or 'hdf5'.  See :class:`BundleWriter`.
+  * bundle (str): The bundle directory.
+
+  **Returns**:
+
+  * int: the number of rows written.
+  '''
+
+  if numWorker == None:
+    numWorker = batchVasp.multiprocessing.cpu_count()
+  runDirs = batchVasp.findRunDirs( bugLev, readType, inTree)
+
+  # parseDirs yields in completion order, so the writer
+  # sorts the rows by relPath, to write them in a repeatable order.
+  writer = BundleWriter( bugLev, bundle, fmt, 'dirs: %s' % (inTree,),
+    sortCol='relPath')
+  for (inDir, resObj) in batchVasp.parseDirs(
+    bugLev, readType, runDirs, numWorker, 1,
+    dosMode='none', sections=exportSections):
+    valMap = resObj.getFieldMap()
+    valMap['relPath'] = os.path.relpath( inDir, inTree)
+    typeNums = valMap.get('typeNums', None)
+    if typeNums != None:
+      valMap['numAtom'] = sum( typeNums)
+      if valMap.get('energyNoEntrp', None) != None:
+        valMap['energyPerAtom'] = valMap['energyNoEntrp'] / valMap['numAtom']
+    writer.addRow( valMap)
+  writer.close()
+  return writer.numRow
+
+#====================================================================
+
+def writeDb( bugLev, inSpec, fmt, bundle):
+  '''
+  Writes the rows of the model table to a bundle,
+  in mident order.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * inSpec (str): Name of JSON file containing DB parameters.
+    See :func:`augmentDb.main`; dbtableicsd is not used.
+  * fmt (str): 'npy' or 'hdf5'.  See :class:`BundleWriter`.
+  * bundle (str): The bundle directory.
+
+  **Returns**:
+
+  * int: the number of rows written.
+  '''
+
+  import psycopg2       # only needed here
+
+  with open( inSpec) as fin:
+    specMap = json.load( fin)
+  for key in ['dbhost', 'dbport', 'dbuser', 'dbpswd', 'dbname',
+    'dbschema', 'dbtablemodel']:
+    if specMap.get( key, None) == None:
+      badparms('inSpec name not found: %s' % (key,))
+
+  # Our column names, with relPath for the relpath column.
+  colNames = [nm for (nm, dtype) in scalarCols] \
+    + [nm for (nm, dtype, ndim) in raggedCols]
+  dbCols = [nm.lower() for nm in colNames]
+  dbCols[colNames.index('relPath')] = 'relpath'
+
+  conn = None
+  cursor = None
+  try:
+    conn = psycopg2.connect(
+      host=specMap['dbhost'],
+      port=int( specMap['dbport']),
+      user=specMap['dbuser'],
+      password=specMap['dbpswd'],
+      database=specMap['dbname'])
+    cursor = conn.cursor()
+    cursor.execute('set search_path to %s', (specMap['dbschema'],))
+    cursor.close()
+
+    # A named cursor fetches the rows from the server in batches,
+    # rather than all at once.
+    cursor = conn.cursor('exportBundle')
+    cursor.itersize = 1000
+    cursor.execute('SELECT %s FROM %s ORDER BY mident' \
+      % (', '.join( dbCols), specMap['dbtablemodel'],))
+
+    writer = BundleWriter( bugLev, bundle, fmt,
+      'db: %s.%s' % (specMap['dbname'], specMap['dbtablemodel'],))
+    for row in cursor:
+      writer.addRow( dict( zip( colNames, row)))
+    writer.close()
+  finally:
+    if cursor != None: cursor.close()
+    if conn != None: conn.close()
+  return writer.numRow
+
+#====================================================================
+
+class BundleWriter:
+  '''
+  Writes parsed runs, one row per run, to a columnar bundle.
+
+  The bundle is a directory holding manifest.json, a JSON map
+  describing the columns, and the arrays.
+  For the scalar columns in :data:`scalarCols` there is one array
+  of length numRow.  Strings are fixed width.
+  For the ragged columns in :data:`raggedCols` there are three:
+
+  * values: the flattened values of all rows, concatenated.
+  * offsets: int64, length numRow + 1.  The values of row i are
+    values[offsets[i]:offsets[i+1]].
+  * shapes: int64, numRow by ndim.  The shape of the value of row i,
+    or all -1 if it is missing.  A value with fewer dimensions
+    than ndim, like a 2 dim eigenMat, gets leading dims of 1.
+
+  With fmt 'npy', array ``name`` is the file ``name.npy`` in the
+  bundle dir, and ragged arrays are ``name.values.npy`` and so on.
+  With fmt 'hdf5', the arrays are datasets with the same names
+  in the file bundle.h5, and h5py is required.
+
+  Only the column values of the rows are kept in memory,
+  until close writes the bundle.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * bundle (str): The bundle directory.  Created if need be.
+  * fmt (str): 'npy' or 'hdf5'.
+  * source (str): Description of the source, saved in the manifest.
+  * sortCol (str): If not None, the name of a scalar column:
+    close writes the rows sorted by it, rather than in the
+    order they were added.
+  '''
+
+  def __init__( self, bugLev, bundle, fmt, source, sortCol=None):
+    if fmt not in ['npy', 'hdf5']: throwerr('invalid fmt: %s' % (fmt,))
+    if fmt == 'hdf5' and h5py == None:
+      throwerr('fmt hdf5 requires h5py, which is not installed')
+    self.bugLev = bugLev
+    self.bundle = bundle
+    self.fmt = fmt
+    self.source = source
+    self.sortCol = sortCol
+    self.numRow = 0
+    self.scalarVals = dict( [(nm, []) for (nm, dtype) in scalarCols])
+    self.raggedVals = dict( [(nm, []) for (nm, dtype, ndim) in raggedCols])
+
+
+  def addRow( self, valMap):
+    '''
+    Adds one row.  valMap is a map: column name -> value,
+    like ResClass.getFieldMap().  Missing names are missing values.
+    '''
+    for (nm, dtype) in scalarCols:
+      self.scalarVals[nm].append( valMap.get( nm, None))
+    for (nm, dtype, ndim) in raggedCols:
+      val = valMap.get( nm, None)
+      if val is not None:
+        if dtype == str: val = np.array( [fixString( vv) for vv in val])
+        else: val = np.asarray( val, dtype=dtype)
+        if val.ndim > ndim:
+          throwerr('row %d: %s has ndim %d > %d' \
+            % (self.numRow, nm, val.ndim, ndim,))
+        val = val.reshape( (1,) * (ndim - val.ndim) + val.shape)
+      self.raggedVals[nm].append( val)
+    self.numRow += 1
+
+
+  def close( self):
+    '''
+    Writes the bundle.
+    '''
+    if self.sortCol != None:
+      keys = self.scalarVals[self.sortCol]
+      order = sorted( range( self.numRow), key=lambda ii: keys[ii])
+      for valMap in [self.scalarVals, self.raggedVals]:
+        for (nm, vals) in valMap.items():
+          valMap[nm] = [vals[ii] for ii in order]
+
+    arrMap = {}          # array name -> np array
+    colDescs = []
+    for (nm, dtype) in scalarCols:
+      vals = self.scalarVals.pop( nm)
+      if dtype == str:
+        arr = np.array( [fixString( vv) for vv in vals], dtype=str)
+      elif dtype == float:
+        arr = np.array( [np.nan if vv == None else vv for vv in vals],
+          dtype=float)
+      else:
+        arr = np.array( [-1 if vv == None else vv for vv in vals],
+          dtype=np.int64)
+      arrMap[nm] = arr
+      colDescs.append( {'name': nm, 'kind': 'scalar', 'dtype': arr.dtype.str})
+
+    for (nm, dtype, ndim) in raggedCols:
+      vals = self.raggedVals.pop( nm)
+      offsets = np.zeros( [self.numRow + 1], dtype=np.int64)
+      shapes = -np.ones( [self.numRow, ndim], dtype=np.int64)
+      for ii in range( self.numRow):
+        size = 0
+        if vals[ii] is not None:
+          shapes[ii] = vals[ii].shape
+          size = vals[ii].size
+        offsets[ii+1] = offsets[ii] + size
+      flats = [val.ravel() for val in vals if val is not None]
+      if dtype == str:
+        if len( flats) == 0: values = np.zeros( [0], dtype='S1')
+        else: values = np.concatenate( flats).astype( str)
+      elif len( flats) == 0: values = np.zeros( [0], dtype=dtype)
+      else: values = np.concatenate( flats).astype( dtype)
+      arrMap[nm + '.values'] = values
+      arrMap[nm + '.offsets'] = offsets
+      arrMap[nm + '.shapes'] = shapes
+      colDescs.append( {'name': nm, 'kind': 'ragged', 'ndim': ndim,
+        'dtype': values.dtype.str})
+
+    manifest = {
+      'bundleFormatVersion': bundleFormatVersion,
+      'parserVersion': readVasp.parserVersion,
+      'format': self.fmt,
+      'source': self.source,
+      'created': datetime.datetime.now().isoformat(),
+      'numRow': self.numRow,
+      'columns': colDescs,
+    }
+
+    if not os.path.isdir( self.bundle): os.makedirs( self.bundle)
+    if self.fmt == 'npy':
+      for (anm, arr) in arrMap.items():
+        np.save( os.path.join( self.bundle, anm + '.npy'), arr)
+    else:
+      with h5py.File( os.path.join( self.bundle, hdf5Name), 'w') as fout:
+        for (anm, arr) in arrMap.items():
+          fout.create_dataset( anm, data=arr)
+    # Write the manifest last, so a partial bundle has none.
+    with open( os.path.join( self.bundle, manifestName), 'w') as fout:
+      json.dump( manifest, fout, indent=2, sort_keys=True)
+    if self.bugLev >= 1:
+      print 'BundleWriter.close: bundle: %s  fmt: %s  num rows: %d' \
+        % (self.bundle, self.fmt, self.numRow,)
+
+#====================================================================
+
+# Returns a str for a column value: '' for None,
+# and utf-8 for unicode.  Used for the string columns.
+
+def fixString( val):
+  if val == None: val = ''
+  elif isinstance( val, unicode): val = val.encode('utf-8')
+  elif isinstance( val, datetime.datetime): val = val.isoformat(' ')
+  else: val = str( val)
+  return val
+
+#====================================================================
+
+def loadBundle( bugLev, bundle):
+  '''
+  Opens a bundle written by :class:`BundleWriter`.
+  Arrays are read lazily: npy files are memory mapped,
+  and HDF5 datasets are read when indexed.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * bundle (str): The bundle directory.
+
+  **Returns**:
+
+  * :class:`Bundle`
+  '''
+
+  with open( os.path.join( bundle, manifestName)) as fin:
+    manifest = json.load( fin)
+  if manifest['bundleFormatVersion'] != bundleFormatVersion:
+    throwerr('bundle %s has format version %s, but we read %s' \
+      % (bundle, manifest['bundleFormatVersion'], bundleFormatVersion,))
+  return Bundle( bugLev, bundle, manifest)
+
+#====================================================================
+
+class Bundle:
+  '''
+  A bundle opened by :func:`loadBundle`.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * bundle (str): The bundle directory.
+  * manifest (map): The contents of manifest.json.
+
+  The attributes are bundle, manifest, numRow and colKinds,
+  a map: column name -> 'scalar' or 'ragged'.
+  '''
+
+  def __init__( self, bugLev, bundle, manifest):
+    self.bugLev = bugLev
+    self.bundle = bundle
+    self.manifest = manifest
+    self.numRow = manifest['numRow']
+    self.colKinds = dict( [(desc['name'], desc['kind'])
+      for desc in manifest['columns']])
+    self.h5file = None
+    if manifest['format'] == 'hdf5':
+      if h5py == None: throwerr('reading hdf5 bundles requires h5py')
+      self.h5file = h5py.File( os.path.join( bundle, hdf5Name), 'r')
+    self.arrays = {}       # array name -> np memmap or h5py dataset
+
+
+  def getArray( self, anm):
+    '''
+    Returns the array anm, which is a scalar column name,
+    or a ragged column name plus '.values', '.offsets' or '.shapes'.
+    '''
+    if not self.arrays.has_key( anm):
+      if self.h5file != None: arr = self.h5file[anm]
+      else:
+        arr = np.load( os.path.join( self.bundle, anm + '.npy'), mmap_mode='r')
+      self.arrays[anm] = arr
+    return self.arrays[anm]
+
+
+  def getColumn( self, nm):
+    '''
+    Returns the scalar column nm: an array of length numRow.
+    '''
+    if self.colKinds.get( nm) != 'scalar':
+      throwerr('not a scalar column: %s' % (nm,))
+    return self.getArray( nm)
+
+
+  def getRagged( self, nm, irow):
+    '''
+    Returns the value of the ragged column nm for row irow,
+    with its original shape, or None if it is missing.
+    '''
+    if self.colKinds.get( nm) != 'ragged':
+      throwerr('not a ragged column: %s' % (nm,))
+    shape = self.getArray( nm + '.shapes')[irow]
+    if shape[0] < 0: return None
+    offsets = self.getArray( nm + '.offsets')
+    vals = self.getArray( nm + '.values')[offsets[irow]:offsets[irow+1]]
+    return vals.reshape( tuple( shape))
+
+
+  def close( self):
+    if self.h5file != None: self.h5file.close()
+    self.h5file = None
+    self.arrays = {}
+
+#====================================================================
+
+def throwerr( msg):
+  '''
+  Prints an error message and raises Exception.
+
+  **Parameters**:
+
+  * msg (str): Error message.
+
+  **Returns**
+
+  * (Never returns)
+
+  **Raises**
+
+  * Exception
+  '''
+
+  print msg
+  print >> sys.stderr, msg
+  raise Exception( msg)
+
+#====================================================================
+
+if __name__ == '__main__': main()
@@ -19,7 +19,10 @@ import datetime, hashlib, json, os, re, sys, traceback
 import numpy as np
 import psycopg2
 
+import parseCache
+import phaseProfile
 import readVasp
+import resRecord
 import wrapReceive
 import wrapUpload
 
@@ -29,6 +32,9 @@ import wrapUpload
 vasprunName = 'vasprun.xml'
 outcarName = 'OUTCAR'
 
+# The vasprun.xml sections fillRow uses.  See ScanXml.parseXml.
+fillSections = ['incar', 'atominfo', 'structures', 'eigen', 'forces']
+
 #====================================================================
 
 
@@ -102,6 +108,21 @@ def main():
   **dbschema**           Database schema name.
   **dbtablemodel**       Database name of the "model" table.
   **dbtablecontrib**     Database name of the "contrib" table.
+  **parsecachedir**      Optional.  Directory of the cache of parsed
+                         VASP output, keyed by file hash, so reprocessing
+                         does not parse unchanged files again.
+                         See :class:`parseCache.ParseCache`.
+  **parsecachemb**       Optional.  Max size of the parse cache, MB.
+                         Default 10000.
+  **parseproflog**       Optional.  JSON lines file to append the time
+                         and memory of each phase of each row to:
+                         hashing, parsing, and the DB insert.
+                         See :class:`phaseProfile.PhaseProfile`.
+  **parserecover**       Optional.  If true, read a truncated vasprun.xml
+                         up to its last complete calculation, rather
+                         than rejecting the run.  Each truncated run
+                         is logged.  See :func:`ScanXml.parseXml`.
+                         Default false.
   ===================    ==============================================
 
   **inSpec file example:**::
@@ -234,6 +255,10 @@ def fillDbVasp(
   dbschema = specMap.get('dbschema', None)
   dbtablemodel   = specMap.get('dbtablemodel', None)
   dbtablecontrib = specMap.get('dbtablecontrib', None)
+  parsecachedir  = specMap.get('parsecachedir', None)
+  parsecachemb   = specMap.get('parsecachemb', 10000)
+  parseproflog   = specMap.get('parseproflog', None)
+  parserecover   = specMap.get('parserecover', False)
 
   if dbhost == None:   badparms('inSpec name not found: dbhost')
   if dbport == None:   badparms('inSpec name not found: dbport')
@@ -244,6 +269,8 @@ def fillDbVasp(
   if dbtablemodel   == None: badparms('inSpec name not found: dbtablemodel')
   if dbtablecontrib == None: badparms('inSpec name not found: dbtablecontrib')
   dbport = int( dbport)
+  if not isinstance( parserecover, bool):
+    parserecover = wrapUpload.parseBoolean( str( parserecover))
 
   if bugLev >= 1:
     print 'fillDbVasp: dbhost: %s' % (dbhost,)
@@ -283,8 +310,16 @@ def fillDbVasp(
       createTableContrib( bugLev, useCommit, deleteTable,
         conn, cursor, dbtablecontrib)
     elif func == 'fillTable':
+      cache = None
+      if parsecachedir != None:
+        cache = parseCache.ParseCache(
+          bugLev, parsecachedir, int( float( parsecachemb) * 1024 * 1024))
+      prof = None
+      if parseproflog != None:
+        prof = phaseProfile.PhaseProfile( bugLev, parseproflog)
       fillTable( bugLev, useCommit, allowExc, archDir, conn, cursor, wrapId,
-        dbtablemodel, dbtablecontrib)
+        dbtablemodel, dbtablecontrib, cache, prof, parserecover)
+      if cache != None: print 'fillDbVasp: parseCache: %s' % (cache,)
     else: throwerr('unknown func: "%s"' % (func,))
 
   finally:
@@ -512,7 +547,10 @@ def fillTable(
   cursor,
   wrapId,
   dbtablemodel,
-  dbtablecontrib):
+  dbtablecontrib,
+  cache=None,
+  prof=None,
+  recover=False):
   '''
   Adds rows to the model table, and one row to the contrib table.
 
@@ -537,6 +575,12 @@ def fillTable(
     by wrapReceive.py from the uploaded file name.
   * dbtablemodel (str): Database name of the "model" table.
   * dbtablecontrib (str): Database name of the "contrib" table.
+  * cache (parseCache.ParseCache): If not None, the cache of
+    parse results used by fillRow.
+  * prof (phaseProfile.PhaseProfile): If not None, the profile
+    used by fillRow.
+  * recover (boolean): If True, fillRow reads truncated files.
+    See :func:`fillRow`.
 
   **Returns**
 
@@ -612,7 +656,10 @@ def fillTable(
         conn,
         cursor,
         wrapId,
-        dbtablemodel)
+        dbtablemodel,
+        cache,
+        prof,
+        recover)
     except Exception, exc:
       print 'readVasp.py.  caught exc: %s' % (repr(exc),)
       print '  dir:   "%s"' % (os.path.join( topDir, relDirs[ii]),)
@@ -668,7 +715,10 @@ def fillRow(
   conn,
   cursor,
   wrapId,
-  dbtablemodel):
+  dbtablemodel,
+  cache=None,
+  prof=None,
+  recover=False):
   '''
   Adds one row to the model table, corresponding to relDir.
 
@@ -679,7 +729,11 @@ def fillRow(
   * metadataForce (map): If not None, force this to be the metadata
     map for all subDirs.
   * readType (str): If 'outcar', read the OUTCAR file.
+    Else if 'outcarStream', read the OUTCAR file,
+    keeping only the last ionic step.
     Else if 'xml', read the vasprun.xml file.
+    Else if 'xmlStream', read the vasprun.xml file,
+    keeping only the last calculation.
   * archDir (str): Input directory tree.
   * topDir (str): original top dir during upload.
   * relDir (str): sub directory under topDir (during wrapUpload.py) and
@@ -705,6 +759,15 @@ def fillRow(
     The unique id of this upload, created
     by wrapReceive.py from the uploaded file name.
   * dbtablemodel (str): Database name of the "model" table.
+  * cache (parseCache.ParseCache): If not None, the parse result
+    is taken from it, keyed by the sha512 of vasprun.xml or OUTCAR,
+    or saved to it after parsing.
+  * prof (phaseProfile.PhaseProfile): If not None, record the time
+    and memory of hashing, the cache, parsing and the DB insert,
+    as one record for relDir.
+  * recover (boolean): If True, read a truncated vasprun.xml up to
+    its last complete calculation, as by :func:`readVasp.parseDir`,
+    and log the run as truncated.
 
   **Returns**
 
@@ -738,10 +801,13 @@ def fillRow(
     wrapUpload.printMap('fillRow: metaMap', metaMap, 100)
 
   # Get the hash digest of vasprun.xml or OUTCAR
-  if readType == 'outcar': tname = outcarName
-  elif readType == 'xml': tname = vasprunName
+  if readType in ['outcar', 'outcarStream']: tname = outcarName
+  elif readType in ['xml', 'xmlStream']: tname = vasprunName
   else: throwerr('invalid readType: %s' % (readType,))
   vname = os.path.join( subPath, tname)
+  if prof == None: prof = phaseProfile.noProfile
+  prof.begin( subPath, readType)        # joined by parseDir
+  prof.mark('hash')
   hash = hashlib.sha512()
   with open( vname) as fin:
     while True:
@@ -751,6 +817,7 @@ def fillRow(
   hashString = hash.hexdigest()
 
   # Check that our hashString is not in the database
+  prof.mark('dbCheck')
   cursor.execute( 'SELECT mident, relpath FROM ' + dbtablemodel
     + ' WHERE hashString = %s', (hashString,))
   msg = cursor.statusmessage
@@ -785,8 +852,22 @@ def fillRow(
         msg += '  parent hashString: %s\n' % (parentHash,)
         throwerr( msg)
 
-  # Read and parse vasprun.xml
-  vaspObj = readVasp.parseDir( bugLev, readType, subPath, -1)  # print = -1
+  # Read and parse vasprun.xml, unless the cache has it.
+  vaspObj = None
+  prof.mark('cacheGet')
+  if cache != None:
+    vaspObj = cache.get( hashString, readType, fillSections, recover)
+  if vaspObj == None:
+    vaspObj = readVasp.parseDir(                # print = -1
+      bugLev, readType, subPath, -1, sections=fillSections, recover=recover,
+      prof=prof)
+    prof.mark('cachePut')
+    if cache != None:
+      cache.put( hashString, readType, fillSections, recover, vaspObj)
+  elif bugLev >= 1: print 'fillRow: parse result from cache'
+  if getattr( vaspObj, 'isTruncated', False):
+    print 'fillRow: truncated: relDir: %s  lost sections: %s' \
+      % (relDir, vaspObj.lostSections,)
 
   typeNums = getattr( vaspObj, 'typeNums', None)
   numAtom = None
@@ -797,126 +878,40 @@ def fillRow(
   if numAtom != None and energyNoEntrp != None:
     energyPerAtom = energyNoEntrp / numAtom
 
+  # The columns set from vaspObj are given by resRecord.dbFields.
+  prof.mark('dbInsert')
+  colVals = [
+    ('wrapid',             wrapId),
+    ('abspath',            absPath),
+    ('relpath',            relDir),
+    ('icsdNum',            icsdMap.get('icsdNum', None)),
+    ('magType',            icsdMap.get('magType', None)),
+    ('magNum',             icsdMap.get('magNum', None)),
+    ('relaxType',          icsdMap.get('relaxType', None)),
+    ('relaxNum',           icsdMap.get('relaxNum', None)),
+  ]
+  for (name, dbCol) in resRecord.dbFields:
+    colVals.append( (dbCol, getattr( vaspObj, name, None)))
+  colVals += [
+    ('numAtom',            numAtom),
+    ('energyPerAtom',      energyPerAtom),
+    ('hashstring',         hashString),     # sha512 of our vasprun.xml
+    ('meta_parents',       metaMap.get('parents', None)),  # parents' sha512
+    ('meta_firstName',     metaMap['firstName']),
+    ('meta_lastName',      metaMap['lastName']),
+    ('meta_publications',  metaMap['publications']),   # DOI or placeholder
+    ('meta_standards',     metaMap['standards']),  # controlled vocab keywords
+    ('meta_keywords',      metaMap['keywords']),   # uncontrolled vocab
+    ('meta_notes',         metaMap['notes']),
+  ]
+
   cursor.execute(
-    '''
-      insert into
-    '''
-    + dbtablemodel + 
-    ''' (
-        wrapid,
-        abspath,
-        relpath,
-        icsdNum,
-        magType,
-        magNum,
-        relaxType,
-        relaxNum,
-        excMsg,
-        excTrace,
-        runDate,
-        iterTotalTime,
-        systemName,
-        encut_ev,
-        ibrion,
-        isif,
-        numAtom,
-        typeNames,
-        typeNums,
-        typeMasses_amu,
-        typePseudos,
-        typeValences,
-        atomNames,
-        atomMasses_amu,
-        atomPseudos,
-        atomValences,
-        initialBasisMat,
-        initialRecipBasisMat,
-        initialCartPosMat,
-        initialFracPosMat,
-        finalBasisMat,
-        finalRecipBasisMat,
-        finalCartPosMat,
-        finalFracPosMat,
-        finalVolume_ang3,
-        finalDensity_g_cm3,
-        finalForceMat_ev_ang,
-        finalStressMat_kbar,
-        finalPressure_kbar,
-        eigenMat,
-        energyNoEntrp,
-        energyPerAtom,
-        efermi0,
-        cbMin,
-        vbMax,
-        bandgap,
-        hashstring,        -- sha512 of our vasprun.xml
-
-        meta_parents,      -- sha512 of parent vasprun.xml, or null
-        meta_firstName,    -- metadata: first name
-        meta_lastName,     -- metadata: last name
-        meta_publications, -- metadata: publication DOI or placeholder
-        meta_standards,    -- metadata: controlled vocab keywords
-        meta_keywords,     -- metadata: uncontrolled vocab keywords
-        meta_notes)        -- metadata: notes
-
-      values (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    ''',
-    ( wrapId,
-      absPath,
-      relDir,
-      icsdMap.get('icsdNum', None),
-      icsdMap.get('magType', None),
-      icsdMap.get('magNum', None),
-      icsdMap.get('relaxType', None),
-      icsdMap.get('relaxNum', None),
-      vaspObj.excMsg,
-      vaspObj.excTrace,
-      getattr( vaspObj, 'runDate', None),
-      getattr( vaspObj, 'iterTotalTime', None),
-      getattr( vaspObj, 'systemName', None),
-      getattr( vaspObj, 'encut_ev', None),
-      getattr( vaspObj, 'ibrion', None),
-      getattr( vaspObj, 'isif', None),
-      numAtom,
-      getattr( vaspObj, 'typeNames', None),
-      getattr( vaspObj, 'typeNums', None),
-      getattr( vaspObj, 'typeMasses_amu', None),
-      getattr( vaspObj, 'typePseudos', None),
-      getattr( vaspObj, 'typeValences', None),
-      getattr( vaspObj, 'atomNames', None),
-      getattr( vaspObj, 'atomMasses_amu', None),
-      getattr( vaspObj, 'atomPseudos', None),
-      getattr( vaspObj, 'atomValences', None),
-      getattr( vaspObj, 'initialBasisMat', None),
-      getattr( vaspObj, 'initialRecipBasisMat', None),
-      getattr( vaspObj, 'initialCartPosMat', None),
-      getattr( vaspObj, 'initialFracPosMat', None),
-      getattr( vaspObj, 'finalBasisMat', None),
-      getattr( vaspObj, 'finalRecipBasisMat', None),
-      getattr( vaspObj, 'finalCartPosMat', None),
-      getattr( vaspObj, 'finalFracPosMat', None),
-      getattr( vaspObj, 'finalVolume_ang3', None),
-      getattr( vaspObj, 'finalDensity_g_cm3', None),
-      getattr( vaspObj, 'finalForceMat_ev_ang', None),
-      getattr( vaspObj, 'finalStressMat_kbar', None),
-      getattr( vaspObj, 'finalPressure_kbar', None),
-      getattr( vaspObj, 'eigenMat', None),
-      getattr( vaspObj, 'energyNoEntrp', None),
-      energyPerAtom,
-      getattr( vaspObj, 'efermi0', None),
-      getattr( vaspObj, 'cbMin', None),
-      getattr( vaspObj, 'vbMax', None),
-      getattr( vaspObj, 'bandgap', None),
-      hashString,
-      metaMap.get('parents', None),
-      metaMap['firstName'],
-      metaMap['lastName'],
-      metaMap['publications'],
-      metaMap['standards'],
-      metaMap['keywords'],
-      metaMap['notes'],
-  ))
+    'insert into ' + dbtablemodel
+    + ' (' + ', '.join( [col for (col, val) in colVals]) + ')'
+    + ' values (' + ','.join( len( colVals) * ['%s']) + ')',
+    tuple( [val for (col, val) in colVals]))
   if useCommit: conn.commit()
+  prof.end( vaspObj)
 
 
 
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import cPickle, hashlib, os, sys, tempfile, time
+
+import readVasp
+
+
+#====================================================================
+
+cacheSuffix = '.pkl'
+
+# When the cache exceeds maxBytes, evict down to this fraction of it,
+# so a full cache is not rescanned on every put.
+evictFraction = 0.9
+
+#====================================================================
+
+def badparms( msg):
+  print '\nError: %s' % (msg,)
+  print 'Parms:'
+  print '  -bugLev      <int>      debug level'
+  print '  -func        <string>   stats / clear'
+  print '  -cacheDir    <string>   cache directory'
+  print ''
+  print 'Example:'
+  print './parseCache.py -func stats -cacheDir /tmp/parseCache'
+  sys.exit(1)
+
+#====================================================================
+
+def main():
+  '''
+  Reports on or clears a :class:`ParseCache` directory.
+
+  Command line parameters:
+
+  ================  =========    ==============================================
+  Parameter         Type         Description
+  ================  =========    ==============================================
+  **-bugLev**       integer      Debug level.  Normally 0.
+  **-func**         string       Function.  See below.
+  **-cacheDir**     string       The cache directory.
+  ================  =========    ==============================================
+
+  **Values for the -func Parameter:**
+
+  **stats**
+    Print the number and total size of the entries,
+    and the number made by each parser version.
+
+  **clear**
+    Remove all entries.
+  '''
+
+  bugLev = 0
+  func = None
+  cacheDir = None
+
+  if len(sys.argv) % 2 != 1:
+    badparms('Parms must be key/value pairs')
+  for iarg in range( 1, len(sys.argv), 2):
+    key = sys.argv[iarg]
+    val = sys.argv[iarg+1]
+    if key == '-bugLev': bugLev = int( val)
+    elif key == '-func': func = val
+    elif key == '-cacheDir': cacheDir = val
+    else: badparms('unknown key: "%s"' % (key,))
+
+  if bugLev == None: badparms('parm not specified: -bugLev')
+  if func == None: badparms('parm not specified: -func')
+  if cacheDir == None: badparms('parm not specified: -cacheDir')
+  if not os.path.isdir( cacheDir):
+    badparms('cacheDir is not a dir: "%s"' % (cacheDir,))
+
+  cache = ParseCache( bugLev, cacheDir, 0)
+  if func == 'stats':
+    versionCounts = {}
+    for fname in cache.entries.keys():
+      version = fname.split('_')[1]
+      versionCounts[version] = versionCounts.get( version, 0) + 1
+    print 'parseCache: num entries: %d  total MB: %.1f' \
+      % (len( cache.entries), cache.totalBytes / (1024. * 1024),)
+    for version in sorted( versionCounts.keys()):
+      print '  parser version: %s  num entries: %d' \
+        % (version[1:], versionCounts[version],)
+    print '  current parser version: %d' % (readVasp.parserVersion,)
+  elif func == 'clear':
+    numEntry = len( cache.entries)
+    cache.clear()
+    print 'parseCache: removed %d entries' % (numEntry,)
+  else: badparms('unknown func: "%s"' % (func,))
+
+#====================================================================
+
+class ParseCache:
+  '''
+  On-disk cache of :func:`readVasp.parseDir` results, so that
+  reprocessing an archive, as by ``wrapReceive.py -func redoArch``,
+  does not parse again VASP output that has not changed.
+
+  Each entry is a file in cacheDir holding the resObj,
+  pickled with cPickle's binary protocol.
+  An entry is keyed by the sha512 of the vasprun.xml or OUTCAR,
+  as computed by :func:`fillDbVasp.fillRow`, together with
+  :data:`readVasp.parserVersion`, the readType, the sections and recover.
+  So results from an older parser, or other options, are never used:
+  they are evicted in time.
+
+  The total size of the entries is bounded by maxBytes.
+  When a put exceeds it, the least recently used entries are
+  removed, by file modification time, which each get updates.
+
+  Only results without errors, having excMsg None, are cached.
+  Errors writing the cache are printed and otherwise ignored.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * cacheDir (str): The cache directory.  Created if need be.
+  * maxBytes (int): Max total size of the entries.
+
+  The counters numHit, numMiss, numPut and numEvict are
+  updated as the cache is used.
+  '''
+
+  def __init__( self, bugLev, cacheDir, maxBytes):
+    self.bugLev = bugLev
+    self.cacheDir = cacheDir
+    self.maxBytes = maxBytes
+    self.numHit = 0
+    self.numMiss = 0
+    self.numPut = 0
+    self.numEvict = 0
+
+    if not os.path.isdir( cacheDir): os.makedirs( cacheDir)
+
+    # entries[fname] = [mtime, size], for the LRU eviction.
+    self.entries = {}
+    self.totalBytes = 0
+    for fname in os.listdir( cacheDir):
+      if fname.endswith( cacheSuffix):
+        st = os.stat( os.path.join( cacheDir, fname))
+        self.entries[fname] = [st.st_mtime, st.st_size]
+        self.totalBytes += st.st_size
+    if bugLev >= 1:
+      print 'ParseCache: cacheDir: %s  num entries: %d  total bytes: %d' \
+        % (cacheDir, len( self.entries), self.totalBytes,)
+
+
+  def getName( self, hashString, readType, sections, recover):
+    '''
+    Returns the entry file name for the sha512 hexdigest hashString,
+    the readType, the sections, and recover, as for
+    :func:`readVasp.parseDir`, under the current
+    :data:`readVasp.parserVersion`.
+    '''
+    if sections == None: secStg = 'default'
+    else: secStg = ','.join( sorted( sections))
+    optStg = '%s %s' % (readType, secStg,)
+    if recover: optStg += ' recover'     # keeps the older names valid
+    optHash = hashlib.sha1( optStg).hexdigest()
+    return '%s_v%d_%s%s' % (hashString, readVasp.parserVersion,
+      optHash[:16], cacheSuffix)
+
+
+  def get( self, hashString, readType, sections, recover):
+    '''
+    Returns the cached resObj, or None if there is none.
+    See :meth:`getName` for the parameters.
+    '''
+    fname = self.getName( hashString, readType, sections, recover)
+    path = os.path.join( self.cacheDir, fname)
+    if not os.path.isfile( path):
+      self.numMiss += 1
+      return None
+    try:
+      with open( path, 'rb') as fin:
+        (key, resObj) = cPickle.load( fin)
+      if key != fname: throwerr('key mismatch: %s' % (key,))
+    except Exception, exc:
+      print 'ParseCache.get: removing bad entry: %s: %s' % (fname, repr(exc),)
+      self.remove( fname)
+      self.numMiss += 1
+      return None
+
+    tm = time.time()
+    os.utime( path, (tm, tm))
+    self.entries[fname] = [tm, os.path.getsize( path)]
+    self.numHit += 1
+    if self.bugLev >= 5: print 'ParseCache.get: hit: %s' % (fname,)
+    return resObj
+
+
+  def put( self, hashString, readType, sections, recover, resObj):
+    '''
+    Saves resObj, if it has no error, and evicts old entries
+    if the cache is over maxBytes.
+    See :meth:`getName` for the parameters.
+    '''
+    if resObj.excMsg != None: return
+    fname = self.getName( hashString, readType, sections, recover)
+    path = os.path.join( self.cacheDir, fname)
+    tmpPath = None
+    try:
+      # Write a temp file and rename it, so a reader
+      # never sees a partial entry.
+      (fd, tmpPath) = tempfile.mkstemp( dir=self.cacheDir, suffix='.tmp')
+      with os.fdopen( fd, 'wb') as fout:
+        cPickle.dump( (fname, resObj), fout, protocol=cPickle.HIGHEST_PROTOCOL)
+      os.rename( tmpPath, path)
+      tmpPath = None
+    except Exception, exc:
+      print 'ParseCache.put: cannot write: %s: %s' % (fname, repr(exc),)
+      if tmpPath != None and os.path.exists( tmpPath): os.remove( tmpPath)
+      return
+
+    if fname in self.entries: self.totalBytes -= self.entries[fname][1]
+    size = os.path.getsize( path)
+    self.entries[fname] = [time.time(), size]
+    self.totalBytes += size
+    self.numPut += 1
+    if self.bugLev >= 5:
+      print 'ParseCache.put: %s  size: %d  total bytes: %d' \
+        % (fname, size, self.totalBytes,)
+    if self.totalBytes > self.maxBytes: self.evict()
+
+
+  def evict( self):
+    '''
+    Removes the least recently used entries until the total
+    size is at most evictFraction * maxBytes.
+    '''
+    target = evictFraction * self.maxBytes
+    fnames = self.entries.keys()
+    fnames.sort( key=lambda fname: self.entries[fname][0])
+    for fname in fnames:
+      if self.totalBytes <= target: break
+      self.remove( fname)
+      self.numEvict += 1
+    if self.bugLev >= 1:
+      print 'ParseCache.evict: num entries: %d  total bytes: %d' \
+        % (len( self.entries), self.totalBytes,)
+
+
+  def remove( self, fname):
+    '''
+    Removes the entry fname, if present.
+    '''
+    if fname in self.entries:
+      self.totalBytes -= self.entries.pop( fname)[1]
+    try: os.remove( os.path.join( self.cacheDir, fname))
+    except OSError: pass
+
+
+  def clear( self):
+    '''
+    Removes all entries, and any temp files left by
+    an interrupted put.
+    '''
+    for fname in os.listdir( self.cacheDir):
+      if fname.endswith( cacheSuffix) or fname.endswith('.tmp'):
+        self.remove( fname)
+
+
+  def __str__( self):
+    return ('hits: %d  misses: %d  puts: %d  evictions: %d'
+      + '  num entries: %d  total bytes: %d') \
+      % (self.numHit, self.numMiss, self.numPut, self.numEvict,
+      len( self.entries), self.totalBytes,)
+
+#====================================================================
+
+def throwerr( msg):
+  '''
+  Prints an error message and raises Exception.
+
+  **Parameters**:
+
+  * msg (str): Error message.
+
+  **Returns**
+
+  * (Never returns)
+
+  **Raises**
+
+  * Exception
+  '''
+
+  print msg
+  print >> sys.stderr, msg
+  raise Exception( msg)
+
+#====================================================================
+
+if __name__ == '__main__': main()
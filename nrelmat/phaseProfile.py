@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime, json, os, resource, sys, time
+
+
+#====================================================================
+
+def badparms( msg):
+  print '\nError: %s' % (msg,)
+  print 'Parms:'
+  print '  -bugLev      <int>      debug level'
+  print '  -profLog     <string>   JSON lines log written by PhaseProfile'
+  print '  -phase       <string>   phase to rank files by, or "total".'
+  print '                          Default: total'
+  print '  -numShow     <int>      num files to show.  Default: 20'
+  print ''
+  print 'Example:'
+  print './phaseProfile.py -profLog /tmp/prof.jsonl -phase parse'
+  sys.exit(1)
+
+#====================================================================
+
+def main():
+  '''
+  Summarizes a log written by :class:`PhaseProfile`: the time
+  in each phase over all files, and the files taking the most
+  wall time in one phase, to find pathological files.
+
+  Command line parameters:
+
+  ================  =========    ==============================================
+  Parameter         Type         Description
+  ================  =========    ==============================================
+  **-bugLev**       integer      Debug level.  Normally 0.
+  **-profLog**      string       JSON lines log written by PhaseProfile.
+  **-phase**        string       The phase to rank the files by,
+                                 or 'total'.  Default: total.
+  **-numShow**      int          Number of files to show.  Default: 20.
+  ================  =========    ==============================================
+  '''
+
+  bugLev = 0
+  profLog = None
+  phase = 'total'
+  numShow = 20
+
+  if len(sys.argv) % 2 != 1:
+    badparms('Parms must be key/value pairs')
+  for iarg in range( 1, len(sys.argv), 2):
+    key = sys.argv[iarg]
+    val = sys.argv[iarg+1]
+    if key == '-bugLev': bugLev = int( val)
+    elif key == '-profLog': profLog = val
+    elif key == '-phase': phase = val
+    elif key == '-numShow': numShow = int( val)
+    else: badparms('unknown key: "%s"' % (key,))
+
+  if bugLev == None: badparms('parm not specified: -bugLev')
+  if profLog == None: badparms('parm not specified: -profLog')
+
+  recs = []
+  with open( profLog) as fin:
+    for line in fin:
+      if len( line.strip()) > 0: recs.append( json.loads( line))
+
+  # Totals per phase, in order of first appearance.
+  phaseNames = []
+  totMap = {}            # phase name -> [wallSec, cpuSec]
+  for rec in recs:
+    for phs in rec['phases']:
+      nm = phs['phase']
+      if not totMap.has_key( nm):
+        phaseNames.append( nm)
+        totMap[nm] = [0., 0.]
+      totMap[nm][0] += phs['wallSec']
+      totMap[nm][1] += phs['cpuSec']
+  print 'phaseProfile: num files: %d' % (len( recs),)
+  for nm in phaseNames:
+    print '  phase: %-24s  wall: %10.3f s  cpu: %10.3f s' \
+      % (nm, totMap[nm][0], totMap[nm][1],)
+
+  def getWall( rec):
+    if phase == 'total': return rec['wallSec']
+    return sum( [phs['wallSec'] for phs in rec['phases']
+      if phs['phase'] == phase])
+  recs.sort( key=getWall, reverse=True)
+  print '\nphaseProfile: slowest files by phase %s:' % (phase,)
+  for rec in recs[:numShow]:
+    print '  wall: %10.3f s  peak rss: %8.1f MB  %s  %s' \
+      % (getWall( rec), rec['peakRssMb'], rec['path'],
+      '' if rec['excMsg'] == None else 'error')
+
+#====================================================================
+
+class PhaseProfile:
+  '''
+  Records the wall time, CPU time and peak RSS of the named
+  phases of reading one file.  Opt in: pass a PhaseProfile to
+  :func:`readVasp.parseDir`, :func:`ScanXml.parseXml`,
+  :class:`ScanOutcar.ScanOutcar` or :func:`fillDbVasp.fillRow`.
+
+  The caller calls :meth:`begin`, the parsers call :meth:`mark`
+  as each phase starts, and the caller calls :meth:`end`,
+  which sets resObj.phaseProfile and appends a line to profLog.
+  Marks made when no file has begun are ignored,
+  so parseDir can begin and end a file unless its caller has,
+  as fillRow does to include the hashing.
+
+  A phase marked more than once, like the two parts of the
+  'structures' section of parseXml, is summed.
+  Peak RSS is the process high water mark, ru_maxrss, at the end
+  of the phase, so the phase where it rises is the one that
+  raised the peak.  On Linux, :meth:`begin` resets the high water
+  mark to the current RSS, so each file gets its own peak, even
+  when one process reads many files, as in fillDbVasp or the
+  batchVasp workers.  Elsewhere the peak is that of the whole
+  process so far, and only a file raising it shows growth;
+  the record's peakRssReset is False then.
+
+  **Parameters**:
+
+  * bugLev (int): Debug level.  Normally 0.
+  * profLog (str): If not None, the JSON lines file to append
+    a line to for each file.  See :meth:`end`.
+  * enabled (boolean): If False, :meth:`begin` does nothing,
+    so nothing is recorded.  See :data:`noProfile`.
+  '''
+
+  def __init__( self, bugLev, profLog=None, enabled=True):
+    self.bugLev = bugLev
+    self.profLog = profLog
+    self.enabled = enabled
+    self.active = False
+
+
+  def begin( self, path, readType):
+    '''
+    Begins recording the file or dir path, read with readType.
+    Any record not ended is dropped.
+    '''
+    if not self.enabled: return
+    self.path = path
+    self.readType = readType
+    self.phaseNames = []
+    self.phaseMap = {}     # name -> [wallSec, cpuSec, peakRssKb, rssGrowthKb]
+    self.curName = None
+    self.active = True
+    self.peakRssReset = resetPeakRss()
+    (self.begWall, self.begCpu, self.begRss) = getUsage()
+    (self.markWall, self.markCpu, self.markRss) = \
+      (self.begWall, self.begCpu, self.begRss)
+
+
+  def mark( self, name):
+    '''
+    Ends the current phase, if any, and begins the phase name.
+    If name is None, just ends the current phase.
+    '''
+    if not self.active: return
+    (wall, cpu, rss) = getUsage()
+    if self.curName != None:
+      vals = self.phaseMap.get( self.curName)
+      if vals == None:
+        vals = [0., 0., 0, 0]
+        self.phaseNames.append( self.curName)
+        self.phaseMap[self.curName] = vals
+      vals[0] += wall - self.markWall
+      vals[1] += cpu - self.markCpu
+      vals[2] = max( vals[2], rss)
+      vals[3] += rss - self.markRss
+      if self.bugLev >= 5:
+        print 'PhaseProfile.mark: %s  wall: %.6f  cpu: %.6f  rss: %d KB' \
+          % (self.curName, wall - self.markWall, cpu - self.markCpu, rss,)
+    self.curName = name
+    (self.markWall, self.markCpu, self.markRss) = (wall, cpu, rss)
+
+
+  def end( self, resObj):
+    '''
+    Ends the record, sets resObj.phaseProfile to it,
+    and appends it to profLog as one line of JSON.
+
+    The record is a map with keys path, readType, date,
+    excMsg, wallSec, cpuSec, peakRssMb, peakRssReset, and phases,
+    a list of maps with keys phase, wallSec, cpuSec, peakRssMb
+    and rssGrowthMb.
+    '''
+    if not self.active: return
+    self.mark( None)
+    self.active = False
+    (wall, cpu, rss) = getUsage()
+    phases = []
+    for nm in self.phaseNames:
+      vals = self.phaseMap[nm]
+      phases.append( {
+        'phase': nm,
+        'wallSec': vals[0],
+        'cpuSec': vals[1],
+        'peakRssMb': vals[2] / 1024.,
+        'rssGrowthMb': vals[3] / 1024.,
+      })
+    rec = {
+      'path': os.path.abspath( self.path),
+      'readType': self.readType,
+      'date': datetime.datetime.now().isoformat(' '),
+      'excMsg': getattr( resObj, 'excMsg', None),
+      'wallSec': wall - self.begWall,
+      'cpuSec': cpu - self.begCpu,
+      'peakRssMb': rss / 1024.,
+      'peakRssReset': self.peakRssReset,
+      'phases': phases,
+    }
+    resObj.phaseProfile = rec
+    if self.bugLev >= 1:
+      print 'PhaseProfile.end: %s  wall: %.3f s  cpu: %.3f s  peak rss: %.1f MB' \
+        % (rec['path'], rec['wallSec'], rec['cpuSec'], rec['peakRssMb'],)
+
+    if self.profLog != None:
+      # One write per line, in append mode, so the lines of
+      # worker processes sharing the log are not interleaved.
+      with open( self.profLog, 'a') as fout:
+        fout.write( json.dumps( rec, sort_keys=True) + '\n')
+
+#====================================================================
+
+# Returns (wall time, CPU time user + system, ru_maxrss),
+# in seconds, seconds, KB.
+
+def getUsage():
+  usage = resource.getrusage( resource.RUSAGE_SELF)
+  return (time.time(), usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+
+#====================================================================
+
+# Resets the RSS high water mark of the process, VmHWM, which is
+# also ru_maxrss, to the current RSS, by writing 5 to
+# /proc/self/clear_refs.  Needs Linux 4.0 or later.
+# Returns True if done, else False.
+
+def resetPeakRss():
+  try:
+    with open('/proc/self/clear_refs', 'w') as fout:
+      fout.write('5')
+  except (IOError, OSError):
+    return False
+  return True
+
+#====================================================================
+
+# A PhaseProfile that records nothing, for callers that
+# do not profile.
+
+noProfile = PhaseProfile( 0, enabled=False)
+
+#====================================================================
+
+if __name__ == '__main__': main()
@@ -22,31 +22,27 @@ import numpy as np
 import pylada.vasp        # used by parsePylada tor parse OUTCAR files
 import ScanXml            # used to parse vasprun.xml files
 import ScanOutcar         # used to parse OUTCAR files
+import resRecord          # the ResClass schema
+import phaseProfile       # optional timing of the parse phases
 
 
 
 #====================================================================
 
-class ResClass:
-  '''
-  An empty class used as a data container for parseDir results.
+# Version of the results of parseDir.  Increment it whenever a change
+# to readVasp, ScanXml or ScanOutcar changes the resObj returned,
+# so parseCache entries made by older versions are not used.
 
-  The parseDir function will call either parsePylada or parseXml,
-  and they will save the VASP results as attributes of
-  an instance of ResClass.
-  '''
+parserVersion = 3
+
+#====================================================================
+
+# The data container for parseDir results.
+# The parseDir function will call either parsePylada or parseXml,
+# and they will save the VASP results as attributes of
+# an instance of ResClass.  See resRecord.ResClass.
 
-  def __str__(self):
-    keys = self.__dict__.keys()
-    keys.sort()
-    msg = ''
-    for key in keys:
-      val = self.__dict__[key]
-      stg = str( val)
-      if stg.find('\n') >= 0: sep = '\n'
-      else: sep = ' '
-      msg += '  %s:  type: %s  val:%s%s\n' % (key, type(val), sep, val,)
-    return msg
+ResClass = resRecord.ResClass
 
 #====================================================================
 
@@ -55,9 +51,14 @@ def badparms( msg):
   print '\nError: %s' % (msg,)
   print 'Parms:'
   print '  -bugLev    <int>      debug level'
-  print '  -readType  <string>   outcar / xml'
+  print '  -readType  <string>   outcar / outcarStream / xml / xmlStream'
   print '  -inDir     <string>   dir containing input OUTCAR or vasprun.xml'
   print '  -maxLev    <int>      max levels to print for xml'
+  print '  -getTraj   <string>   y / n (default): get the ionic trajectory'
+  print '  -dosMode   <string>   all (default) / total / none'
+  print '  -sections  <string>   xml sections, comma separated, or "all"'
+  print '  -recover   <string>   y / n (default): read a truncated vasprun.xml'
+  print '  -profLog   <string>   JSON lines file to append the phase times to'
   print ''
   print 'Examples:'
   print './readVasp.py -bugLev 5   -readType xml   -inDir tda/testlada.2013.04.15.fe.len.3.20/icsd_044729/icsd_044729.cif/hs-anti-ferro-0/relax_cellshape/0   -maxLev 0'
@@ -77,10 +78,30 @@ def main():
   ================  =========    ==============================================
   **-bugLev**       integer      Debug level.  Normally 0.
   **-readType**     string       If 'outcar', read the OUTCAR file.
+                                 Else if 'outcarStream', read the OUTCAR
+                                 file, keeping only the last ionic step.
                                  Else if 'xml', read the vasprun.xml file.
+                                 Else if 'xmlStream', read the vasprun.xml
+                                 file, keeping only the last calculation.
   **-inDir**        string       Input directory containing OUTCAR
                                  and/or vasprun.xml.
   **-maxLev**       int          Max number of levels to print for xml
+  **-getTraj**      string       If 'y', also get the ionic trajectory.
+                                 Only for xml and xmlStream.  Default 'n'.
+  **-dosMode**      string       'all' (the default), 'total', or 'none':
+                                 which density of states to get.
+                                 Only for xml and xmlStream.
+  **-sections**     string       Comma separated list of the sections to
+                                 get, from ScanXml.xmlSections, or 'all'.
+                                 Default: all but trajectory.
+                                 Only for xml and xmlStream.
+  **-recover**      string       If 'y', read a truncated vasprun.xml up
+                                 to the last complete calculation.
+                                 Only for xml and xmlStream.  Default 'n'.
+  **-profLog**      string       If given, record the time and memory
+                                 of each parse phase in resObj.phaseProfile
+                                 and append it to this JSON lines file.
+                                 See :class:`phaseProfile.PhaseProfile`.
   ================  =========    ==============================================
   '''
 
@@ -88,6 +109,11 @@ def main():
   readType = None
   inDir = None
   maxLev = None
+  getTraj = False
+  dosMode = 'all'
+  sections = None
+  recover = False
+  profLog = None
 
   if len(sys.argv) % 2 != 1:
     badparms('Parms must be key/value pairs')
@@ -98,6 +124,18 @@ def main():
     elif key == '-readType': readType = val
     elif key == '-inDir': inDir = val
     elif key == '-maxLev': maxLev = int( val)
+    elif key == '-getTraj':
+      if val not in ['y', 'n']: badparms('invalid getTraj')
+      getTraj = val == 'y'
+    elif key == '-dosMode': dosMode = val
+    elif key == '-sections':
+      if val == 'all': sections = ScanXml.xmlSections
+      else:
+        sections = [nm for nm in val.strip().split(',') if len(nm) > 0]
+    elif key == '-recover':
+      if val not in ['y', 'n']: badparms('invalid recover')
+      recover = val == 'y'
+    elif key == '-profLog': profLog = val
     else: badparms('unknown key: "%s"' % (key,))
 
   if bugLev == None: badparms('parm not specified: -bugLev')
@@ -107,7 +145,11 @@ def main():
 
   ##np.set_printoptions( threshold=10000)
 
-  resObj = parseDir( bugLev, readType, inDir, maxLev)
+  prof = None
+  if profLog != None: prof = phaseProfile.PhaseProfile( bugLev, profLog)
+  resObj = parseDir( bugLev, readType, inDir, maxLev,
+    getTraj=getTraj, dosMode=dosMode, sections=sections, recover=recover,
+    prof=prof)
 
   print '\nmain: resObj:\n%s' % (resObj,)
 
@@ -119,11 +161,12 @@ def main():
   print 'import datetime'
   print 'import numpy as np'
   print ''
-  keys = resObj.__dict__.keys()
+  fieldMap = resObj.getFieldMap()
+  keys = fieldMap.keys()
   keys.sort()
   msg = ''
   for key in keys:
-    val = resObj.__dict__[key]
+    val = fieldMap[key]
     stg = repr(val)
     if type(val).__name__ == 'ndarray':
       print ''
@@ -146,7 +189,13 @@ def parseDir(
   bugLev,
   readType,
   inDir,
-  maxLev):
+  maxLev,
+  getTraj=False,
+  dosMode='all',
+  sections=None,
+  recover=False,
+  prof=None,
+  lazy=False):
   '''
   Extracts info from the output of a VASP run.
 
@@ -154,10 +203,38 @@ def parseDir(
 
   * bugLev (int): Debug level.  Normally 0.
   * readType (str): If 'outcar', read the OUTCAR file.
+    Else if 'outcarStream', read the OUTCAR file in one pass,
+    keeping only the last ionic step.
     Else if 'xml', read the vasprun.xml file.
+    Else if 'xmlStream', read the vasprun.xml file incrementally,
+    keeping only the last calculation.
   * inDir (str): Input directory containing OUTCAR
     and/or vasprun.xml.
   * max (int) Max number of levels to print for xml
+  * getTraj (boolean): If True, also get the ionic trajectory,
+    in the traj* attributes.  See :class:`ScanXml.TrajBuilder`.
+    Only for readType 'xml' and 'xmlStream'.
+  * dosMode (str): 'all', 'total' or 'none': which density of
+    states to get.  See :func:`ScanXml.getDos`.
+    Ignored except for readType 'xml' and 'xmlStream'.
+  * sections (list of str): the sections to get, or None for
+    the default.  See :func:`ScanXml.parseXml`.
+    Ignored except for readType 'xml' and 'xmlStream'.
+  * recover (boolean): If True, read a truncated vasprun.xml up to
+    the last complete calculation, setting resObj.isTruncated.
+    See :func:`ScanXml.parseXml`.
+    Ignored except for readType 'xml' and 'xmlStream'.
+  * prof (phaseProfile.PhaseProfile): If not None, record the time
+    and memory of each parse phase.  Unless the caller has begun
+    a record, we begin and end one, setting resObj.phaseProfile.
+    See :class:`phaseProfile.PhaseProfile`.
+  * lazy (boolean): If True, return a :class:`ScanOutcar.LazyResClass`,
+    whose OUTCAR attributes are extracted when first read,
+    so callers needing only a few fields skip the rest.
+    Errors in the extraction are raised when the attribute is read,
+    and are not caught here.  The phase times cover only the
+    extraction done before we return.
+    Only for readType 'outcar' and 'outcarStream'.
 
   **Returns**:
 
@@ -167,20 +244,37 @@ def parseDir(
   if not os.path.isdir(inDir):
     throwerr('inDir is not a dir: "%s"' % (inDir,))
 
-  resObj = ResClass()
+  if lazy: resObj = ScanOutcar.LazyResClass()
+  else: resObj = ResClass()
   resObj.excMsg = None
   resObj.excTrace = None
 
+  ownProf = prof != None and not prof.active
+  if ownProf: prof.begin( inDir, readType)
+
   try:
-    if readType == 'xml':
+    if getTraj and readType not in [ 'xml', 'xmlStream']:
+      throwerr('getTraj requires readType xml or xmlStream')
+    if lazy and readType not in [ 'outcar', 'outcarStream']:
+      throwerr('lazy requires readType outcar or outcarStream')
+    if readType in [ 'xml', 'xmlStream']:
       inFile = os.path.join( inDir, 'vasprun.xml')
       if not os.path.isfile(inFile):
         throwerr('inFile is not a file: "%s"' % (inFile,))
-      ScanXml.parseXml( bugLev, inFile, maxLev, resObj)   # fills resObj
-    elif readType in [ 'outcar', 'pylada']:
+      if readType == 'xml': readMode = 'tree'
+      else: readMode = 'stream'
+      ScanXml.parseXml(                       # fills resObj
+        bugLev, inFile, maxLev, resObj, readMode=readMode, getTraj=getTraj,
+        dosMode=dosMode, sections=sections, recover=recover, prof=prof)
+    elif readType in [ 'outcar', 'outcarStream', 'pylada']:
       if readType == 'outcar':
-        scanner = ScanOutcar.ScanOutcar( bugLev, inDir, resObj)  # fills resObj
+        scanner = ScanOutcar.ScanOutcar(        # fills resObj
+          bugLev, inDir, resObj, lazy=lazy, prof=prof)
+      elif readType == 'outcarStream':
+        scanner = ScanOutcar.ScanOutcar(        # fills resObj
+          bugLev, inDir, resObj, readMode='stream', lazy=lazy, prof=prof)
       else:    # else 'pylada'
+        if prof != None: prof.mark('pylada')
         parsePylada( bugLev, inFile, resObj)   # fills resObj
     else: throwerr('unknown readType: %s' % (readType,))
 
@@ -194,6 +288,7 @@ def parseDir(
     print resObj.excTrace
     print '===== traceback end ====='
 
+  if ownProf: prof.end( resObj)
   return resObj
 
 #====================================================================
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# Copyright 2013 National Renewable Energy Laboratory, Golden CO, USA
+# This file is part of NREL MatDB.
+#
+# NREL MatDB is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NREL MatDB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NREL MatDB.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+
+#====================================================================
+
+# The fields of ResClass, the results of readVasp.parseDir,
+# ScanXml.parseXml and ScanOutcar.ScanOutcar:
+#   (attribute name, dtype, dbCol)
+# dtype is the numpy dtype the field is stored as, for the array
+# fields, or None for scalars, strings, lists and maps.
+# dbCol is the column of the model table that fillDbVasp.fillRow
+# inserts the field into, or None.  numAtom is None because
+# fillRow computes it from typeNums.
+
+resFields = [
+  # Errors, set by readVasp.parseDir
+  ('excMsg',                 None,          'excMsg'),
+  ('excTrace',               None,          'excTrace'),
+
+  # Run info and parameters
+  ('runDate',                None,          'runDate'),
+  ('iterTotalTime',          None,          'iterTotalTime'),
+  ('systemName',             None,          'systemName'),
+  ('encut_ev',               None,          'encut_ev'),
+  ('ibrion',                 None,          'ibrion'),
+  ('isif',                   None,          'isif'),
+  ('algo',                   None,          None),
+  ('ediff',                  None,          None),
+  ('generalName',            None,          None),
+  ('ialgo',                  None,          None),
+  ('icharg',                 None,          None),
+  ('isDft',                  None,          None),
+  ('isGw',                   None,          None),
+  ('ldauType',               None,          None),
+  ('numElectron',            None,          None),
+  ('numSpin',                None,          None),
+  ('iterCpuTimes',           None,          None),
+  ('iterRealTimes',          None,          None),
+  ('elapsedTimeSec',         None,          None),
+  ('systemTimeSec',          None,          None),
+  ('totalCpuTimeSec',        None,          None),
+  ('userTimeSec',            None,          None),
+  ('incarTags',              None,          None),   # ScanOutcar: INCAR
+                                                     # tag -> value string
+
+  # Atom types and atoms, sorted by type name
+  ('typeNames',              None,          'typeNames'),
+  ('typeNums',               None,          'typeNums'),
+  ('typeMasses_amu',         None,          'typeMasses_amu'),
+  ('typePseudos',            None,          'typePseudos'),
+  ('typeValences',           None,          'typeValences'),
+  ('atomNames',              None,          'atomNames'),
+  ('atomMasses_amu',         None,          'atomMasses_amu'),
+  ('atomPseudos',            None,          'atomPseudos'),
+  ('atomValences',           None,          'atomValences'),
+  ('atomTypes',              None,          None),
+  ('numAtom',                None,          None),
+  ('totalValence',           None,          None),
+
+  # Initial and final structures
+  ('initialBasisMat',        float,         'initialBasisMat'),
+  ('initialRecipBasisMat',   float,         'initialRecipBasisMat'),
+  ('initialCartPosMat',      float,         'initialCartPosMat'),
+  ('initialFracPosMat',      float,         'initialFracPosMat'),
+  ('finalBasisMat',          float,         'finalBasisMat'),
+  ('finalRecipBasisMat',     float,         'finalRecipBasisMat'),
+  ('finalCartPosMat',        float,         'finalCartPosMat'),
+  ('finalFracPosMat',        float,         'finalFracPosMat'),
+  ('finalVolume_ang3',       None,          'finalVolume_ang3'),
+  ('finalDensity_g_cm3',     None,          'finalDensity_g_cm3'),
+  ('finalVolumeCalc_ang3',   None,          None),
+  ('posScaleFactor',         None,          None),
+  ('recipVolume',            None,          None),
+
+  # Final forces and stress
+  ('finalForceMat_ev_ang',   float,         'finalForceMat_ev_ang'),
+  ('finalStressMat_kbar',    float,         'finalStressMat_kbar'),
+  ('finalPressure_kbar',     None,          'finalPressure_kbar'),
+  ('finalStressMat_ev',      float,         None),
+  ('magnetizationMat',       float,         None),
+  ('partialChargeMat',       float,         None),
+
+  # Eigenvalues, energy and band edges
+  ('eigenMat',               float,         'eigenMat'),
+  ('energyNoEntrp',          None,          'energyNoEntrp'),
+  ('efermi0',                None,          'efermi0'),
+  ('cbMin',                  None,          'cbMin'),
+  ('vbMax',                  None,          'vbMax'),
+  ('bandgap',                None,          'bandgap'),
+  ('occupMat',               float,         None),
+  ('numBand',                None,          None),
+  ('efermi',                 None,          None),
+  ('efermiCalc',             None,          None),
+  ('bandgapa',               None,          None),
+  ('bandgaps',               None,          None),
+  ('bandgapDirects',         None,          None),
+  ('bandgapIndirects',       None,          None),
+  ('cbms',                   None,          None),
+  ('vbms',                   None,          None),
+  ('cbmKpis',                None,          None),
+  ('vbmKpis',                None,          None),
+  ('cbMinIxs',               int,           None),
+  ('cbMinVals',              float,         None),
+  ('vbMaxIxs',               int,           None),
+  ('vbMaxVals',              float,         None),
+
+  # Kpoints
+  ('numKpoint',              None,          None),
+  ('kpointFracMat',          float,         None),
+  ('kpointCartMat',          float,         None),
+  ('kpointWeights',          float,         None),
+  ('kpointMults',            float,         None),
+
+  # Density of states.  See ScanXml.getDos.
+  ('dosTotalMat',            np.float32,    None),
+  ('dosTotalFields',         None,          None),
+  ('dosPartialMat',          np.float32,    None),
+  ('dosPartialFields',       None,          None),
+
+  # Ionic trajectory.  See ScanXml.TrajBuilder.
+  ('trajNumStep',            None,          None),
+  ('trajBasisMats',          float,         None),
+  ('trajFracPosMats',        float,         None),
+  ('trajForceMats_ev_ang',   float,         None),
+  ('trajStressMats_kbar',    float,         None),
+  ('trajFreeEnergies',       float,         None),
+  ('trajEnergyNoEntrps',     float,         None),
+  ('trajEnergySigma0s',      float,         None),
+  ('trajNumElecSteps',       int,           None),
+
+  # Truncated files.  See ScanXml.parseXml.
+  ('isTruncated',            None,          None),
+  ('lostSections',           None,          None),
+
+  # Phase timing, if profiled.  See phaseProfile.PhaseProfile.
+  ('phaseProfile',           None,          None),
+]
+
+# Map: field name -> dtype, for the array fields.
+fieldDtypes = dict( [(name, dtype) for (name, dtype, dbCol) in resFields
+  if dtype != None])
+
+# The fields inserted by fillDbVasp.fillRow: (attribute name, dbCol).
+dbFields = [(name, dbCol) for (name, dtype, dbCol) in resFields
+  if dbCol != None]
+
+#====================================================================
+
+class ResClass( object):
+  '''
+  A compact data container for parse results, with one
+  slot per field in :data:`resFields`.
+
+  Fields are set as attributes.  A field that has not been set
+  raises AttributeError when read, so ``getattr( resObj, name, None)``
+  works as before.  The array fields are stored as numpy arrays
+  of the declared dtype.
+
+  There is no instance ``__dict__``, so setting an attribute
+  not in resFields raises AttributeError.  The INCAR tags that
+  ScanOutcar reads are kept in the one field incarTags, a map.
+  '''
+
+  __slots__ = [name for (name, dtype, dbCol) in resFields]
+
+  def __setattr__( self, name, val):
+    dtype = fieldDtypes.get( name)
+    if dtype != None and val is not None: val = np.asarray( val, dtype=dtype)
+    object.__setattr__( self, name, val)
+
+  def hasField( self, name):
+    '''
+    Returns True if the attribute name is set.
+    Unlike hasattr, never calls __getattr__, as in
+    :class:`ScanOutcar.LazyResClass`.
+    '''
+    try: object.__getattribute__( self, name)
+    except AttributeError: return False
+    return True
+
+  def getFieldMap( self):
+    '''
+    Returns a new map of all the attributes that are set:
+    name -> value.
+    '''
+    fieldMap = {}
+    for (name, dtype, dbCol) in resFields:
+      if self.hasField( name): fieldMap[name] = getattr( self, name)
+    return fieldMap
+
+  # Pickle the set attributes only, for every protocol.
+  def __getstate__( self):
+    return self.getFieldMap()
+
+  def __setstate__( self, state):
+    for (name, val) in state.items():
+      object.__setattr__( self, name, val)
+
+  def __str__(self):
+    fieldMap = self.getFieldMap()
+    keys = fieldMap.keys()
+    keys.sort()
+    msg = ''
+    for key in keys:
+      val = fieldMap[key]
+      stg = str( val)
+      if stg.find('\n') >= 0: sep = '\n'
+      else: sep = ' '
+      msg += '  %s:  type: %s  val:%s%s\n' % (key, type(val), sep, val,)
+    return msg
+
+#====================================================================
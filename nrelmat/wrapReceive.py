@@ -97,6 +97,9 @@ def main():
       fillDbVasp.py -func createTableContrib -deleteTable true
       wrapReceive.py -func redoArch
 
+    With **parsecachedir** in the inSpec file, the VASP output
+    that has not changed since the last run is not parsed again.
+
   **inSpec File Parameters:**
 
   ===================    ==============================================
@@ -110,6 +113,16 @@ def main():
   **dbschema**           Database schema name.
   **dbtablemodel**       Database name of the "model" table.
   **dbtablecontrib**     Database name of the "contrib" table.
+  **parsecachedir**      Optional.  Directory of the cache of parsed
+                         VASP output, keyed by file hash, so reprocessing
+                         does not parse unchanged files again.
+                         See :class:`parseCache.ParseCache`.
+  **parsecachemb**       Optional.  Max size of the parse cache, MB.
+                         Default 10000.
+  **parseproflog**       Optional.  JSON lines file to append the time
+                         and memory of each phase of each row to:
+                         hashing, parsing, and the DB insert.
+                         See :class:`phaseProfile.PhaseProfile`.
   ===================    ==============================================
 
   **inSpec file example:**::
@@ -228,13 +241,13 @@ def main():
           processTree( bugLev, useCommit, allowExc, subDir, wrapId, inSpec)
         except Exception, exc:
           excStg = repr( exc)
-          wrapUpload.logit('caught: %s' % (excStgs,))
+          wrapUpload.logit('caught: %s' % (excStg,))
           wrapUpload.logit(traceback.format_exc( limit=None))
 
-        if excStgs == None:
+        if excStg == None:
           wrapUpload.logit('archived %s' % (wrapId,))
         else:
-          wrapUpload.logit('error for %s: %s' % (wrapId, excStgs,))
+          wrapUpload.logit('error for %s: %s' % (wrapId, excStg,))
           if not allowExc: throwerr( excStg)
 
   else: badparms('invalid func')